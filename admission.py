@@ -0,0 +1,319 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+import deadlines
+import metrics
+
+# In-flight LLM attempts per worker process, in total and per model. Free
+# OpenRouter models rate-limit per key, so a burst beyond these waits here
+# instead of turning into a storm of 429s
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_CONCURRENCY_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "4"))
+# Proxied YouTube requests (transcript fetches and listings) per worker process
+YOUTUBE_MAX_CONCURRENCY = int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "16"))
+# Requests that may wait for a slot, per pool; once the queue is full new
+# ones are turned away with 503 straight away
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+# Longest a request waits for a slot before giving up with 503 (the request's
+# deadline may cut it shorter)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "20"))
+
+# Per-client token bucket: requests per minute, and how many can be made in a
+# burst. 0 disables rate limiting
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "30"))
+# Clients are told apart by this request header when set (e.g. X-API-Key, for
+# keys checked by a gateway in front of the API), by IP address otherwise
+RATE_LIMIT_KEY_HEADER = os.getenv("RATE_LIMIT_KEY_HEADER", "")
+# Trusted proxies in front of the app that append to X-Forwarded-For. The
+# client IP is taken that many entries from the right. 0 (the default) uses
+# the connection's address and ignores the header, which clients can set to
+# anything; set it to 1 behind Railway's edge
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+# Clients whose buckets are kept per worker process (least recently seen are dropped)
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Paths never rate limited ("/" exactly, the others as prefixes)
+RATE_LIMIT_EXEMPT_PATHS = [
+    path.strip() for path in os.getenv("RATE_LIMIT_EXEMPT_PATHS", "/,/metrics,/admin").split(",") if path.strip()
+]
+
+# Weight of the newest sample in the slot hold time average used for Retry-After
+HOLD_TIME_ALPHA = 0.2
+
+
+class Overloaded(HTTPException):
+    """503 for a request turned away because a pool's queue is full or its wait ran out"""
+
+    def __init__(self, pool: str, reason: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Server is busy ({pool} capacity: {reason.replace('_', ' ')}). Please retry in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+class ConcurrencyLimiter:
+    """
+    Caps in-flight work in one pool, overall and per key (e.g. per model),
+    with a bounded FIFO queue in front.
+
+    A request that finds a free slot takes it straight away. Otherwise it
+    waits in the queue, up to ADMISSION_QUEUE_TIMEOUT seconds or what is
+    left of its deadline. Released slots are handed to the oldest waiter
+    whose key has room, so a backlog on one model doesn't hold up the
+    others. With the queue full, acquire() raises Overloaded at once.
+    """
+
+    def __init__(self, pool: str, limit: int, per_key_limit: Optional[int] = None,
+                 queue_size: int = ADMISSION_QUEUE_SIZE, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.pool = pool
+        self.limit = limit
+        self.per_key_limit = per_key_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.active_by_key: Dict[str, int] = {}
+        self.waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+        self.hold_ewma: Optional[float] = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    def _has_room(self, key: str) -> bool:
+        if self.limit > 0 and self.active >= self.limit:
+            return False
+        return not self.per_key_limit or self.active_by_key.get(key, 0) < self.per_key_limit
+
+    def _take(self, key: str):
+        self.active += 1
+        self.active_by_key[key] = self.active_by_key.get(key, 0) + 1
+        metrics.gauge_add("admission_in_flight", 1, pool=self.pool)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained enough to take one more request"""
+        hold = self.hold_ewma if self.hold_ewma is not None else 1.0
+        slots = self.limit if self.limit > 0 else max(self.active, 1)
+        return min(max(math.ceil(hold * (len(self.waiters) + 1) / slots), 1), 60)
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.rejected[reason] += 1
+        metrics.inc("admission_rejections_total", pool=self.pool, reason=reason)
+        return Overloaded(self.pool, reason, self.retry_after())
+
+    async def acquire(self, key: str = "") -> float:
+        """Wait for a slot for key; returns the time it was granted (pass it to release())"""
+        started = time.perf_counter()
+        # Waiters still queued while there is room are all held back by their own key's limit
+        if self._has_room(key):
+            self._take(key)
+        else:
+            if len(self.waiters) >= self.queue_size:
+                raise self._reject("queue_full")
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append((key, future))
+            self.queued += 1
+            metrics.gauge_add("admission_queued", 1, pool=self.pool)
+            try:
+                timeout = self.queue_timeout
+                left = deadlines.remaining()
+                if left is not None:
+                    timeout = min(timeout, left)
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                self._abandon(key, future)
+                if deadlines.expired():
+                    raise deadlines.exceeded(f"{self.pool}_queue")
+                raise self._reject("queue_timeout")
+            except asyncio.CancelledError:
+                self._abandon(key, future)
+                raise
+            finally:
+                metrics.gauge_add("admission_queued", -1, pool=self.pool)
+
+        self.admitted += 1
+        granted = time.perf_counter()
+        metrics.observe("admission_queue_wait_seconds", granted - started, pool=self.pool)
+        return granted
+
+    def _abandon(self, key: str, future: asyncio.Future):
+        """Leave the queue; a slot granted in the meantime is passed on"""
+        try:
+            self.waiters.remove((key, future))
+        except ValueError:
+            pass
+        if future.done() and not future.cancelled():
+            self._give_back(key)
+        else:
+            future.cancel()
+
+    def release(self, key: str, granted: float):
+        held = time.perf_counter() - granted
+        self.hold_ewma = held if self.hold_ewma is None else self.hold_ewma + HOLD_TIME_ALPHA * (held - self.hold_ewma)
+        self._give_back(key)
+
+    def _give_back(self, key: str):
+        self.active -= 1
+        self.active_by_key[key] -= 1
+        if not self.active_by_key[key]:
+            del self.active_by_key[key]
+        metrics.gauge_add("admission_in_flight", -1, pool=self.pool)
+        self._wake()
+
+    def _wake(self):
+        """Hand free slots to the oldest waiters that can use them"""
+        for key, future in list(self.waiters):
+            if self.limit > 0 and self.active >= self.limit:
+                return
+            if future.done() or not self._has_room(key):
+                continue
+            self.waiters.remove((key, future))
+            self._take(key)
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, key: str = ""):
+        granted = await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key, granted)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "per_key_limit": self.per_key_limit,
+            "in_flight": self.active,
+            "in_flight_by_key": dict(sorted(self.active_by_key.items())),
+            "queued": len(self.waiters),
+            "queue_size": self.queue_size,
+            "queue_timeout": self.queue_timeout,
+            "admitted": self.admitted,
+            "waited": self.queued,
+            "rejected": dict(self.rejected),
+            "avg_hold_seconds": round(self.hold_ewma, 3) if self.hold_ewma is not None else None,
+            "retry_after": self.retry_after()
+        }
+
+
+class RateLimiter:
+    """
+    Token bucket per client: each request spends one token, and tokens come
+    back at RATE_LIMIT_PER_MINUTE up to RATE_LIMIT_BURST. Buckets live in
+    each worker process, so with several workers a client can get up to
+    that many times the configured rate.
+    """
+
+    def __init__(self, per_minute: float = RATE_LIMIT_PER_MINUTE, burst: float = RATE_LIMIT_BURST,
+                 max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, client: str) -> Tuple[bool, float]:
+        """Spend a token for client; returns (allowed, seconds until the next token)"""
+        now = time.monotonic()
+        bucket = self._buckets.pop(client, None)
+        if bucket is None:
+            bucket = [self.burst, now]
+            if len(self._buckets) >= self.max_clients:
+                self._buckets.popitem(last=False)
+        tokens = min(bucket[0] + (now - bucket[1]) * self.rate, self.burst)
+        allowed = tokens >= 1
+        bucket[:] = [tokens - 1 if allowed else tokens, now]
+        self._buckets[client] = bucket
+        if allowed:
+            self.allowed += 1
+            return True, 0.0
+        self.limited += 1
+        return False, (1 - tokens) / self.rate
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "per_minute": round(self.rate * 60, 3),
+            "burst": self.burst,
+            "key_header": RATE_LIMIT_KEY_HEADER or None,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited
+        }
+
+
+def client_id(scope) -> str:
+    """The rate limit key for a request: its RATE_LIMIT_KEY_HEADER value, or its IP"""
+    headers = dict(scope.get("headers", []))
+    if RATE_LIMIT_KEY_HEADER:
+        key = headers.get(RATE_LIMIT_KEY_HEADER.lower().encode())
+        if key:
+            return "key:" + key.decode("latin-1")
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        forwarded = headers.get(b"x-forwarded-for")
+        if forwarded:
+            addresses = [address.strip() for address in forwarded.decode("latin-1").split(",")]
+            return "ip:" + addresses[max(len(addresses) - RATE_LIMIT_PROXY_HOPS, 0)]
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def _exempt(path: str) -> bool:
+    return any(path == prefix if prefix == "/" else path.startswith(prefix) for prefix in RATE_LIMIT_EXEMPT_PATHS)
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware turning away clients over their token bucket with 429
+    and a Retry-After header, before any work is done for the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not rate_limiter.enabled or _exempt(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        allowed, wait = rate_limiter.take(client_id(scope))
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        metrics.inc("admission_rejections_total", pool="client", reason="rate_limited")
+        retry_after = max(math.ceil(wait), 1)
+        body = json.dumps({
+            "detail": f"Rate limit exceeded ({rate_limiter.rate * 60:g} requests per minute). Retry in {retry_after}s."
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+llm = ConcurrencyLimiter("llm", LLM_MAX_CONCURRENCY, LLM_MAX_CONCURRENCY_PER_MODEL)
+youtube = ConcurrencyLimiter("youtube", YOUTUBE_MAX_CONCURRENCY)
+rate_limiter = RateLimiter()
+
+
+def admission_stats() -> dict:
+    return {"llm": llm.stats(), "youtube": youtube.stats(), "rate_limit": rate_limiter.stats()}
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import HTTPException
+from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
+
+import deadlines
+from formatters import TRANSCRIPT_FORMATS
+from transcripts import fetch_transcript
+
+# Videos fetched at once per batch request unless the request asks for fewer
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Upper bound for the per-request concurrency (each fetch holds a threadpool worker)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+# Largest number of video IDs accepted in one request
+BATCH_MAX_VIDEOS = int(os.getenv("BATCH_MAX_VIDEOS", "500"))
+
+
+def describe_error(error: Exception, languages: str) -> Tuple[int, str]:
+    """Map a transcript fetch error to the (status code, detail) /transcript/{video_id} would return"""
+    if isinstance(error, TranscriptsDisabled):
+        return 404, "Transcripts are disabled for this video"
+    if isinstance(error, NoTranscriptFound):
+        return 404, f"No transcript found for languages: {languages}"
+    if isinstance(error, VideoUnavailable):
+        return 404, "Video not found or unavailable"
+    if isinstance(error, HTTPException):
+        # e.g. DeadlineExceeded once the video's deadline has run out
+        return error.status_code, error.detail
+    return 500, f"Error fetching transcript: {str(error)}"
+
+
+def render(transcript, format: str):
+    """Render a transcript for one batch line: raw cues for json, a string otherwise"""
+    if format == "json":
+        return transcript.to_raw_data()
+    formatter, _ = TRANSCRIPT_FORMATS[format]
+    return "".join(formatter(transcript))
+
+
+async def fetch_batch(
+    video_ids: List[str],
+    languages: str,
+    format: str,
+    concurrency: int = BATCH_CONCURRENCY
+) -> AsyncIterator[dict]:
+    """
+    Fetch transcripts concurrently and yield one result dict per video as
+    soon as it completes, followed by a final summary dict.
+
+    Failures are yielded inline with their status code instead of aborting
+    the batch. Each result carries its position in the request ('index'),
+    the time spent waiting for a concurrency slot ('queued_ms') and the
+    time spent fetching ('elapsed_ms').
+    """
+    language_list = [lang.strip() for lang in languages.split(",")]
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async def fetch_one(index: int, video_id: str) -> dict:
+        submitted = time.perf_counter()
+        async with semaphore:
+            fetch_started = time.perf_counter()
+            timing = {"queued_ms": round((fetch_started - submitted) * 1000, 1)}
+            try:
+                with deadlines.item():
+                    transcript = await fetch_transcript(video_id, language_list)
+                result = {
+                    "index": index,
+                    "video_id": video_id,
+                    "status": "ok",
+                    "language": transcript.language,
+                    "language_code": transcript.language_code,
+                    "is_generated": transcript.is_generated,
+                    "transcript": render(transcript, format)
+                }
+            except Exception as e:
+                status_code, detail = describe_error(e, languages)
+                result = {
+                    "index": index,
+                    "video_id": video_id,
+                    "status": "error",
+                    "status_code": status_code,
+                    "error": type(e).__name__,
+                    "detail": detail
+                }
+            timing["elapsed_ms"] = round((time.perf_counter() - fetch_started) * 1000, 1)
+            return {**result, **timing}
+
+    tasks = [asyncio.ensure_future(fetch_one(i, video_id)) for i, video_id in enumerate(video_ids)]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            succeeded += result["status"] == "ok"
+            yield result
+    finally:
+        # Client went away mid-batch: don't keep fetching for nobody
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "summary": {
+            "total": len(video_ids),
+            "succeeded": succeeded,
+            "failed": len(video_ids) - succeeded,
+            "concurrency": concurrency,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
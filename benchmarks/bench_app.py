@@ -0,0 +1,20 @@
+"""
+ASGI entry point for load tests: the real app, with YouTube transcript
+fetches served by stand_ins.FakeTranscriptApi (through the proxy pool).
+
+    hypercorn benchmarks.bench_app:app
+
+OpenRouter and the YouTube Data API are redirected with OPENROUTER_BASE_URL
+and YOUTUBE_API_BASE_URL (load_test.py sets both).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.stand_ins import FakeTranscriptApi  # noqa: E402
+from proxy_pool import pool  # noqa: E402
+
+pool.client_factory = lambda slot: FakeTranscriptApi()
+
+from main import app  # noqa: E402,F401
@@ -0,0 +1,144 @@
+"""
+Transcript formatter micro-benchmark.
+
+Builds a synthetic transcript (50k cues by default, roughly a 35-hour
+auto-caption track) and measures, for every output format:
+
+  - throughput in cues/s and MB/s while consuming the streamed chunks
+  - peak traced memory (tracemalloc) while producing the output
+
+The streaming formatters are compared with the previous list-and-join
+implementations (timedelta-based timestamps) for text, srt and vtt.
+
+Usage:
+    python benchmarks/formatters.py --cues 50000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from youtube_transcript_api._transcripts import FetchedTranscriptSnippet
+
+from formatters import TRANSCRIPT_FORMATS, chunked
+from packed_transcript import PackedTranscript
+
+
+def make_snippets(count: int):
+    random.seed(42)
+    words = "the a of to and in that it is was for on are with as I his they be at one have this from".split()
+    snippets = []
+    start = 0.0
+    for _ in range(count):
+        duration = round(random.uniform(1.5, 4.0), 3)
+        text = " ".join(random.choice(words) for _ in range(random.randint(4, 12)))
+        snippets.append(FetchedTranscriptSnippet(text=text, start=round(start, 3), duration=duration))
+        start += duration
+    return snippets
+
+
+# Previous implementations, kept here as the baseline
+
+def legacy_timestamp(seconds):
+    td = timedelta(seconds=seconds)
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    secs = total_seconds % 60
+    if hours > 0:
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def legacy_subtitle_timestamp(seconds, sep):
+    td = timedelta(seconds=seconds)
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    secs = total_seconds % 60
+    millis = int((seconds - int(seconds)) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{sep}{millis:03d}"
+
+
+def legacy_text(data):
+    return "\n".join(f"[{legacy_timestamp(e['start'])}] {e['text']}" for e in data)
+
+
+def legacy_srt(data):
+    lines = []
+    for i, e in enumerate(data, start=1):
+        lines.append(f"{i}")
+        lines.append(f"{legacy_subtitle_timestamp(e['start'], ',')} --> {legacy_subtitle_timestamp(e['start'] + e['duration'], ',')}")
+        lines.append(e['text'])
+        lines.append("")
+    return "\n".join(lines)
+
+
+def legacy_vtt(data):
+    lines = ["WEBVTT", ""]
+    for e in data:
+        lines.append(f"{legacy_subtitle_timestamp(e['start'], '.')} --> {legacy_subtitle_timestamp(e['start'] + e['duration'], '.')}")
+        lines.append(e['text'])
+        lines.append("")
+    return "\n".join(lines)
+
+
+LEGACY = {"text": legacy_text, "srt": legacy_srt, "vtt": legacy_vtt}
+
+
+def measure(produce, cue_count: int) -> dict:
+    """
+    Run produce() -> iterable of str chunks, consuming and discarding them.
+
+    Timing and memory are measured in separate passes because tracemalloc
+    slows allocation-heavy code down considerably.
+    """
+    started = time.perf_counter()
+    total_bytes = 0
+    for chunk in produce():
+        total_bytes += len(chunk)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for chunk in produce():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "elapsed_s": round(elapsed, 4),
+        "cues_per_s": round(cue_count / elapsed),
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 1),
+        "output_mb": round(total_bytes / 1e6, 2),
+        "peak_mem_mb": round(peak / 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cues", type=int, default=50000)
+    args = parser.parse_args()
+
+    snippets = make_snippets(args.cues)
+    raw = [{"text": s.text, "start": s.start, "duration": s.duration} for s in snippets]
+    transcript = PackedTranscript.from_snippets(snippets, "bench", "English", "en", True)
+
+    for name, (formatter, _) in TRANSCRIPT_FORMATS.items():
+        result = measure(lambda: chunked(formatter(transcript)), args.cues)
+        print(json.dumps({"format": name, "impl": "streaming", "cues": args.cues, **result}))
+
+        if name in LEGACY:
+            # The legacy path also materialized to_raw_data() dicts; that cost is excluded here
+            legacy = LEGACY[name]
+            result = measure(lambda: [legacy(raw)], args.cues)
+            print(json.dumps({"format": name, "impl": "legacy", "cues": args.cues, **result}))
+
+
+if __name__ == "__main__":
+    main()
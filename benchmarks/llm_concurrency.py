@@ -0,0 +1,123 @@
+"""
+Concurrent LLM call throughput: blocking requests vs pooled httpx client.
+
+Starts a local stand-in for OpenRouter that answers every chat completion after
+a fixed delay, then fires N concurrent "handlers" against it two ways:
+
+  blocking - requests.post inside an async function (the old call path), which
+             stalls the event loop for the full upstream latency
+  pooled   - openrouter.post_chat_completion on the shared AsyncClient
+
+While each run is in flight a probe coroutine measures how late the event loop
+wakes it up, which is what a cheap endpoint like / or /patterns would see.
+
+Usage:
+    python benchmarks/llm_concurrency.py --concurrency 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def start_fake_openrouter(latency: float) -> ThreadingHTTPServer:
+    """Serve canned chat completions on a random local port"""
+    body = json.dumps({
+        "choices": [{"message": {"content": "ok"}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11}
+    }).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def probe_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Return the worst observed event loop wake-up delay in seconds"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run(mode: str, base_url: str, concurrency: int) -> dict:
+    import openrouter
+
+    payload = {"model": "bench", "messages": [{"role": "user", "content": "hi"}]}
+
+    async def blocking_call():
+        requests.post(f"{base_url}/chat/completions", json=payload, timeout=60)
+
+    async def pooled_call():
+        await openrouter.post_chat_completion("bench-key", payload, title="bench")
+
+    call = blocking_call if mode == "blocking" else pooled_call
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(stop))
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    worst_lag = await probe
+    await openrouter.close_client()
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(concurrency / elapsed, 1),
+        "max_loop_lag_ms": round(worst_lag * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake upstream latency in seconds")
+    args = parser.parse_args()
+
+    server = start_fake_openrouter(args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["OPENROUTER_BASE_URL"] = base_url
+
+    for mode in ("blocking", "pooled"):
+        print(json.dumps(asyncio.run(run(mode, base_url, args.concurrency))))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+Offline load test: runs the API under hypercorn against local stand-ins for
+YouTube and OpenRouter (see stand_ins.py) and drives its endpoints at a
+fixed concurrency.
+
+Each scenario reports throughput, p50/p95/p99 latency (and time to first
+byte for streams), status counts and the server's memory. Results are
+written as JSON, so runs can be compared across changes:
+
+    python benchmarks/load_test.py --output before.json
+    # ... change something ...
+    python benchmarks/load_test.py --output after.json --compare before.json
+
+Scenarios:
+    transcript         GET  /transcript/{id}
+    summarize          GET  /transcript/{id}/summarize
+    pattern            GET  /transcript/{id}/pattern/{--pattern}
+    chat               POST /transcript/{id}/chat
+    search             GET  /search (YouTube Data API stand-in; --search-enrich adds details/transcripts)
+    transcript_search  GET  /transcripts/search over the transcripts fetched so far
+
+Requests cycle through --videos distinct video IDs, so the first pass pays
+for the (fake) YouTube fetch and later ones hit the transcript cache. LLM
+endpoints send cache=bypass unless --llm-cache use is given, so every
+request reaches the OpenRouter stand-in.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 32 --requests 400
+    python benchmarks/load_test.py --scenarios summarize,chat --stream --rate-limit 0.1
+    python benchmarks/load_test.py --workers 4 --cues 6000 --latency 1.0
+    python benchmarks/load_test.py --scenarios summarize --concurrency 128 --llm-concurrency-per-model 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from benchmarks.stand_ins import FakeUpstream, UpstreamConfig  # noqa: E402
+
+SCENARIOS = ("transcript", "summarize", "pattern", "chat", "search", "transcript_search")
+SEARCH_TERMS = ("python cache", "model training", '"really important"', "worker queue", "latency", "stream token")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(q * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def latency_summary(seconds: List[float]) -> dict:
+    values = sorted(seconds)
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 0.50) * 1000, 2),
+        "p95": round(percentile(values, 0.95) * 1000, 2),
+        "p99": round(percentile(values, 0.99) * 1000, 2),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "max": round(values[-1] * 1000, 2),
+    }
+
+
+def _children(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces - fields after the closing paren are fixed
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _status_kb(pid: int, field: str) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def server_memory_mb(pid: int) -> Dict[str, float]:
+    """Current and peak RSS of the server and its worker processes (Linux /proc)"""
+    if not os.path.isdir("/proc"):
+        return {}
+    pids = [pid] + _children(pid)
+    return {
+        "rss": round(sum(_status_kb(p, "VmRSS") for p in pids) / 1024, 1),
+        "peak_rss": round(sum(_status_kb(p, "VmHWM") for p in pids) / 1024, 1),
+        "processes": len(pids),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, upstream: FakeUpstream, data_dir: str, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENROUTER_BASE_URL": upstream.base_url,
+        "OPENROUTER_API_KEY": "bench-key",
+        "OPENROUTER_TIMEOUT": str(args.openrouter_timeout),
+        "YOUTUBE_API_BASE_URL": upstream.base_url,
+        "YOUTUBE_API_KEY": "bench-key",
+        "BENCH_TRANSCRIPT_CUES": str(args.cues),
+        "BENCH_TRANSCRIPT_LATENCY": str(args.fetch_latency),
+        "BENCH_TRANSCRIPT_FAILURE_RATE": str(args.fetch_failure_rate),
+        "BENCH_TRANSCRIPT_BLOCKED_RATE": str(args.fetch_blocked_rate),
+        # Fresh caches and indexes per run, so results don't depend on earlier runs
+        "TRANSCRIPT_DISK_CACHE_DIR": os.path.join(data_dir, "transcripts"),
+        "LLM_DISK_CACHE_DIR": os.path.join(data_dir, "llm"),
+        "TRANSCRIPT_INDEX_PATH": os.path.join(data_dir, "transcript_index.sqlite3"),
+        "SHARED_CACHE_PATH": os.path.join(data_dir, "shared.sqlite3"),
+        "CHAT_SESSION_DIR": os.path.join(data_dir, "sessions"),
+        "JOBS_DB_PATH": os.path.join(data_dir, "jobs.sqlite3"),
+        "CACHE_BACKEND": args.cache_backend,
+        # All benchmark requests come from one address; per-client limits are off unless asked for
+        "RATE_LIMIT_PER_MINUTE": str(args.client_rate_limit),
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_MAX_CONCURRENCY_PER_MODEL": str(args.llm_concurrency_per_model),
+        "ADMISSION_QUEUE_SIZE": str(args.admission_queue),
+        "METRICS_DIR": os.path.join(data_dir, "metrics"),
+        "PYTHONPATH": ROOT,
+    }
+    command = [
+        sys.executable, "-m", "hypercorn", "benchmarks.bench_app:app",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+    ]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+async def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited: {server.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Server did not become ready in time")
+
+
+def build_request(scenario: str, i: int, args) -> dict:
+    """Method, URL and body for the i-th request of a scenario"""
+    video_id = f"bench-{i % args.videos}"
+    stream = "&stream=true" if args.stream else ""
+    cache = f"&cache={args.llm_cache}"
+    if scenario == "transcript":
+        return {"method": "GET", "url": f"/transcript/{video_id}?format={args.format}"}
+    if scenario == "summarize":
+        return {"method": "GET", "url": f"/transcript/{video_id}/summarize?{cache[1:]}{stream}"}
+    if scenario == "pattern":
+        return {"method": "GET", "url": f"/transcript/{video_id}/pattern/{args.pattern}?{cache[1:]}{stream}"}
+    if scenario == "chat":
+        return {
+            "method": "POST",
+            "url": f"/transcript/{video_id}/chat?retrieval={args.retrieval}{stream}",
+            "json": {"message": f"What does the video say about {SEARCH_TERMS[i % len(SEARCH_TERMS)]}?"}
+        }
+    if scenario == "search":
+        params = {"q": f"benchmark query {i % args.search_queries}", "max_results": 10}
+        if args.search_enrich in ("details", "all"):
+            params["details"] = "true"
+        if args.search_enrich in ("transcripts", "all"):
+            params["transcripts"] = "true"
+        return {"method": "GET", "url": "/search", "params": params}
+    if scenario == "transcript_search":
+        return {"method": "GET", "url": "/transcripts/search", "params": {"q": SEARCH_TERMS[i % len(SEARCH_TERMS)]}}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, args, server_pid: int) -> dict:
+    latencies: List[float] = []
+    first_byte: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    response_bytes = 0
+    next_index = 0
+    memory_before = server_memory_mb(server_pid)
+
+    async def worker():
+        nonlocal next_index, response_bytes
+        while next_index < args.requests:
+            i = next_index
+            next_index += 1
+            request = build_request(scenario, i, args)
+            started = time.perf_counter()
+            try:
+                async with client.stream(**request) as response:
+                    size = 0
+                    async for chunk in response.aiter_raw():
+                        if size == 0:
+                            first_byte.append(time.perf_counter() - started)
+                        size += len(chunk)
+                latencies.append(time.perf_counter() - started)
+                response_bytes += size
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    completed = len(latencies)
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    result = {
+        "scenario": scenario,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "completed": completed,
+        "ok": ok,
+        "statuses": statuses,
+        "client_errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "ok_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "response_kb": round(response_bytes / 1024, 1),
+        "memory_mb": {"before": memory_before, "after": server_memory_mb(server_pid)},
+    }
+    if args.stream and scenario in ("summarize", "pattern", "chat"):
+        result["first_byte_ms"] = latency_summary(first_byte)
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    upstream = FakeUpstream(UpstreamConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit_ratio=args.rate_limit,
+        server_error_ratio=args.server_errors,
+        timeout_ratio=args.timeouts,
+        hang_seconds=args.openrouter_timeout * 3,
+        seed=args.seed,
+    )).start()
+    data_dir = tempfile.mkdtemp(prefix="fastapi-bench-")
+    port = free_port()
+    server = start_server(args, upstream, data_dir, port)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_until_ready(base_url, server)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        timeout = httpx.Timeout(args.request_timeout)
+        results = []
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+            for scenario in args.scenarios:
+                result = await run_scenario(client, scenario, args, server.pid)
+                results.append(result)
+                print(
+                    f"{scenario:18} {result['throughput_rps']:8.1f} req/s  "
+                    f"p50 {result['latency_ms'].get('p50', 0):8.1f} ms  "
+                    f"p95 {result['latency_ms'].get('p95', 0):8.1f} ms  "
+                    f"p99 {result['latency_ms'].get('p99', 0):8.1f} ms  "
+                    f"rss {result['memory_mb']['after'].get('rss', 0):7.1f} MB  "
+                    f"statuses {result['statuses']}",
+                    file=sys.stderr
+                )
+            server_caches = (await client.get("/admin/cache")).json()
+            server_admission = (await client.get("/admin/admission")).json()
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        upstream.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "compare")
+        },
+        "upstream_counts": upstream.counts,
+        "scenarios": results,
+        "server_caches": server_caches,
+        "server_admission": server_admission,
+    }
+
+
+def compare(current: dict, baseline: dict) -> List[dict]:
+    """Per-scenario change in throughput and latency percentiles against a baseline run"""
+    previous = {result["scenario"]: result for result in baseline.get("scenarios", [])}
+    rows = []
+    for result in current["scenarios"]:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        row = {"scenario": result["scenario"]}
+        for key in ("throughput_rps",):
+            row[key] = {"before": before[key], "after": result[key]}
+        for key in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"].get(key), result["latency_ms"].get(key)
+            if old and new:
+                row[key] = {"before": old, "after": new, "change_pct": round((new - old) / old * 100, 1)}
+        rows.append(row)
+    return rows
+
+
+def build_parser(description: str = __doc__) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run, in order")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--workers", type=int, default=1, help="hypercorn worker processes")
+    parser.add_argument("--cache-backend", default="sqlite", choices=("sqlite", "files"), help="CACHE_BACKEND for the server")
+    parser.add_argument("--videos", type=int, default=20, help="Distinct video IDs to cycle through")
+    parser.add_argument("--format", default="json", help="Format for the transcript scenario")
+    parser.add_argument("--pattern", default="extract_wisdom", help="Pattern for the pattern scenario")
+    parser.add_argument("--stream", action="store_true", help="Use stream=true on summarize, pattern and chat")
+    parser.add_argument("--llm-cache", default="bypass", choices=("use", "refresh", "bypass"))
+    parser.add_argument("--search-queries", type=int, default=50, help="Distinct queries the search scenario cycles through")
+    parser.add_argument("--search-enrich", default="none", choices=("none", "details", "transcripts", "all"),
+                        help="Ask /search for video details and/or transcript availability")
+    parser.add_argument("--retrieval", default="off", choices=("auto", "on", "off"), help="Chat retrieval mode")
+    # Fake transcript source
+    parser.add_argument("--cues", type=int, default=1500, help="Cues per fake transcript")
+    parser.add_argument("--fetch-latency", type=float, default=0.3, help="Fake YouTube fetch latency in seconds")
+    parser.add_argument("--fetch-failure-rate", type=float, default=0.0, help="Share of videos that are unavailable")
+    parser.add_argument("--fetch-blocked-rate", type=float, default=0.0, help="Share of fetches that hit an IP block")
+    # Fake OpenRouter
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake OpenRouter latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random OpenRouter latency in seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Share of completions answered with 429")
+    parser.add_argument("--server-errors", type=float, default=0.0, help="Share of completions answered with 503")
+    parser.add_argument("--timeouts", type=float, default=0.0, help="Share of completions that hang past the timeout")
+    parser.add_argument("--openrouter-timeout", type=float, default=5.0, help="OPENROUTER_TIMEOUT for the server")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="LLM_MAX_CONCURRENCY for the server")
+    parser.add_argument("--llm-concurrency-per-model", type=int, default=4,
+                        help="LLM_MAX_CONCURRENCY_PER_MODEL for the server")
+    parser.add_argument("--admission-queue", type=int, default=64, help="ADMISSION_QUEUE_SIZE for the server")
+    parser.add_argument("--client-rate-limit", type=float, default=0.0,
+                        help="RATE_LIMIT_PER_MINUTE for the server (0: off)")
+    parser.add_argument("--request-timeout", type=float, default=120.0, help="Client timeout per request")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results as JSON to this file (default: stdout)")
+    return parser
+
+
+def parse_scenarios(parser: argparse.ArgumentParser, args):
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+
+def main():
+    parser = build_parser()
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+    parse_scenarios(parser, args)
+
+    results = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            results["comparison"] = compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
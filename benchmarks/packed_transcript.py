@@ -0,0 +1,104 @@
+"""
+PackedTranscript micro-benchmark.
+
+Compares the packed transcript representation with youtube_transcript_api's
+FetchedTranscript (one snippet object per cue, plus the to_raw_data() dicts
+the endpoints used to build) on a synthetic transcript:
+
+  - memory held per transcript (tracemalloc)
+  - disk cache entry size and decode time (json.loads + rebuild)
+  - time to take a time range (binary search vs. filtering the cue list)
+
+Usage:
+    python benchmarks/packed_transcript.py --cues 1500
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from youtube_transcript_api._transcripts import FetchedTranscript, FetchedTranscriptSnippet
+
+from benchmarks.formatters import make_snippets
+from packed_transcript import PackedTranscript
+
+
+def traced_size(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    return size
+
+
+def best_of(fn, repeat: int = 20) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cues", type=int, default=1500, help="Cues per transcript (1500 is about an hour)")
+    args = parser.parse_args()
+
+    snippets = make_snippets(args.cues)
+    texts = [(s.text, s.start, s.duration) for s in snippets]
+    fetched = FetchedTranscript(snippets, "bench", "English", "en", True)
+    packed = PackedTranscript.from_fetched(fetched)
+    midpoint = snippets[len(snippets) // 2].start
+
+    def build_fetched():
+        transcript = FetchedTranscript(
+            [FetchedTranscriptSnippet(text, start, duration) for text, start, duration in texts],
+            "bench", "English", "en", True
+        )
+        return transcript, transcript.to_raw_data()
+
+    legacy_entry = json.dumps({
+        "video_id": "bench", "language": "English", "language_code": "en", "is_generated": True,
+        "snippets": fetched.to_raw_data()
+    })
+    packed_entry = json.dumps(packed.to_dict())
+
+    def decode_legacy():
+        data = json.loads(legacy_entry)
+        return FetchedTranscript(
+            [FetchedTranscriptSnippet(s["text"], s["start"], s["duration"]) for s in data["snippets"]],
+            data["video_id"], data["language"], data["language_code"], data["is_generated"]
+        )
+
+    results = {
+        "cues": args.cues,
+        "memory_kb": {
+            "fetched_plus_raw_data": round(traced_size(build_fetched) / 1024, 1),
+            "packed": round(traced_size(lambda: PackedTranscript.from_snippets(snippets, "bench", "English", "en", True)) / 1024, 1)
+        },
+        "cache_entry_kb": {
+            "legacy": round(len(legacy_entry) / 1024, 1),
+            "packed": round(len(packed_entry) / 1024, 1)
+        },
+        "cache_decode_ms": {
+            "legacy": round(best_of(decode_legacy) * 1000, 3),
+            "packed": round(best_of(lambda: PackedTranscript.from_dict(json.loads(packed_entry))) * 1000, 3)
+        },
+        "range_ms": {
+            "filter": round(best_of(lambda: [s for s in fetched.snippets if midpoint <= s.start < midpoint + 600]) * 1000, 4),
+            "bisect": round(best_of(lambda: packed.between(midpoint, midpoint + 600)) * 1000, 4)
+        }
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Local stand-ins for the services this API talks to, for offline benchmarks.
+
+  FakeUpstream      - one HTTP server playing both OpenRouter
+                      (POST /chat/completions, plain or streamed) and the
+                      YouTube Data API (GET /search, GET /videos)
+  FakeTranscriptApi - drop-in for YouTubeTranscriptApi with synthetic
+                      transcripts, configured through BENCH_TRANSCRIPT_*
+                      environment variables so it also works inside a
+                      hypercorn worker process (see bench_app.py)
+
+Everything is seeded, so two runs with the same settings see the same
+sequence of latencies and failures.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from youtube_transcript_api._errors import RequestBlocked, TranscriptsDisabled, VideoUnavailable
+from youtube_transcript_api._transcripts import FetchedTranscript, FetchedTranscriptSnippet
+
+WORDS = (
+    "the model data training python server cache latency request stream token video "
+    "transcript search pattern summary question answer deploy worker queue memory "
+    "music people really think going know right actually important example"
+).split()
+
+
+@dataclass
+class UpstreamConfig:
+    # Seconds before OpenRouter answers, plus up to `jitter` more
+    latency: float = 0.2
+    jitter: float = 0.05
+    # Share of chat completions answered with 429 (Retry-After: 1) / 503
+    rate_limit_ratio: float = 0.0
+    server_error_ratio: float = 0.0
+    # Share of chat completions that hang for `hang_seconds` (set the API's
+    # OPENROUTER_TIMEOUT below that to exercise the timeout path)
+    timeout_ratio: float = 0.0
+    hang_seconds: float = 30.0
+    # Streamed completions: number of delta chunks and delay between them
+    stream_chunks: int = 20
+    chunk_interval: float = 0.005
+    completion_words: int = 60
+    # YouTube Data API search latency
+    search_latency: float = 0.05
+    seed: int = 1
+
+
+class FakeUpstream:
+    """Threaded HTTP server standing in for OpenRouter and the YouTube Data API"""
+
+    def __init__(self, config: UpstreamConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.counts = {"completions": 0, "streams": 0, "rate_limited": 0, "server_errors": 0, "timeouts": 0, "searches": 0, "video_lookups": 0}
+        self.server = self._make_server()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "FakeUpstream":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _draw(self) -> tuple:
+        """Pick (outcome, latency) for one completion, deterministically per seed"""
+        config = self.config
+        with self.lock:
+            roll = self.random.random()
+            latency = config.latency + self.random.random() * config.jitter
+        if roll < config.rate_limit_ratio:
+            return "rate_limited", 0.0
+        roll -= config.rate_limit_ratio
+        if roll < config.server_error_ratio:
+            return "server_error", latency
+        roll -= config.server_error_ratio
+        if roll < config.timeout_ratio:
+            return "timeout", config.hang_seconds
+        return "ok", latency
+
+    def _count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _make_server(self) -> ThreadingHTTPServer:
+        upstream = self
+        config = self.config
+        answer = " ".join(WORDS[i % len(WORDS)] for i in range(config.completion_words))
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status: int, payload: dict, headers: dict = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+                usage = {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": config.completion_words,
+                    "total_tokens": prompt_chars // 4 + config.completion_words
+                }
+                outcome, latency = upstream._draw()
+                if outcome == "rate_limited":
+                    upstream._count("rate_limited")
+                    self._send_json(429, {"error": {"message": "Rate limit exceeded"}}, {"Retry-After": "1"})
+                    return
+                time.sleep(latency)
+                if outcome == "server_error":
+                    upstream._count("server_errors")
+                    self._send_json(503, {"error": {"message": "Upstream overloaded"}})
+                    return
+                if outcome == "timeout":
+                    upstream._count("timeouts")
+                    self._send_json(504, {"error": {"message": "Hung request"}})
+                    return
+
+                if not request.get("stream"):
+                    upstream._count("completions")
+                    self._send_json(200, {
+                        "model": request.get("model"),
+                        "choices": [{"message": {"role": "assistant", "content": answer}}],
+                        "usage": usage
+                    })
+                    return
+
+                upstream._count("streams")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = answer.split(" ")
+                per_chunk = max(len(words) // max(config.stream_chunks, 1), 1)
+                for i in range(0, len(words), per_chunk):
+                    content = " ".join(words[i:i + per_chunk]) + " "
+                    event = {"choices": [{"delta": {"content": content}}]}
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                    time.sleep(config.chunk_interval)
+                self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.endswith("/videos"):
+                    self._videos(parse_qs(url.query))
+                    return
+                if not url.path.endswith("/search"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                upstream._count("searches")
+                params = parse_qs(url.query)
+                query = params.get("q", [""])[0]
+                count = int(params.get("maxResults", ["10"])[0])
+                time.sleep(config.search_latency)
+                self._send_json(200, {"items": [
+                    {
+                        "id": {"kind": "youtube#video", "videoId": f"bench-{(zlib.crc32(query.encode()) + i) % 100000}"},
+                        "snippet": {
+                            "title": f"{query} result {i}",
+                            "channelTitle": "Benchmark Channel",
+                            "publishedAt": "2024-01-01T00:00:00Z",
+                            "description": f"Synthetic result {i} for {query}",
+                            "thumbnails": {"medium": {"url": f"https://i.ytimg.com/vi/bench-{i}/mqdefault.jpg"}}
+                        }
+                    }
+                    for i in range(count)
+                ]})
+
+            def _videos(self, params: dict):
+                upstream._count("video_lookups")
+                time.sleep(config.search_latency)
+                items = []
+                for video_id in params.get("id", [""])[0].split(","):
+                    rng = random.Random(zlib.crc32(video_id.encode()))
+                    items.append({
+                        "id": video_id,
+                        "contentDetails": {
+                            "duration": f"PT{rng.randint(0, 2)}H{rng.randint(0, 59)}M{rng.randint(0, 59)}S",
+                            "definition": "hd",
+                            "caption": "true" if rng.random() < 0.3 else "false"
+                        },
+                        "statistics": {
+                            "viewCount": str(rng.randint(0, 10 ** 7)),
+                            "likeCount": str(rng.randint(0, 10 ** 5)),
+                            "commentCount": str(rng.randint(0, 10 ** 4))
+                        },
+                        "status": {"privacyStatus": "public", "embeddable": True}
+                    })
+                self._send_json(200, {"items": items})
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 1024
+
+            def handle_error(self, request, client_address):
+                # The API gives up on hung requests - that's the point of the timeout scenario
+                if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+                    super().handle_error(request, client_address)
+
+        return Server(("127.0.0.1", 0), Handler)
+
+
+class FakeTranscriptApi:
+    """
+    Synthetic stand-in for YouTubeTranscriptApi.
+
+    Video IDs starting with "disabled-", "unavailable-" or "blocked-" always
+    fail that way; other IDs fail at the configured rates. Transcript
+    contents depend only on the video ID.
+
+    Environment:
+        BENCH_TRANSCRIPT_CUES          cues per transcript (default 1500, ~1h)
+        BENCH_TRANSCRIPT_LATENCY       seconds per fetch (default 0.3)
+        BENCH_TRANSCRIPT_FAILURE_RATE  share of IDs that are unavailable (default 0)
+        BENCH_TRANSCRIPT_BLOCKED_RATE  share of fetches that hit an IP block (default 0)
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.cues = int(os.getenv("BENCH_TRANSCRIPT_CUES", "1500"))
+        self.latency = float(os.getenv("BENCH_TRANSCRIPT_LATENCY", "0.3"))
+        self.failure_rate = float(os.getenv("BENCH_TRANSCRIPT_FAILURE_RATE", "0"))
+        self.blocked_rate = float(os.getenv("BENCH_TRANSCRIPT_BLOCKED_RATE", "0"))
+
+    def fetch(self, video_id: str, languages=("en",), preserve_formatting: bool = False) -> FetchedTranscript:
+        time.sleep(self.latency)
+        if video_id.startswith("disabled-"):
+            raise TranscriptsDisabled(video_id)
+        if video_id.startswith("unavailable-"):
+            raise VideoUnavailable(video_id)
+        if video_id.startswith("blocked-") or random.random() < self.blocked_rate:
+            raise RequestBlocked(video_id)
+
+        # Seeded per video so a video always has the same transcript (and the same fate)
+        rng = random.Random(zlib.crc32(video_id.encode()))
+        if rng.random() < self.failure_rate:
+            raise VideoUnavailable(video_id)
+        snippets = []
+        start = 0.0
+        for _ in range(self.cues):
+            duration = round(1.5 + rng.random() * 3, 2)
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+            snippets.append(FetchedTranscriptSnippet(text=text, start=round(start, 2), duration=duration))
+            start += duration
+        language_code = languages[0] if languages else "en"
+        return FetchedTranscript(
+            snippets=snippets,
+            video_id=video_id,
+            language="English (auto-generated)",
+            language_code=language_code,
+            is_generated=True
+        )
+
+    def list(self, video_id: str):
+        time.sleep(self.latency)
+        if video_id.startswith("disabled-"):
+            raise TranscriptsDisabled(video_id)
+        if video_id.startswith("unavailable-"):
+            raise VideoUnavailable(video_id)
+        return [SimpleNamespace(
+            language="English (auto-generated)",
+            language_code="en",
+            is_generated=True,
+            is_translatable=True
+        )]
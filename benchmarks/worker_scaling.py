@@ -0,0 +1,83 @@
+"""
+Worker scaling benchmark: runs the offline load test (load_test.py) once per
+hypercorn worker count and reports how each scenario's throughput and
+latency change from 1 to N workers.
+
+Every run starts from empty caches. All workers of a run share one cache
+database (CACHE_BACKEND=sqlite), so a transcript fetched by one worker is
+served from the shared tier by the others; --cache-backend files gives the
+per-file backend for comparison. Throughput of CPU-bound scenarios
+(transcript formatting, search) can only scale up to the number of cores:
+
+    python benchmarks/worker_scaling.py --worker-counts 1,2,4 --scenarios transcript,summarize
+    python benchmarks/worker_scaling.py --worker-counts 1,4 --cache-backend files --output files.json
+
+Accepts every load_test.py option except --workers.
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.load_test import build_parser, parse_scenarios, run  # noqa: E402
+
+
+def scaling_table(runs: dict) -> list:
+    """Per scenario and worker count: throughput, speedup over the first count and p50/p95"""
+    counts = sorted(runs)
+    rows = []
+    for index, scenario in enumerate(runs[counts[0]]["scenarios"]):
+        baseline = scenario["throughput_rps"]
+        row = {"scenario": scenario["scenario"], "workers": {}}
+        for count in counts:
+            result = runs[count]["scenarios"][index]
+            row["workers"][str(count)] = {
+                "throughput_rps": result["throughput_rps"],
+                "speedup": round(result["throughput_rps"] / baseline, 2) if baseline else None,
+                "p50_ms": result["latency_ms"].get("p50"),
+                "p95_ms": result["latency_ms"].get("p95"),
+                "statuses": result["statuses"],
+                "rss_mb": result["memory_mb"]["after"].get("rss")
+            }
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = build_parser(__doc__)
+    parser.add_argument("--worker-counts", default="1,2,4", help="Comma-separated hypercorn worker counts to run")
+    args = parser.parse_args()
+    parse_scenarios(parser, args)
+    counts = [int(count) for count in args.worker_counts.split(",") if count.strip()]
+
+    runs = {}
+    for count in counts:
+        print(f"--- {count} worker(s) ---", file=sys.stderr)
+        args.workers = count
+        runs[count] = asyncio.run(run(args))
+
+    table = scaling_table(runs)
+    for row in table:
+        cells = "  ".join(
+            f"{count}w {cell['throughput_rps']:7.1f} req/s (x{cell['speedup']})"
+            for count, cell in row["workers"].items()
+        )
+        print(f"{row['scenario']:18} {cells}", file=sys.stderr)
+
+    output = json.dumps({
+        "cpu_count": os.cpu_count(),
+        "cache_backend": args.cache_backend,
+        "scaling": table,
+        "runs": {str(count): result for count, result in runs.items()}
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+# Sentinel returned on a cache miss so that None can be cached as a value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded in-memory LRU cache with per-entry TTL and hit/miss counters.
+
+    Safe to use from both the event loop and threadpool workers.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Any:
+        """Return the cached value, or MISSING if absent or expired"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = item
+            if expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entries if full"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class DiskCache:
+    """
+    Persistent JSON-file cache that survives restarts.
+
+    Each key is stored in its own file named after the key's SHA-256, written
+    atomically. Expired entries are dropped on read, and the oldest files are
+    pruned once the entry count exceeds max_entries.
+    """
+
+    # Check the entry count every N writes instead of on every write
+    PRUNE_EVERY = 64
+
+    def __init__(self, directory: str, max_entries: int, ttl: float):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get(self, key: str) -> Any:
+        """Return the cached value, or MISSING if absent or expired"""
+        entry = self.get_entry(key)
+        return entry if entry is MISSING else entry[0]
+
+    def get_entry(self, key: str) -> Any:
+        """Return (value, expires_at), or MISSING if absent or expired"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return MISSING
+        if item.get("key") != key or item.get("expires_at", 0) < time.time():
+            self._remove(path)
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return item["value"], item["expires_at"]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a JSON-serializable value"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        item = {
+            "key": key,
+            "expires_at": time.time() + (self.ttl if ttl is None else ttl),
+            "value": value
+        }
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(item, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key: str):
+        self._remove(self._path(key))
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _files(self) -> list:
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".json"):
+                    files.append(os.path.join(root, name))
+        return files
+
+    def prune(self):
+        """Remove the oldest entries beyond max_entries"""
+        files = self._files()
+        overflow = len(files) - self.max_entries
+        if overflow <= 0:
+            return
+        files.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in files[:overflow]:
+            self._remove(path)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "entries": len(self._files()),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,341 @@
+import asyncio
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import openrouter
+from tokens import estimate_tokens
+
+MODELS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openrouter-free-llms.txt")
+
+# Context window assumed for models not listed in openrouter-free-llms.txt
+DEFAULT_CONTEXT_LENGTH = int(os.getenv("DEFAULT_CONTEXT_LENGTH", "32768"))
+# Tokens kept free in the window for the model's answer
+CHUNK_OUTPUT_RESERVE_TOKENS = int(os.getenv("CHUNK_OUTPUT_RESERVE_TOKENS", "4096"))
+# Fraction of the window used for input - token counts are estimates, so leave headroom
+CHUNK_CONTEXT_SAFETY = float(os.getenv("CHUNK_CONTEXT_SAFETY", "0.8"))
+# Transcript tokens repeated at the start of each chunk so ideas aren't cut in half
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "200"))
+# Maximum chunk prompts in flight at once per request
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "3"))
+
+# Accepted values for the `chunking` query parameter
+#   auto - split only when the prompt doesn't fit the model's context window
+#   on   - always run map-reduce
+#   off  - always send the whole transcript in one prompt
+CHUNKING_MODE_PATTERN = "^(auto|on|off)$"
+
+MAP_NOTE = (
+    "\n\n# NOTE\n"
+    "The input is part {index} of {total} of one long transcript. "
+    "Process only this part and keep the original [timestamps] for every point you reference."
+)
+REDUCE_NOTE = (
+    "\n\n# NOTE\n"
+    "The input consists of partial results, produced in order from consecutive parts of one long transcript. "
+    "Merge them into a single final result in the required output format. "
+    "Remove duplicates and keep the [timestamps] from the partial results intact."
+)
+
+
+def load_context_lengths(path: str = MODELS_FILE) -> Dict[str, int]:
+    """Parse model identifier -> context length from openrouter-free-llms.txt"""
+    lengths = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            next(f, None)  # header row
+            for line in f:
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) < 4:
+                    continue
+                try:
+                    lengths[columns[2].strip()] = int(columns[3].replace(",", "").strip())
+                except ValueError:
+                    continue
+    except OSError as e:
+        print(f"Could not load model context lengths: {str(e)}")
+    return lengths
+
+
+CONTEXT_LENGTHS = load_context_lengths()
+
+
+def context_length(model: str) -> int:
+    return CONTEXT_LENGTHS.get(model, DEFAULT_CONTEXT_LENGTH)
+
+
+def input_budget(model: str, system_prompt: str) -> int:
+    """Transcript tokens that fit in one prompt for model alongside system_prompt"""
+    usable = int(context_length(model) * CHUNK_CONTEXT_SAFETY) - CHUNK_OUTPUT_RESERVE_TOKENS
+    return max(usable - estimate_tokens(system_prompt), 1000)
+
+
+def fits(model: str, system_prompt: str, transcript_text: str) -> bool:
+    return estimate_tokens(transcript_text) <= input_budget(model, system_prompt)
+
+
+def usable_fallbacks(
+    fallback_models: List[str],
+    preferred_model: str,
+    system_prompt: str,
+    transcript_text: str,
+    chunked: bool
+) -> List[str]:
+    """
+    Drop fallback models that cannot hold the prompt, so a too-small model
+    isn't tried only to fail (or time out) on context length.
+    """
+    if chunked:
+        # Chunks are sized for the preferred model's window
+        return [m for m in fallback_models if context_length(m) >= context_length(preferred_model)]
+    return [m for m in fallback_models if fits(m, system_prompt, transcript_text)]
+
+
+def usable_chat_fallbacks(fallback_models: List[str], messages: List[dict]) -> List[str]:
+    """
+    usable_fallbacks for a chat conversation: keep the fallback models whose
+    window holds the system prompt (transcript), history and new message.
+    """
+    prompt = "\n".join(message["content"] for message in messages)
+    return [m for m in fallback_models if fits(m, "", prompt)]
+
+
+def should_chunk(mode: str, model: str, system_prompt: str, transcript_text: str) -> bool:
+    if mode == "on":
+        return True
+    if mode == "off":
+        return False
+    return not fits(model, system_prompt, transcript_text)
+
+
+def split_segments(lines: List[str], budget: int, overlap: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """
+    Split transcript lines into chunks of at most budget tokens.
+
+    Chunks break only between segments, and each chunk after the first starts
+    with the trailing ~overlap tokens of the previous one.
+    """
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for line in lines:
+        line_tokens = estimate_tokens(line) + 1
+        if current and current_tokens + line_tokens > budget:
+            chunks.append("\n".join(current))
+
+            # Carry the tail of the previous chunk over as context
+            carried: List[str] = []
+            carried_tokens = 0
+            for previous in reversed(current):
+                previous_tokens = estimate_tokens(previous) + 1
+                if carried_tokens + previous_tokens > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous_tokens
+            current, current_tokens = carried, carried_tokens
+
+        current.append(line)
+        current_tokens += line_tokens
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def add_usage(total: dict, usage: dict):
+    for key, value in (usage or {}).items():
+        if isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+
+
+def _single_messages(system_prompt: str, transcript_text: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Summarize this transcript:\n\n{transcript_text}"}
+    ]
+
+
+def _map_messages(system_prompt: str, chunk: str, index: int, total: int) -> list:
+    return [
+        {"role": "system", "content": system_prompt + MAP_NOTE.format(index=index, total=total)},
+        {"role": "user", "content": f"Summarize this transcript:\n\n{chunk}"}
+    ]
+
+
+def _reduce_messages(system_prompt: str, partials: List[str]) -> list:
+    combined = "\n\n".join(
+        f"## Part {i}\n\n{partial}" for i, partial in enumerate(partials, start=1)
+    )
+    return [
+        {"role": "system", "content": system_prompt + REDUCE_NOTE},
+        {"role": "user", "content": f"Combine these partial results:\n\n{combined}"}
+    ]
+
+
+async def _map(
+    openrouter_api_key: str,
+    texts: List[str],
+    system_prompt: str,
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    usage: dict,
+    hedge: Optional[bool] = None
+) -> Tuple[List[str], List[dict]]:
+    """
+    Run one prompt per text concurrently, bounded by CHUNK_CONCURRENCY.
+
+    The first failing chunk fails the whole map step, so the chunks still
+    queued or in flight are cancelled instead of spending quota on a
+    result nobody will use.
+    """
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+    async def run(index: int, text: str) -> dict:
+        async with semaphore:
+            return await openrouter.complete_with_fallback(
+                openrouter_api_key=openrouter_api_key,
+                messages=_map_messages(system_prompt, text, index, len(texts)),
+                preferred_model=preferred_model,
+                fallback_models=fallback_models,
+                title=title,
+                hedge=hedge
+            )
+
+    tasks = [asyncio.ensure_future(run(i, text)) for i, text in enumerate(texts, start=1)]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    results = [task.result() for task in tasks]
+    for result in results:
+        add_usage(usage, result["usage"])
+    return [result["content"] for result in results], list(results)
+
+
+async def _prepare_final_prompt(
+    openrouter_api_key: str,
+    transcript_text: str,
+    system_prompt: str,
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    usage: dict,
+    hedge: Optional[bool] = None
+) -> Tuple[list, int, bool, bool]:
+    """
+    Map transcript chunks to partial results, re-mapping the partials while
+    they are still too large to reduce in one prompt.
+
+    Returns (messages for the final call, chunk count, whether any map call
+    used a fallback, whether any map call was hedged). A transcript that fits
+    in one chunk skips the map phase.
+    """
+    budget = input_budget(preferred_model, system_prompt + MAP_NOTE)
+    chunks = split_segments(transcript_text.split("\n"), budget)
+    if len(chunks) == 1:
+        return _single_messages(system_prompt, chunks[0]), 1, False, False
+
+    partials, results = await _map(
+        openrouter_api_key, chunks, system_prompt, preferred_model, fallback_models, title, usage, hedge
+    )
+    fallback_used = any(result["fallback_used"] for result in results)
+    hedged = any(result["hedged"] for result in results)
+
+    reduce_budget = input_budget(preferred_model, system_prompt + REDUCE_NOTE)
+    while len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > reduce_budget:
+        groups = split_segments(partials, reduce_budget, overlap=0)
+        if len(groups) >= len(partials):
+            break
+        partials, results = await _map(
+            openrouter_api_key, groups, system_prompt, preferred_model, fallback_models, title, usage, hedge
+        )
+        fallback_used = fallback_used or any(result["fallback_used"] for result in results)
+        hedged = hedged or any(result["hedged"] for result in results)
+
+    return _reduce_messages(system_prompt, partials), len(chunks), fallback_used, hedged
+
+
+async def map_reduce(
+    openrouter_api_key: str,
+    transcript_text: str,
+    system_prompt: str,
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    hedge: Optional[bool] = None
+) -> dict:
+    """
+    Summarize a transcript that doesn't fit the model's context window.
+
+    Returns: dict with 'content', 'model_used', 'usage', 'fallback_used', 'hedged' and 'chunks' keys
+    """
+    usage: dict = {}
+    messages, chunk_count, fallback_used, hedged = await _prepare_final_prompt(
+        openrouter_api_key, transcript_text, system_prompt, preferred_model, fallback_models, title, usage, hedge
+    )
+
+    result = await openrouter.complete_with_fallback(
+        openrouter_api_key=openrouter_api_key,
+        messages=messages,
+        preferred_model=preferred_model,
+        fallback_models=fallback_models,
+        title=title,
+        hedge=hedge
+    )
+    add_usage(usage, result["usage"])
+
+    return {
+        "content": result["content"],
+        "model_used": result["model_used"],
+        "usage": usage,
+        "fallback_used": fallback_used or result["fallback_used"],
+        "hedged": hedged or result["hedged"],
+        "chunks": chunk_count
+    }
+
+
+async def stream_map_reduce(
+    openrouter_api_key: str,
+    transcript_text: str,
+    system_prompt: str,
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    timeout: Optional[float] = None,
+    hedge: Optional[bool] = None
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streaming variant of map_reduce: the map phase runs to completion, then
+    the reduce step is streamed as (event, data) tuples.
+    """
+    usage: dict = {}
+    messages, chunk_count, fallback_used, hedged = await _prepare_final_prompt(
+        openrouter_api_key, transcript_text, system_prompt, preferred_model, fallback_models, title, usage, hedge
+    )
+
+    async for event, data in openrouter.stream_with_fallback(
+        openrouter_api_key=openrouter_api_key,
+        messages=messages,
+        preferred_model=preferred_model,
+        fallback_models=fallback_models,
+        title=title,
+        timeout=timeout,
+        hedge=hedge
+    ):
+        if event == "done":
+            add_usage(usage, data["usage"])
+            data = {
+                **data,
+                "usage": usage,
+                "fallback_used": fallback_used or data["fallback_used"],
+                "hedged": hedged or data["hedged"],
+                "chunks": chunk_count
+            }
+        yield event, data
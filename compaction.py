@@ -0,0 +1,200 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache import LRUCache, MISSING
+from packed_transcript import PackedTranscript
+from tokens import estimate_tokens
+
+# Default compaction level for transcripts sent to the LLM endpoints
+COMPACTION_LEVEL = os.getenv("COMPACTION_LEVEL", "medium")
+# Words at the end of the text so far compared against the start of each new
+# caption when removing rolling-caption repeats
+COMPACTION_OVERLAP_WORDS = int(os.getenv("COMPACTION_OVERLAP_WORDS", "20"))
+# Compacted transcripts kept in memory (per video, language and level)
+COMPACTION_CACHE_ENTRIES = int(os.getenv("COMPACTION_CACHE_ENTRIES", "256"))
+
+# Accepted values for the `compaction` query parameter
+#   off        - one "[12.34s] text" line per caption fragment, as before
+#   light      - non-speech markers and repeated caption text removed, ~10-15s blocks
+#   medium     - also filler words removed, ~30-45s paragraphs
+#   aggressive - also stutters removed, ~60-90s paragraphs
+COMPACTION_MODE_PATTERN = "^(off|light|medium|aggressive)$"
+
+# COMPACTION_LEVEL becomes the default of every endpoint's compaction
+# parameter; fail at startup rather than on the first request
+if not re.fullmatch(COMPACTION_MODE_PATTERN, COMPACTION_LEVEL):
+    raise ValueError(f"Unknown COMPACTION_LEVEL '{COMPACTION_LEVEL}' (use off, light, medium or aggressive)")
+
+
+@dataclass
+class Level:
+    # A block ends at the first sentence end after target_seconds, or at max_seconds
+    target_seconds: float
+    max_seconds: float
+    remove_fillers: bool
+    remove_stutters: bool
+
+
+LEVELS = {
+    "light": Level(10, 15, remove_fillers=False, remove_stutters=False),
+    "medium": Level(30, 45, remove_fillers=True, remove_stutters=False),
+    "aggressive": Level(60, 90, remove_fillers=True, remove_stutters=True),
+}
+
+# [Music], [Applause], [Laughter], ♪ ... and the parenthesised variants some channels use
+NON_SPEECH_RE = re.compile(
+    r"\[[^\]]{0,40}\]"
+    r"|\((?:music|applause|laughter|laughs|laughing|inaudible|silence|cheering|crosstalk)\)"
+    r"|[♪♫]+",
+    re.IGNORECASE
+)
+FILLER_RE = re.compile(r"\b(?:u+m+|u+h+|e+r+m+|u+h+m+|h+m+|m+h?m+)\b[,.]?", re.IGNORECASE)
+STUTTER_RE = re.compile(r"\b(\w+)(?:,? \1\b)+", re.IGNORECASE)
+PUNCTUATION = ".,?!;:\"'-"
+SENTENCE_END = (".", "?", "!")
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"[{hours}:{minutes:02d}:{seconds:02d}]"
+    return f"[{minutes:02d}:{seconds:02d}]"
+
+
+def raw_text(transcript: PackedTranscript) -> str:
+    """One "[12.34s] text" line per caption fragment (compaction=off)"""
+    return "\n".join(f"[{start:.2f}s] {text}" for text, start, _ in transcript.rows())
+
+
+def _normalize(word: str) -> str:
+    return word.lower().strip(PUNCTUATION)
+
+
+def _clean(text: str, level: Level) -> Tuple[str, int]:
+    """Strip non-speech markers (and fillers/stutters if the level asks for it)"""
+    text, markers = NON_SPEECH_RE.subn(" ", text)
+    if level.remove_fillers:
+        text = FILLER_RE.sub(" ", text)
+    text = " ".join(text.split())
+    if level.remove_stutters:
+        text = STUTTER_RE.sub(r"\1", text)
+    return text, markers
+
+
+def _drop_overlap(words: List[str], tail: List[str]) -> int:
+    """
+    Number of leading words of a caption that repeat the end of the text so
+    far. Rolling captions restate the previous line before adding new words.
+    """
+    if not words or not tail:
+        return 0
+    first = _normalize(words[0])
+    normalized = None
+    for size in range(min(len(words), len(tail)), 0, -1):
+        # A single repeated word is usually just speech ("that that"), unless it is the whole caption
+        if size == 1 and len(words) > 1:
+            break
+        if tail[-size] != first:
+            continue
+        if normalized is None:
+            normalized = [_normalize(word) for word in words[:len(tail)]]
+        if normalized[:size] == tail[-size:]:
+            return size
+    return 0
+
+
+def compact(transcript: PackedTranscript, level_name: str = COMPACTION_LEVEL) -> Tuple[str, dict]:
+    """
+    Turn caption fragments into the transcript text sent to the LLM.
+
+    Fragments are merged into blocks of roughly a sentence or paragraph with
+    one [MM:SS] timestamp each, and non-speech markers ([Music], ♪) and text
+    repeated by rolling captions are removed. Stronger levels also drop
+    filler words and stutters and make longer blocks.
+
+    Returns (text, report), the report carrying the estimated token counts
+    before and after.
+    """
+    original = raw_text(transcript)
+    before = estimate_tokens(original)
+    if level_name == "off":
+        return original, {
+            "level": "off",
+            "segments": len(transcript),
+            "blocks": len(transcript),
+            "tokens_before": before,
+            "tokens_after": before,
+            "tokens_saved": 0
+        }
+
+    level = LEVELS[level_name]
+    blocks: List[str] = []
+    block_words: List[str] = []
+    block_start = 0.0
+    tail: List[str] = []
+    markers = 0
+    repeated_words = 0
+
+    for cue_text, start, _ in transcript.rows():
+        text, removed = _clean(cue_text, level)
+        markers += removed
+        words = text.split()
+        overlap = _drop_overlap(words, tail)
+        repeated_words += overlap
+        words = words[overlap:]
+        if not words:
+            continue
+
+        if block_words:
+            elapsed = start - block_start
+            ends_sentence = block_words[-1].endswith(SENTENCE_END)
+            if elapsed >= level.max_seconds or (elapsed >= level.target_seconds and ends_sentence):
+                blocks.append(f"{format_timestamp(block_start)} {' '.join(block_words)}")
+                block_words = []
+        if not block_words:
+            block_start = start
+        block_words.extend(words)
+        tail = (tail + [_normalize(word) for word in words[-COMPACTION_OVERLAP_WORDS:]])[-COMPACTION_OVERLAP_WORDS:]
+
+    if block_words:
+        blocks.append(f"{format_timestamp(block_start)} {' '.join(block_words)}")
+
+    text = "\n".join(blocks)
+    after = estimate_tokens(text)
+    return text, {
+        "level": level_name,
+        "segments": len(transcript),
+        "blocks": len(blocks),
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": before - after,
+        "removed_markers": markers,
+        "removed_repeated_words": repeated_words
+    }
+
+
+compacted_cache = LRUCache(COMPACTION_CACHE_ENTRIES, float("inf"))
+
+
+async def compact_transcript(transcript: PackedTranscript, level_name: str = COMPACTION_LEVEL) -> Tuple[str, dict]:
+    """
+    compact(), run in the threadpool and cached, so an hour-long transcript
+    isn't re-processed on the event loop per request.
+    """
+    key = f"{transcript.cache_key()}:{level_name}"
+    entry = compacted_cache.get(key)
+    if entry is MISSING:
+        entry = await run_in_threadpool(compact, transcript, level_name)
+        compacted_cache.set(key, entry)
+    text, report = entry
+    return text, dict(report)
+
+
+def stats() -> dict:
+    return compacted_cache.stats()
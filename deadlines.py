@@ -0,0 +1,273 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from typing import Awaitable, List, Optional, TypeVar
+
+from fastapi import HTTPException
+
+import metrics
+
+T = TypeVar("T")
+
+# Time budget shared by every stage of a request (transcript fetch, pattern
+# load, each LLM attempt), in seconds. 0 disables the default deadline;
+# clients can still ask for one with the X-Request-Timeout header
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "120"))
+# Upper bound for budgets requested through X-Request-Timeout
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", "300"))
+# An LLM attempt is not started with less than this much of the budget left
+DEADLINE_MIN_ATTEMPT_SECONDS = float(os.getenv("DEADLINE_MIN_ATTEMPT_SECONDS", "1"))
+
+TIMEOUT_HEADER = "x-request-timeout"
+REMAINING_HEADER = "x-deadline-remaining"
+
+
+class Deadline:
+    """A request's time budget and the stages that finished within it"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget
+        self.stages: List[dict] = []
+        # Stage that was running when the budget ran out
+        self.exceeded_during: Optional[str] = None
+        # Set once the response has started; the budget is no longer enforced
+        self.lifted = False
+        # Budget of work shared by several requests (see shared()) rather than of one request
+        self.shared = False
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def complete(self, stage: str, seconds: float):
+        self.stages.append({"stage": stage, "seconds": round(seconds, 3)})
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def _active() -> Optional[Deadline]:
+    deadline = _current.get()
+    return None if deadline is None or deadline.lifted else deadline
+
+
+class DeadlineExceeded(HTTPException):
+    """504 raised once the request's budget runs out, listing the stages that completed"""
+
+    def __init__(self, deadline: Deadline, stage: str):
+        # Nested waits (e.g. a coalesced LLM call and its attempt) all give up
+        # at once; count the request only once. Shared work only runs out
+        # along with its waiters, which are counted themselves
+        if deadline.exceeded_during is None:
+            deadline.exceeded_during = stage
+            if not deadline.shared:
+                metrics.inc("request_deadline_exceeded_total", stage=stage)
+        super().__init__(
+            status_code=504,
+            detail={
+                "message": f"Request deadline of {deadline.budget:g}s exceeded during {stage}",
+                "deadline_seconds": deadline.budget,
+                "elapsed_seconds": round(deadline.elapsed(), 3),
+                "stage": stage,
+                "stages_completed": list(deadline.stages)
+            }
+        )
+
+
+def current() -> Optional[Deadline]:
+    """The deadline of the request being handled, or None (background jobs, disabled, response started)"""
+    return _active()
+
+
+def remaining() -> Optional[float]:
+    deadline = _active()
+    return None if deadline is None else deadline.remaining()
+
+
+def expired() -> bool:
+    deadline = _active()
+    return deadline is not None and deadline.remaining() <= 0
+
+
+def exceeded(stage: str) -> DeadlineExceeded:
+    return DeadlineExceeded(_current.get(), stage)
+
+
+def check(stage: str):
+    """Raise DeadlineExceeded if the budget is already spent before stage starts"""
+    if expired():
+        raise exceeded(stage)
+
+
+def completed(stage: str, seconds: float):
+    """List a finished stage among the request's completed stages"""
+    deadline = _active()
+    if deadline is not None:
+        deadline.complete(stage, seconds)
+
+
+def record(stage: str, seconds: float):
+    """Add a finished stage to the stage metrics and the request's completed stages"""
+    metrics.observe("stage_duration_seconds", seconds, stage=stage)
+    completed(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time the block as stage `name` (stage_duration_seconds), checking the
+    deadline first and listing the stage as completed if it succeeds.
+    """
+    check(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage=name)
+        raise
+    record(name, time.perf_counter() - started)
+
+
+async def wait(awaitable: Awaitable[T], stage: str) -> T:
+    """Await within the remaining budget, raising DeadlineExceeded when it runs out"""
+    deadline = _active()
+    if deadline is None:
+        return await awaitable
+    check(stage)
+    try:
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except asyncio.TimeoutError:
+        if deadline.remaining() > 0:
+            raise
+        raise DeadlineExceeded(deadline, stage)
+
+
+def attempt_timeout(timeout: float, stage: str = "llm") -> float:
+    """
+    Timeout for one upstream attempt: timeout, cut down to what is left of
+    the budget. Raises DeadlineExceeded when too little is left to start one.
+    """
+    deadline = _active()
+    if deadline is None:
+        return timeout
+    left = deadline.remaining()
+    if left < DEADLINE_MIN_ATTEMPT_SECONDS:
+        raise DeadlineExceeded(deadline, stage)
+    return min(timeout, left)
+
+
+@contextmanager
+def item():
+    """
+    Give one item of a streamed response (a video in a batch, a pattern in
+    a fan-out) a budget of its own, the same size as the request's. The
+    request-wide budget would otherwise be shared by all of them, cutting
+    off the items that happen to run last.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        yield
+        return
+    token = _current.set(Deadline(deadline.budget))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def shared() -> Optional[Deadline]:
+    """
+    A deadline for work shared between requests (a coalesced LLM call or
+    YouTube fetch), starting as what is left of the caller's budget. join()
+    stretches it for every request that waits on the work later, so it only
+    runs out once no waiter has time left. None if the caller has no deadline.
+    """
+    deadline = _active()
+    if deadline is None:
+        return None
+    budget = Deadline(deadline.remaining())
+    budget.shared = True
+    return budget
+
+
+def join(budget: Optional[Deadline]):
+    """Extend a shared() deadline to the end of the calling request's deadline"""
+    if budget is None:
+        return
+    deadline = _active()
+    if deadline is None:
+        # A waiter without a deadline: the work may take as long as it needs
+        budget.lifted = True
+    else:
+        budget.expires_at = max(budget.expires_at, deadline.expires_at)
+
+
+def context(deadline: Optional[Deadline]) -> Context:
+    """A fresh context carrying only deadline, for a task that must not inherit its creator's"""
+    ctx = Context()
+    ctx.run(_current.set, deadline)
+    return ctx
+
+
+def _requested_budget(scope) -> Optional[float]:
+    """Budget from the X-Request-Timeout header, capped at REQUEST_DEADLINE_MAX"""
+    for name, value in scope.get("headers", []):
+        if name == TIMEOUT_HEADER.encode():
+            try:
+                budget = float(value.decode("latin-1"))
+            except ValueError:
+                return None
+            if budget > 0:
+                return min(budget, REQUEST_DEADLINE_MAX)
+            return None
+    return None
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware starting each request's deadline.
+
+    The budget is the X-Request-Timeout request header (seconds) when
+    present, REQUEST_DEADLINE otherwise. It covers the time until the
+    response starts; a streamed body (SSE tokens, batch and fan-out lines)
+    is then limited per model attempt and per item (see item()) instead.
+    Responses carry the effective budget in X-Request-Timeout and what was
+    left of it when the response started in X-Deadline-Remaining, so
+    clients and upstream proxies can line their own timeouts up with ours.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = _requested_budget(scope) or REQUEST_DEADLINE
+        if budget <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(budget)
+
+        async def send_with_deadline(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((TIMEOUT_HEADER.encode(), f"{deadline.budget:g}".encode()))
+                headers.append((REMAINING_HEADER.encode(), f"{deadline.remaining():.3f}".encode()))
+                message = {**message, "headers": headers}
+                deadline.lifted = True
+            await send(message)
+
+        token = _current.set(deadline)
+        try:
+            await self.app(scope, receive, send_with_deadline)
+        finally:
+            _current.reset(token)
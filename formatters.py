@@ -0,0 +1,131 @@
+import json
+from typing import Callable, Dict, Iterator, Tuple
+
+from packed_transcript import PackedTranscript
+
+# Number of cues joined into each chunk handed to StreamingResponse. Sending one
+# ASGI message per cue would dominate the cost for multi-hour transcripts.
+CUES_PER_CHUNK = 512
+
+
+def _whole_seconds(seconds: float) -> int:
+    """
+    Whole seconds after rounding to microseconds, as timedelta(seconds=...)
+    did in the original formatters (59.9999996 -> 60), without building one.
+    """
+    return round(seconds * 1_000_000) // 1_000_000
+
+
+def _split_ms(seconds: float) -> Tuple[int, int, int, int]:
+    """
+    Split seconds into (hours, minutes, seconds, milliseconds).
+
+    Milliseconds are truncated, not rounded, so srt/vtt output stays byte
+    for byte what these endpoints have always returned.
+    """
+    total_secs = _whole_seconds(seconds)
+    millis = int((seconds - int(seconds)) * 1000)
+    hours, rem = divmod(total_secs, 3600)
+    minutes, secs = divmod(rem, 60)
+    return hours, minutes, secs, millis
+
+
+def format_timestamp(seconds: float) -> str:
+    """Convert seconds to HH:MM:SS or MM:SS format"""
+    total_secs = _whole_seconds(seconds)
+    hours, rem = divmod(total_secs, 3600)
+    minutes, secs = divmod(rem, 60)
+
+    if hours > 0:
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def format_srt_timestamp(seconds: float) -> str:
+    """Convert seconds to SRT timestamp format (HH:MM:SS,mmm)"""
+    hours, minutes, secs, millis = _split_ms(seconds)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def format_vtt_timestamp(seconds: float) -> str:
+    """Convert seconds to WebVTT timestamp format (HH:MM:SS.mmm)"""
+    hours, minutes, secs, millis = _split_ms(seconds)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def format_sbv_timestamp(seconds: float) -> str:
+    """Convert seconds to YouTube SBV timestamp format (H:MM:SS.mmm)"""
+    hours, minutes, secs, millis = _split_ms(seconds)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def iter_text(transcript: PackedTranscript) -> Iterator[str]:
+    """Yield transcript lines as plain text with timestamps"""
+    separator = ""
+    for text, start, _ in transcript.rows():
+        yield f"{separator}[{format_timestamp(start)}] {text}"
+        separator = "\n"
+
+
+def iter_srt(transcript: PackedTranscript) -> Iterator[str]:
+    """Yield transcript cues in SRT subtitle format"""
+    separator = ""
+    for i, (text, start, duration) in enumerate(transcript.rows(), start=1):
+        yield (
+            f"{separator}{i}\n"
+            f"{format_srt_timestamp(start)} --> {format_srt_timestamp(start + duration)}\n"
+            f"{text}\n"
+        )
+        separator = "\n"
+
+
+def iter_vtt(transcript: PackedTranscript) -> Iterator[str]:
+    """Yield transcript cues in WebVTT subtitle format"""
+    yield "WEBVTT\n\n"
+    separator = ""
+    for text, start, duration in transcript.rows():
+        yield (
+            f"{separator}{format_vtt_timestamp(start)} --> {format_vtt_timestamp(start + duration)}\n"
+            f"{text}\n"
+        )
+        separator = "\n"
+
+
+def iter_sbv(transcript: PackedTranscript) -> Iterator[str]:
+    """Yield transcript cues in YouTube SBV subtitle format"""
+    separator = ""
+    for text, start, duration in transcript.rows():
+        yield (
+            f"{separator}{format_sbv_timestamp(start)},{format_sbv_timestamp(start + duration)}\n"
+            f"{text}\n"
+        )
+        separator = "\n"
+
+
+def iter_ndjson(transcript: PackedTranscript) -> Iterator[str]:
+    """Yield one JSON object per cue, newline-delimited"""
+    dumps = json.dumps
+    for text, start, duration in transcript.rows():
+        yield dumps({"text": text, "start": start, "duration": duration}) + "\n"
+
+
+def chunked(pieces: Iterator[str], size: int = CUES_PER_CHUNK) -> Iterator[str]:
+    """Join consecutive pieces into larger chunks for efficient streaming"""
+    batch = []
+    for piece in pieces:
+        batch.append(piece)
+        if len(batch) >= size:
+            yield "".join(batch)
+            batch.clear()
+    if batch:
+        yield "".join(batch)
+
+
+# Output format -> (generator, media type) for /transcript/{video_id}?format=...
+TRANSCRIPT_FORMATS: Dict[str, Tuple[Callable[[PackedTranscript], Iterator[str]], str]] = {
+    "text": (iter_text, "text/plain"),
+    "srt": (iter_srt, "text/plain"),
+    "vtt": (iter_vtt, "text/plain"),
+    "sbv": (iter_sbv, "text/plain"),
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+}
@@ -0,0 +1,505 @@
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+import metrics
+
+# Background jobs are stored here, so queued and finished jobs survive restarts
+# and every worker process shares one queue
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs.sqlite3")
+)
+# Jobs run at once per worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs accepted while this many are waiting; further submissions get a 503
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+# Attempts per job; transient failures (5xx, timeouts) are retried after
+# JOB_RETRY_BACKOFF seconds, doubling each time
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "15"))
+# Seconds a single attempt may run
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))
+# A running job whose worker stops renewing its lease for this long (crash,
+# restart) is picked up again by another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Idle workers check for new or retryable jobs this often
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Finished jobs and their results are deleted after this long
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", str(7 * 86400)))
+# Completion webhooks: timeout and delivery attempts
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))
+JOB_WEBHOOK_ATTEMPTS = int(os.getenv("JOB_WEBHOOK_ATTEMPTS", "3"))
+# Comma-separated host names webhooks may be sent to. Empty allows any host
+# that resolves to public addresses only; loopback, private, link-local and
+# reserved addresses are always refused
+JOB_WEBHOOK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    webhook_url TEXT,
+    webhook_status TEXT,
+    owner TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, available_at);
+"""
+
+# Terminal states
+FINISHED = ("succeeded", "failed", "cancelled")
+
+# kind -> coroutine function taking the job's params and returning its result
+handlers: Dict[str, Callable[[dict], Awaitable[Any]]] = {}
+
+# Identifies this process's claims, so its lease renewals don't touch other workers' jobs
+OWNER = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_local = threading.local()
+_wakeup: Optional[asyncio.Event] = None
+_tasks = []
+
+stats = {"submitted": 0, "succeeded": 0, "failed": 0, "retried": 0, "recovered": 0, "webhooks_failed": 0}
+
+
+def register(kind: str, handler: Callable[[dict], Awaitable[Any]]):
+    handlers[kind] = handler
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection, creating the database on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOBS_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _job_dict(row: sqlite3.Row) -> dict:
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "params": json.loads(row["params"]),
+        "priority": row["priority"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+        "wait_seconds": round(row["started_at"] - row["created_at"], 3) if row["started_at"] else None,
+        "error": row["error"],
+        "webhook_status": row["webhook_status"],
+        "result": json.loads(row["result"]) if row["result"] else None
+    }
+
+
+def _public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _resolve_webhook_url(url: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Return (problem, address): why the server must not POST to url, or the
+    address to send it to (blocking - resolves the host). Every address the
+    host resolves to has to be public, so a webhook can't reach the metadata
+    service, localhost or the internal network.
+    """
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        return "webhook_url is not a valid URL", None
+    if parts.scheme not in ("http", "https") or not host:
+        return "webhook_url must be an http(s) URL", None
+    if JOB_WEBHOOK_ALLOWED_HOSTS and host.lower() not in JOB_WEBHOOK_ALLOWED_HOSTS:
+        return f"webhook_url host '{host}' is not in JOB_WEBHOOK_ALLOWED_HOSTS", None
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port or 443, proto=socket.IPPROTO_TCP)]
+    except (socket.gaierror, UnicodeError):
+        return f"webhook_url host '{host}' could not be resolved", None
+    blocked = sorted({address for address in addresses if not _public_address(address)})
+    if blocked:
+        return f"webhook_url host '{host}' resolves to a non-public address ({blocked[0]})", None
+    return None, addresses[0]
+
+
+def _check_webhook_url(url: str) -> Optional[str]:
+    """Return why the server must not POST to url, or None if it may (blocking)"""
+    return _resolve_webhook_url(url)[0]
+
+
+def _pinned_request(url: str, address: str) -> Tuple[httpx.URL, dict, dict]:
+    """
+    URL, headers and extensions that POST to url at the checked address,
+    so the connection can't go to whatever the host resolves to next (DNS
+    rebinding). The Host header and, for https, the TLS server name (SNI and
+    certificate check) stay the original host's.
+    """
+    original = httpx.URL(url)
+    extensions = {"sni_hostname": original.host} if original.scheme == "https" else {}
+    return original.copy_with(host=address.split("%", 1)[0]), {"Host": original.netloc.decode("ascii")}, extensions
+
+
+def _insert(kind: str, params: dict, priority: int, webhook_url: Optional[str]) -> Optional[dict]:
+    conn = _connect()
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= JOB_MAX_QUEUED:
+            conn.execute("ROLLBACK")
+            return None
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, priority, status, max_attempts, webhook_url, created_at, available_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params), priority, JOB_MAX_ATTEMPTS, webhook_url, now, now)
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return _get(job_id)
+
+
+async def submit(kind: str, params: dict, priority: int = 0, webhook_url: Optional[str] = None) -> dict:
+    """
+    Queue a job and return it. Raises HTTPException 400 for an unknown
+    kind or a webhook_url that may not be called, and 503 (with
+    Retry-After) when the queue is full.
+    """
+    if kind not in handlers:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind '{kind}'. Must be one of: {', '.join(sorted(handlers))}")
+    if webhook_url:
+        problem = await run_in_threadpool(_check_webhook_url, webhook_url)
+        if problem:
+            raise HTTPException(status_code=400, detail=problem)
+    job = await run_in_threadpool(_insert, kind, params, priority, webhook_url)
+    if job is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Job queue is full ({JOB_MAX_QUEUED} jobs waiting). Please try again later.",
+            headers={"Retry-After": "30"}
+        )
+    stats["submitted"] += 1
+    if _wakeup is not None:
+        _wakeup.set()
+    return job
+
+
+def _get(job_id: str) -> Optional[dict]:
+    row = _connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_dict(row) if row else None
+
+
+async def get(job_id: str) -> Optional[dict]:
+    return await run_in_threadpool(_get, job_id)
+
+
+def _cancel(job_id: str) -> Optional[dict]:
+    """Cancel a queued job; running and finished jobs are left alone"""
+    _connect().execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+        (time.time(), job_id)
+    )
+    return _get(job_id)
+
+
+async def cancel(job_id: str) -> Optional[dict]:
+    return await run_in_threadpool(_cancel, job_id)
+
+
+def _claim() -> Optional[dict]:
+    """
+    Atomically take the best available job: highest priority first, then
+    oldest. Running jobs whose lease expired (their worker died) are
+    taken over too, unless they have used up their attempts.
+    """
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            """
+            SELECT * FROM jobs
+            WHERE (status = 'queued' AND available_at <= ?)
+               OR (status = 'running' AND lease_until < ?)
+            ORDER BY priority DESC, available_at
+            LIMIT 1
+            """,
+            (now, now)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        recovered = row["status"] == "running"
+        if recovered and row["attempts"] >= row["max_attempts"]:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, owner = NULL, lease_until = NULL WHERE id = ?",
+                (f"Worker stopped while running attempt {row['attempts']}", now, row["id"])
+            )
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, attempts = attempts + 1, "
+            "started_at = COALESCE(started_at, ?) WHERE id = ?",
+            (OWNER, now + JOB_LEASE_SECONDS, now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return {**dict(row), "attempts": row["attempts"] + 1, "recovered": recovered}
+
+
+def _finish(job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+    _connect().execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, owner = NULL, lease_until = NULL "
+        "WHERE id = ? AND owner = ?",
+        (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, OWNER)
+    )
+
+
+def _requeue(job_id: str, delay: float, error: str):
+    _connect().execute(
+        "UPDATE jobs SET status = 'queued', available_at = ?, error = ?, owner = NULL, lease_until = NULL "
+        "WHERE id = ? AND owner = ?",
+        (time.time() + delay, error, job_id, OWNER)
+    )
+
+
+def _renew_leases():
+    _connect().execute(
+        "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+        (time.time() + JOB_LEASE_SECONDS, OWNER)
+    )
+
+
+def _set_webhook_status(job_id: str, status: str):
+    _connect().execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+
+
+def _prune():
+    _connect().execute(
+        f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED))}) AND finished_at < ?",
+        (*FINISHED, time.time() - JOB_RESULT_TTL)
+    )
+
+
+def _retryable(error: BaseException) -> bool:
+    """Upstream trouble is worth another attempt; bad input (4xx) is not"""
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
+
+
+def _describe(error: BaseException) -> str:
+    if isinstance(error, HTTPException):
+        return f"HTTP {error.status_code}: {error.detail}"
+    if isinstance(error, asyncio.TimeoutError):
+        return f"Timed out after {JOB_TIMEOUT:.0f}s"
+    return f"{type(error).__name__}: {str(error)}"
+
+
+async def _deliver_webhook(job_id: str, url: str):
+    job = await get(job_id)
+    payload = {key: job[key] for key in ("job_id", "kind", "status", "params", "attempts", "error", "result")}
+    delay = 1.0
+    # Redirects are not followed, so a receiver can't bounce the POST to an internal address
+    async with httpx.AsyncClient(timeout=JOB_WEBHOOK_TIMEOUT) as client:
+        for attempt in range(1, JOB_WEBHOOK_ATTEMPTS + 1):
+            # Checked again before every delivery: DNS may point somewhere else by now.
+            # The POST then goes to the address that was checked, not to a fresh lookup.
+            problem, address = await run_in_threadpool(_resolve_webhook_url, url)
+            if problem:
+                stats["webhooks_failed"] += 1
+                print(f"Webhook for job {job_id} blocked: {problem}")
+                await run_in_threadpool(_set_webhook_status, job_id, f"blocked ({problem})")
+                return
+            pinned_url, headers, extensions = _pinned_request(url, address)
+            try:
+                response = await client.post(pinned_url, json=payload, headers=headers, extensions=extensions)
+                if response.status_code < 400:
+                    await run_in_threadpool(_set_webhook_status, job_id, f"delivered ({response.status_code})")
+                    return
+                status = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if attempt < JOB_WEBHOOK_ATTEMPTS:
+                await asyncio.sleep(delay)
+                delay *= 2
+    stats["webhooks_failed"] += 1
+    print(f"Webhook for job {job_id} failed: {status}")
+    await run_in_threadpool(_set_webhook_status, job_id, f"failed ({status})")
+
+
+async def _run(row: dict):
+    job_id, kind = row["id"], row["kind"]
+    if row["recovered"]:
+        stats["recovered"] += 1
+        print(f"Job {job_id} was abandoned by its worker, running it again")
+    else:
+        metrics.observe("job_wait_seconds", time.time() - row["available_at"], kind=kind)
+
+    started = time.perf_counter()
+    handler = handlers.get(kind)
+    try:
+        if handler is None:
+            raise HTTPException(status_code=400, detail=f"No handler for job kind '{kind}'")
+        result = await asyncio.wait_for(handler(json.loads(row["params"])), timeout=JOB_TIMEOUT)
+    except Exception as e:
+        metrics.observe("job_run_seconds", time.perf_counter() - started, kind=kind, status="error")
+        error = _describe(e)
+        if _retryable(e) and row["attempts"] < row["max_attempts"]:
+            delay = JOB_RETRY_BACKOFF * 2 ** (row["attempts"] - 1)
+            print(f"Job {job_id} ({kind}) failed, retrying in {delay:.0f}s: {error}")
+            stats["retried"] += 1
+            await run_in_threadpool(_requeue, job_id, delay, error)
+            return
+        print(f"Job {job_id} ({kind}) failed: {error}")
+        stats["failed"] += 1
+        metrics.inc("jobs_finished_total", kind=kind, status="failed")
+        await run_in_threadpool(_finish, job_id, "failed", None, error)
+    else:
+        metrics.observe("job_run_seconds", time.perf_counter() - started, kind=kind, status="success")
+        stats["succeeded"] += 1
+        metrics.inc("jobs_finished_total", kind=kind, status="succeeded")
+        await run_in_threadpool(_finish, job_id, "succeeded", result)
+
+    if row["webhook_url"]:
+        await _deliver_webhook(job_id, row["webhook_url"])
+
+
+async def _worker():
+    while True:
+        try:
+            row = await run_in_threadpool(_claim)
+        except Exception as e:
+            print(f"Could not claim a job: {str(e)}")
+            row = None
+        if row is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+        metrics.gauge_add("jobs_running", 1, kind=row["kind"])
+        try:
+            await _run(row)
+        finally:
+            metrics.gauge_add("jobs_running", -1, kind=row["kind"])
+
+
+async def _housekeeping():
+    """Renew this worker's leases and prune old jobs"""
+    last_prune = 0.0
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            await run_in_threadpool(_renew_leases)
+            if time.time() - last_prune > 3600:
+                await run_in_threadpool(_prune)
+                last_prune = time.time()
+        except Exception as e:
+            print(f"Job housekeeping failed: {str(e)}")
+
+
+async def start():
+    """Start the worker pool (call from the app lifespan)"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    await run_in_threadpool(_prune)
+    _tasks.append(asyncio.create_task(_housekeeping()))
+    for _ in range(JOB_WORKERS):
+        _tasks.append(asyncio.create_task(_worker()))
+
+
+async def stop():
+    """
+    Stop the workers. Jobs they were running stay 'running' until their
+    lease expires and are then picked up again, by this or another worker.
+    """
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+
+def queue_metrics():
+    """Queue depth from the shared database (see metrics.register_global_collector)"""
+    for status, count in _connect().execute(
+        "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+    ).fetchall():
+        yield "jobs_in_queue", {"status": status}, count
+
+
+metrics.register_global_collector(queue_metrics)
+
+
+def _queue_stats() -> dict:
+    conn = _connect()
+    now = time.time()
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    oldest = conn.execute(
+        "SELECT MIN(available_at) FROM jobs WHERE status = 'queued' AND available_at <= ?", (now,)
+    ).fetchone()[0]
+    waits = [
+        row[0] for row in conn.execute(
+            "SELECT started_at - created_at FROM jobs WHERE started_at IS NOT NULL ORDER BY started_at DESC LIMIT 200"
+        ).fetchall()
+    ]
+    waits.sort()
+    return {
+        "by_status": {status: counts.get(status, 0) for status in ("queued", "running", *FINISHED)},
+        "queue_depth": counts.get("queued", 0),
+        "oldest_queued_seconds": round(now - oldest, 1) if oldest else 0.0,
+        "recent_wait_seconds": {
+            "p50": round(waits[len(waits) // 2], 3) if waits else None,
+            "p95": round(waits[min(int(len(waits) * 0.95), len(waits) - 1)], 3) if waits else None,
+            "samples": len(waits)
+        }
+    }
+
+
+async def queue_stats() -> dict:
+    return {
+        **(await run_in_threadpool(_queue_stats)),
+        "workers_per_process": JOB_WORKERS,
+        "this_process": stats
+    }
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Tuple
+from fastapi.concurrency import run_in_threadpool
+
+import deadlines
+import metrics
+import shared_cache
+from cache import LRUCache, MISSING
+from singleflight import SingleFlight, SingleFlightStream
+
+# Cache settings - results are content-addressed, so a long TTL is safe
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 86400)))
+LLM_DISK_CACHE_DIR = os.getenv(
+    "LLM_DISK_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm")
+)
+LLM_DISK_CACHE_MAX_ENTRIES = int(os.getenv("LLM_DISK_CACHE_MAX_ENTRIES", "5000"))
+
+# Accepted values for the `cache` query parameter
+#   use     - serve from cache when possible, store fresh results
+#   refresh - always recompute and overwrite the cached entry
+#   bypass  - always recompute, never read or write the cache
+CACHE_MODE_PATTERN = "^(use|refresh|bypass)$"
+
+memory_cache = LRUCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+# Shared by all worker processes (see shared_cache.CACHE_BACKEND)
+disk_cache = shared_cache.open_cache("llm", LLM_DISK_CACHE_DIR, LLM_DISK_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+
+stats = {"hits": 0, "misses": 0, "refreshes": 0, "bypasses": 0}
+
+# Identical LLM calls in flight at the same time share one upstream request
+flights = SingleFlight()
+stream_flights = SingleFlightStream()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def result_key(transcript_text: str, system_prompt: str, model: str) -> str:
+    """
+    Build a content-addressed cache key.
+
+    Editing a pattern's system.md changes the prompt hash, so stale results
+    are never served after a prompt change.
+    """
+    return f"llm:{model}:{content_hash(system_prompt)}:{content_hash(transcript_text)}"
+
+
+def _disk_lookup(key: str):
+    """Look a key up on disk, promoting hits into the memory tier"""
+    entry = disk_cache.get(key)
+    if entry is not MISSING:
+        memory_cache.set(key, entry)
+    return entry
+
+
+def _store(key: str, entry: dict):
+    memory_cache.set(key, entry)
+    disk_cache.set(key, entry)
+
+
+def _flight_key(key: str, mode: str) -> str:
+    # Bypass requests don't write the cache, so they never share a flight with ones that do
+    return f"{key}:nostore" if mode == "bypass" else key
+
+
+async def _compute_and_store(key: str, compute: Callable[[], Awaitable[dict]], store: bool) -> dict:
+    result = await compute()
+    if store:
+        await run_in_threadpool(_store, key, {"result": result, "created_at": time.time()})
+    return result
+
+
+async def _lookup_result(key: str):
+    entry = await run_in_threadpool(_disk_lookup, key)
+    return entry if entry is MISSING else entry["result"]
+
+
+async def _compute_once(key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+    # A worker computing the same key stores the result in the shared tier; wait for that instead
+    return await shared_cache.coalesce(
+        key,
+        lambda: _lookup_result(key),
+        lambda: _compute_and_store(key, compute, True),
+        kind="llm_call"
+    )
+
+
+async def get_or_compute(
+    key: str,
+    compute: Callable[[], Awaitable[dict]],
+    mode: str = "use"
+) -> dict:
+    """
+    Return the cached result for key, or await compute() and cache it.
+
+    The returned dict is the computed result plus 'cached' (bool) and
+    'cache_age_seconds' (age of the served entry, 0 when freshly computed).
+    Concurrent misses for the same key await a single compute() call, in
+    this worker and (with the sqlite cache backend) across workers. Waiting
+    on it is bounded by each request's own deadline; the shared call runs
+    until the latest of its waiters' deadlines, so a caller with a short
+    deadline can't cut it short for the others, and fallbacks stop being
+    tried once nobody is left waiting.
+    """
+    if mode == "use":
+        entry = memory_cache.get(key)
+        if entry is MISSING:
+            entry = await run_in_threadpool(_disk_lookup, key)
+        if entry is not MISSING:
+            stats["hits"] += 1
+            return {
+                **entry["result"],
+                "cached": True,
+                "cache_age_seconds": round(time.time() - entry["created_at"], 1)
+            }
+        stats["misses"] += 1
+    elif mode == "refresh":
+        stats["refreshes"] += 1
+    else:
+        stats["bypasses"] += 1
+
+    started = time.perf_counter()
+    result = await deadlines.wait(
+        flights.do(
+            _flight_key(key, mode),
+            lambda: _compute_once(key, compute) if mode == "use" else _compute_and_store(key, compute, mode != "bypass")
+        ),
+        stage="llm"
+    )
+    deadlines.completed("llm", time.perf_counter() - started)
+
+    return {**result, "cached": False, "cache_age_seconds": 0}
+
+
+async def stream_with_cache(
+    key: str,
+    stream: Callable[[], AsyncIterator[Tuple[str, dict]]],
+    content_field: str,
+    mode: str = "use"
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streaming counterpart of get_or_compute.
+
+    A cache hit is replayed as a single "delta" event followed by "done".
+    On a miss the events from stream() are passed through and, once "done"
+    arrives, the accumulated text is stored under content_field so the
+    non-streaming endpoints can serve it too. Concurrent misses for the same
+    key share one upstream stream.
+    """
+    if mode == "use":
+        entry = memory_cache.get(key)
+        if entry is MISSING:
+            entry = await run_in_threadpool(_disk_lookup, key)
+        if entry is not MISSING:
+            stats["hits"] += 1
+            result = dict(entry["result"])
+            yield "delta", {"content": result.pop(content_field)}
+            yield "done", {
+                **result,
+                "cached": True,
+                "cache_age_seconds": round(time.time() - entry["created_at"], 1)
+            }
+            return
+        stats["misses"] += 1
+    elif mode == "refresh":
+        stats["refreshes"] += 1
+    else:
+        stats["bypasses"] += 1
+
+    events = stream_flights.subscribe(
+        _flight_key(key, mode),
+        lambda: _stream_and_store(key, stream, content_field, mode != "bypass")
+    )
+    async for event, data in events:
+        if event == "done":
+            data = {**data, "cached": False, "cache_age_seconds": 0}
+        yield event, data
+
+
+async def _stream_and_store(
+    key: str,
+    stream: Callable[[], AsyncIterator[Tuple[str, dict]]],
+    content_field: str,
+    store: bool
+) -> AsyncIterator[Tuple[str, dict]]:
+    parts = []
+    async for event, data in stream():
+        if event == "delta":
+            parts.append(data["content"])
+        elif event == "done" and store:
+            result = {content_field: "".join(parts), **data}
+            await run_in_threadpool(_store, key, {"result": result, "created_at": time.time()})
+        yield event, data
+
+
+def cache_metrics():
+    """Cache counters as metrics samples (see metrics.register_collector)"""
+    for result in ("hits", "misses", "refreshes", "bypasses"):
+        yield "llm_cache_requests_total", {"result": result}, stats[result]
+    yield "coalesced_requests_total", {"kind": "llm_call"}, flights.coalesced
+    yield "coalesced_requests_total", {"kind": "llm_stream"}, stream_flights.coalesced
+
+
+metrics.register_collector(cache_metrics)
+
+
+def cache_stats() -> dict:
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        "coalescing": flights.stats(),
+        "stream_coalescing": stream_flights.stats(),
+        "memory": memory_cache.stats(),
+        "disk": disk_cache.stats()
+    }
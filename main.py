@@ -1,19 +1,73 @@
+import asyncio
+import json
 import os
-import requests
-from datetime import timedelta
+import time
+import httpx
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import PlainTextResponse
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api.proxies import WebshareProxyConfig
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Tuple
 from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
+import admission
+import batch
+import chunking
+import compaction
+import deadlines
+import jobs
+import llm_cache
+import metrics
+import openrouter
+import retrieval
+import search_index
+import sessions
+import shared_cache
+import transcripts
+import youtube_search
+from formatters import TRANSCRIPT_FORMATS, chunked
+from model_router import hedge_budget, router as model_router
+from pattern_registry import registry as pattern_registry, watch_patterns, PATTERN_RELOAD_INTERVAL
+from tokens import estimate_tokens
+from packed_transcript import PackedTranscript
+from proxy_pool import pool as proxy_pool
+from transcripts import fetch_transcript
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Index all Fabric patterns once so requests never touch patterns/ on disk
+    pattern_registry.refresh()
+    watcher = asyncio.create_task(watch_patterns()) if PATTERN_RELOAD_INTERVAL > 0 else None
+    # Periodically publish this worker's metrics for /metrics to merge
+    metrics_flusher = metrics.start()
+    # Background job workers pick up queued jobs, including ones left over from before a restart
+    await jobs.start()
+    # Share model cooldowns with the other worker processes
+    router_sync = shared_cache.start()
+
+    yield
+
+    await jobs.stop()
+    if router_sync:
+        router_sync.cancel()
+    if watcher:
+        watcher.cancel()
+    if metrics_flusher:
+        metrics_flusher.cancel()
+        await metrics.flush()
+    # Release pooled OpenRouter and YouTube Data API connections on shutdown
+    await openrouter.close_client()
+    await youtube_search.close_client()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(admission.RateLimitMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(deadlines.DeadlineMiddleware)
 
 # Request/Response models for chat endpoint
 class ChatMessage(BaseModel):
@@ -24,6 +78,38 @@ class ChatRequest(BaseModel):
     message: str
     conversation_history: Optional[List[ChatMessage]] = []
 
+# Request models for server-side chat sessions
+class ChatSessionRequest(BaseModel):
+    languages: str = "en"
+    model: Optional[str] = None
+    compaction: str = Field(default=compaction.COMPACTION_LEVEL, pattern=compaction.COMPACTION_MODE_PATTERN)
+
+class ChatSessionMessage(BaseModel):
+    message: str
+
+# Request model for bulk transcript endpoint
+class BatchTranscriptRequest(BaseModel):
+    video_ids: List[str]
+    languages: str = "en"
+    format: str = "json"
+    concurrency: Optional[int] = None
+
+# Request model for background jobs (POST /jobs)
+class JobRequest(BaseModel):
+    kind: str
+    video_id: str
+    pattern_name: Optional[str] = None
+    languages: str = "en"
+    model: Optional[str] = None
+    cache: str = Field(default="use", pattern=llm_cache.CACHE_MODE_PATTERN)
+    chunking: str = Field(default="auto", pattern=chunking.CHUNKING_MODE_PATTERN)
+    compaction: str = Field(default=compaction.COMPACTION_LEVEL, pattern=compaction.COMPACTION_MODE_PATTERN)
+    hedge: Optional[bool] = None
+    start: Optional[float] = Field(default=None, ge=0)
+    end: Optional[float] = Field(default=None, ge=0)
+    priority: int = 0
+    webhook_url: Optional[str] = None
+
 # Get model name from environment variables
 # Default to Google Gemini 2.0 Flash (1M context window, most reliable availability)
 MODEL_NAME = os.getenv("model_id") or os.getenv("MODEL_ID") or "meta-llama/llama-3.3-70b-instruct:free"
@@ -38,196 +124,304 @@ FALLBACK_MODELS = [
     # "nvidia/nemotron-nano-9b-v2:free",  # 128k context, NVIDIA reliability
 ]
 
-# Initialize YouTube Transcript API with proxy support for Railway deployment
-def get_youtube_api():
-    """Create YouTubeTranscriptApi instance with optional proxy configuration"""
-    # Support multiple environment variable naming conventions
-    proxy_username = os.getenv("webshare_user") or os.getenv("WEBSHARE_PROXY_USERNAME")
-    proxy_password = os.getenv("webshare_pass") or os.getenv("WEBSHARE_PROXY_PASSWORD")
-
-    if proxy_username and proxy_password:
-        # Use Webshare rotating residential proxy with numbered username
-        # Webshare requires username-X format (e.g., opgdacdt-1)
-        if not proxy_username.endswith(tuple(f'-{i}' for i in range(1, 1000))):
-            proxy_username = f"{proxy_username}-1"
-
-        proxy_config = WebshareProxyConfig(
-            proxy_username=proxy_username,
-            proxy_password=proxy_password,
-        )
-        return YouTubeTranscriptApi(proxy_config=proxy_config)
-
-    # No proxy for local development
-    return YouTubeTranscriptApi()
-
-def format_timestamp(seconds: float) -> str:
-    """Convert seconds to HH:MM:SS or MM:SS format"""
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    secs = total_seconds % 60
-
-    if hours > 0:
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
-    return f"{minutes:02d}:{secs:02d}"
-
-def format_as_text(transcript_data: list) -> str:
-    """Format transcript as plain text with timestamps"""
-    lines = []
-    for entry in transcript_data:
-        timestamp = format_timestamp(entry['start'])
-        lines.append(f"[{timestamp}] {entry['text']}")
-    return "\n".join(lines)
-
-def format_as_srt(transcript_data: list) -> str:
-    """Format transcript as SRT subtitle format"""
-    srt_lines = []
-    for i, entry in enumerate(transcript_data, start=1):
-        start_time = format_srt_timestamp(entry['start'])
-        end_time = format_srt_timestamp(entry['start'] + entry['duration'])
-
-        srt_lines.append(f"{i}")
-        srt_lines.append(f"{start_time} --> {end_time}")
-        srt_lines.append(entry['text'])
-        srt_lines.append("")  # Empty line between entries
-
-    return "\n".join(srt_lines)
-
-def format_srt_timestamp(seconds: float) -> str:
-    """Convert seconds to SRT timestamp format (HH:MM:SS,mmm)"""
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    secs = total_seconds % 60
-    millis = int((seconds - int(seconds)) * 1000)
-
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
-
-def format_as_vtt(transcript_data: list) -> str:
-    """Format transcript as WebVTT subtitle format"""
-    vtt_lines = ["WEBVTT", ""]
-
-    for entry in transcript_data:
-        start_time = format_vtt_timestamp(entry['start'])
-        end_time = format_vtt_timestamp(entry['start'] + entry['duration'])
-
-        vtt_lines.append(f"{start_time} --> {end_time}")
-        vtt_lines.append(entry['text'])
-        vtt_lines.append("")  # Empty line between entries
-
-    return "\n".join(vtt_lines)
-
-def format_vtt_timestamp(seconds: float) -> str:
-    """Convert seconds to WebVTT timestamp format (HH:MM:SS.mmm)"""
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    secs = total_seconds % 60
-    millis = int((seconds - int(seconds)) * 1000)
-
-    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
-
-def call_openrouter_with_fallback(
+# Pattern prompts run at once by /transcript/{video_id}/patterns unless the request asks for fewer
+PATTERN_PARALLELISM = int(os.getenv("PATTERN_PARALLELISM", "3"))
+PATTERN_MAX_PARALLELISM = int(os.getenv("PATTERN_MAX_PARALLELISM", "8"))
+# Largest number of patterns accepted in one fan-out request
+PATTERN_FANOUT_MAX = int(os.getenv("PATTERN_FANOUT_MAX", "10"))
+
+async def call_openrouter_with_fallback(
     openrouter_api_key: str,
     transcript_text: str,
     preferred_model: str,
-    system_prompt: str
+    system_prompt: str,
+    cache_mode: str = "use",
+    chunking_mode: str = "auto",
+    hedge: Optional[bool] = None
 ) -> dict:
     """
     Call OpenRouter API with automatic fallback to alternative models if rate-limited.
     
     Tries preferred_model first, then falls back to FALLBACK_MODELS chain if rate-limited.
-    Returns: dict with 'summary' and 'model_used' keys
+    Transcripts too large for the model's context window are summarized with
+    map-reduce (see chunking). Results are cached by transcript, system prompt
+    and model (see llm_cache). hedge races a second model when the first is
+    slow (see openrouter.complete_with_fallback).
+    Returns: dict with 'summary', 'model_used', 'chunks', 'hedged', 'cached' and 'cache_age_seconds' keys
     """
-    # Build list of models to try: preferred first, then fallbacks
-    models_to_try = [preferred_model] if preferred_model not in FALLBACK_MODELS else []
-    models_to_try.extend(FALLBACK_MODELS)
-    
-    headers = {
-        "Authorization": f"Bearer {openrouter_api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/creativerezz/fastapi",
-        "X-Title": "Automatehub YouTube Summarizer"
+    key = llm_cache.result_key(transcript_text, system_prompt, preferred_model)
+    return await llm_cache.get_or_compute(
+        key,
+        lambda: _summarize_uncached(
+            openrouter_api_key, transcript_text, preferred_model, system_prompt, chunking_mode, hedge
+        ),
+        mode=cache_mode
+    )
+
+async def transcript_to_text(fetched_transcript, compaction_level: str = compaction.COMPACTION_LEVEL) -> Tuple[str, dict]:
+    """
+    Timestamped plain text of a transcript, as sent to the LLM endpoints,
+    compacted at compaction_level. Returns (text, compaction report).
+    """
+    with deadlines.stage("transcript_format"):
+        text, report = await compaction.compact_transcript(fetched_transcript, compaction_level)
+    metrics.inc("transcript_compaction_tokens_total", report["tokens_before"], level=compaction_level, stage="before")
+    metrics.inc("transcript_compaction_tokens_total", report["tokens_after"], level=compaction_level, stage="after")
+    return text, report
+
+def load_pattern(pattern_name: str):
+    """Look up a Fabric pattern as the request's pattern_load stage; None if it does not exist"""
+    with deadlines.stage("pattern_load"):
+        return pattern_registry.get(pattern_name)
+
+def slice_transcript(transcript: PackedTranscript, start: Optional[float], end: Optional[float]) -> PackedTranscript:
+    """Restrict a transcript to the start/end query parameters (seconds)"""
+    if start is None and end is None:
+        return transcript
+    if start is not None and end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be greater than start")
+    selected = transcript.between(start, end)
+    if not len(selected):
+        raise HTTPException(
+            status_code=404,
+            detail=f"No transcript cues between {start or 0:g}s and {'the end' if end is None else f'{end:g}s'}"
+        )
+    return selected
+
+def build_summary_messages(transcript_text: str, system_prompt: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": f"Summarize this transcript:\n\n{transcript_text}"
+        }
+    ]
+
+async def _summarize_uncached(
+    openrouter_api_key: str,
+    transcript_text: str,
+    preferred_model: str,
+    system_prompt: str,
+    chunking_mode: str = "auto",
+    hedge: Optional[bool] = None
+) -> dict:
+    use_chunking = chunking.should_chunk(chunking_mode, preferred_model, system_prompt, transcript_text)
+    fallback_models = chunking.usable_fallbacks(
+        FALLBACK_MODELS, preferred_model, system_prompt, transcript_text, use_chunking
+    )
+
+    if use_chunking:
+        result = await chunking.map_reduce(
+            openrouter_api_key=openrouter_api_key,
+            transcript_text=transcript_text,
+            system_prompt=system_prompt,
+            preferred_model=preferred_model,
+            fallback_models=fallback_models,
+            title="Automatehub YouTube Summarizer",
+            hedge=hedge
+        )
+    else:
+        result = await openrouter.complete_with_fallback(
+            openrouter_api_key=openrouter_api_key,
+            messages=build_summary_messages(transcript_text, system_prompt),
+            preferred_model=preferred_model,
+            fallback_models=fallback_models,
+            title="Automatehub YouTube Summarizer",
+            hedge=hedge
+        )
+
+    return {
+        "summary": result["content"],
+        "model_used": result["model_used"],
+        "usage": result["usage"],
+        "fallback_used": result["fallback_used"],
+        "hedged": result["hedged"],
+        "chunks": result.get("chunks", 1)
     }
-    
-    last_error = None
-    
-    for model in models_to_try:
-        try:
-            payload = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Summarize this transcript:\n\n{transcript_text}"
-                    }
-                ]
-            }
-            
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            
-            # If successful, return immediately
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "summary": result["choices"][0]["message"]["content"],
-                    "model_used": model,
-                    "usage": result.get("usage", {}),
-                    "fallback_used": model != preferred_model
-                }
-            
-            # If rate-limited (429), try next model
-            if response.status_code == 429:
-                print(f"Model {model} is rate-limited, trying next fallback...")
-                last_error = f"Rate limited: {model}"
-                continue
-            
-            # For other errors, raise immediately
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"OpenRouter API error with {model}: {response.text}"
+
+def stream_openrouter_with_fallback(
+    openrouter_api_key: str,
+    transcript_text: str,
+    preferred_model: str,
+    system_prompt: str,
+    cache_mode: str = "use",
+    chunking_mode: str = "auto",
+    hedge: Optional[bool] = None
+):
+    """
+    Streaming variant of call_openrouter_with_fallback.
+
+    Returns an async iterator of (event, data) tuples - see openrouter.stream_with_fallback.
+    """
+    use_chunking = chunking.should_chunk(chunking_mode, preferred_model, system_prompt, transcript_text)
+    fallback_models = chunking.usable_fallbacks(
+        FALLBACK_MODELS, preferred_model, system_prompt, transcript_text, use_chunking
+    )
+
+    def start_stream():
+        if use_chunking:
+            return chunking.stream_map_reduce(
+                openrouter_api_key=openrouter_api_key,
+                transcript_text=transcript_text,
+                system_prompt=system_prompt,
+                preferred_model=preferred_model,
+                fallback_models=fallback_models,
+                title="Automatehub YouTube Summarizer",
+                hedge=hedge
             )
-            
-        except requests.exceptions.Timeout:
-            print(f"Model {model} timed out, trying next fallback...")
-            last_error = f"Timeout: {model}"
-            continue
-        except HTTPException:
-            raise
+        return openrouter.stream_with_fallback(
+            openrouter_api_key=openrouter_api_key,
+            messages=build_summary_messages(transcript_text, system_prompt),
+            preferred_model=preferred_model,
+            fallback_models=fallback_models,
+            title="Automatehub YouTube Summarizer",
+            hedge=hedge
+        )
+
+    key = llm_cache.result_key(transcript_text, system_prompt, preferred_model)
+    return llm_cache.stream_with_cache(key, start_stream, content_field="summary", mode=cache_mode)
+
+def sse_event(event: str, data: dict) -> str:
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def sse_response(events, metadata: dict) -> StreamingResponse:
+    """
+    Relay (event, data) tuples to the client as Server-Sent Events.
+
+    The first event is awaited before the response starts, so failures that
+    happen before any token is produced (e.g. every model rate-limited) still
+    surface as regular HTTP errors. Waiting for it is bounded by the request's
+    deadline. metadata is merged into the final "done" event.
+    """
+    first = await deadlines.wait(events.__anext__(), stage="llm")
+
+    async def body():
+        event, data = first
+        try:
+            while True:
+                if event == "done":
+                    data = {**metadata, **data}
+                yield sse_event(event, data)
+                event, data = await events.__anext__()
+        except StopAsyncIteration:
+            pass
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
         except Exception as e:
-            print(f"Error with model {model}: {str(e)}, trying next fallback...")
-            last_error = f"Error with {model}: {str(e)}"
-            continue
-    
-    # If all models failed, raise error with details
-    raise HTTPException(
-        status_code=503,
-        detail=f"All models are currently unavailable. Last error: {last_error}. Please try again in a few minutes."
+            yield sse_event("error", {"detail": f"{type(e).__name__}: {str(e)}"})
+        finally:
+            # Close the upstream stream if the client disconnects early
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @app.get("/")
 async def root():
     return {"greeting": "Hello, World!", "message": "Welcome to FastAPI!"}
 
+@app.get("/admin/cache")
+async def cache_status():
+    """
+    Report cache sizes and hit/miss counters
+
+    Example: /admin/cache
+    """
+    # Most of these count rows in SQLite, so collect them off the event loop
+    return await run_in_threadpool(_cache_stats)
+
+def _cache_stats() -> dict:
+    return {
+        "transcripts": transcripts.cache_stats(),
+        "llm_results": llm_cache.cache_stats(),
+        "chat_sessions": sessions.stats(),
+        "retrieval_indexes": retrieval.stats(),
+        "compacted_transcripts": compaction.stats(),
+        "search_index": search_index.index_stats(),
+        "youtube_search": youtube_search.search_stats(),
+        "shared": shared_cache.shared_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus metrics, merged across all worker processes
+
+    Per-route request counts, latency histograms and in-flight gauges; time
+    spent fetching from YouTube, formatting transcripts and waiting on the
+    LLM; per-model OpenRouter latency, outcomes (429s, timeouts, errors) and
+    token usage; fallback and hedging rates; cache hits and misses.
+
+    Example: /metrics
+    """
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=false)")
+    return PlainTextResponse(
+        await run_in_threadpool(metrics.exposition, metrics.snapshot()),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/admin/router")
+async def router_status():
+    """
+    Report per-model health as seen by the model router: circuit state,
+    latency (EWMA, p50, p90), recent outcomes and remaining cooldown, plus
+    the hedging budget
+
+    Example: /admin/router
+    """
+    return {
+        "preferred_model": MODEL_NAME,
+        "fallback_models": FALLBACK_MODELS,
+        "models": model_router.snapshot(),
+        "hedging": hedge_budget.stats()
+    }
+
+@app.get("/admin/proxies")
+async def proxy_status():
+    """
+    Report the YouTube proxy pool: per-slot success rate, latency, load,
+    quarantine state and the last error
+
+    Example: /admin/proxies
+    """
+    return proxy_pool.snapshot()
+
+@app.get("/admin/admission")
+async def admission_status():
+    """
+    Report admission control: in-flight LLM attempts and YouTube requests,
+    queue depth, average slot hold time, rejections, and per-client rate
+    limiting
+
+    Example: /admin/admission
+    """
+    return admission.admission_stats()
+
 @app.get("/transcript/{video_id}")
 async def get_transcript(
     video_id: str,
     languages: str = "en",
     format: str = Query(
         default="json",
-        description="Output format: json, text, srt, or vtt"
+        description="Output format: json, text, srt, vtt, sbv, or ndjson"
+    ),
+    start: Optional[float] = Query(
+        default=None,
+        ge=0,
+        description="Only cues from this many seconds into the video"
+    ),
+    end: Optional[float] = Query(
+        default=None,
+        ge=0,
+        description="Only cues starting before this many seconds into the video"
     )
 ):
     """
@@ -236,54 +430,52 @@ async def get_transcript(
     Args:
         video_id: YouTube video ID (not full URL)
         languages: Comma-separated language codes (e.g., "en,de,es")
-        format: Output format - json (default), text, srt, or vtt
+        format: Output format - json (default), text, srt, vtt, sbv, or ndjson
+        start, end: Only return cues between these times (seconds); a cue still running at start is included
 
     Examples:
         /transcript/dQw4w9WgXcQ?languages=en&format=json
         /transcript/dQw4w9WgXcQ?format=text
         /transcript/dQw4w9WgXcQ?format=srt
         /transcript/dQw4w9WgXcQ?format=vtt
+        /transcript/dQw4w9WgXcQ?format=sbv
+        /transcript/dQw4w9WgXcQ?format=ndjson
+        /transcript/dQw4w9WgXcQ?start=60&end=120&format=srt
     """
     try:
-        ytt_api = get_youtube_api()
         language_list = [lang.strip() for lang in languages.split(",")]
 
-        # Fetch the transcript
-        fetched_transcript = ytt_api.fetch(video_id, languages=language_list)
-        transcript_data = fetched_transcript.to_raw_data()
+        # Fetch the transcript (served from cache when available)
+        fetched_transcript = slice_transcript(await fetch_transcript(video_id, language_list), start, end)
 
         # Return based on format
         format_lower = format.lower()
 
-        if format_lower == "text":
-            return PlainTextResponse(
-                content=format_as_text(transcript_data),
-                media_type="text/plain"
-            )
-        elif format_lower == "srt":
-            return PlainTextResponse(
-                content=format_as_srt(transcript_data),
-                media_type="text/plain"
-            )
-        elif format_lower == "vtt":
-            return PlainTextResponse(
-                content=format_as_vtt(transcript_data),
-                media_type="text/plain"
-            )
-        elif format_lower == "json":
-            return {
-                "video_id": fetched_transcript.video_id,
-                "language": fetched_transcript.language,
-                "language_code": fetched_transcript.language_code,
-                "is_generated": fetched_transcript.is_generated,
-                "transcript": transcript_data
-            }
-        else:
+        if format_lower == "json":
+            with metrics.timer("stage_duration_seconds", stage="transcript_format"):
+                return {
+                    "video_id": fetched_transcript.video_id,
+                    "language": fetched_transcript.language,
+                    "language_code": fetched_transcript.language_code,
+                    "is_generated": fetched_transcript.is_generated,
+                    "transcript": fetched_transcript.to_raw_data()
+                }
+
+        if format_lower not in TRANSCRIPT_FORMATS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid format '{format}'. Must be one of: json, text, srt, vtt"
+                detail=f"Invalid format '{format}'. Must be one of: json, {', '.join(TRANSCRIPT_FORMATS)}"
             )
 
+        # Stream subtitle/text formats cue by cue instead of building one large string
+        formatter, media_type = TRANSCRIPT_FORMATS[format_lower]
+        return StreamingResponse(
+            metrics.timed_iter(
+                chunked(formatter(fetched_transcript)), "stage_duration_seconds", stage="transcript_format"
+            ),
+            media_type=media_type
+        )
+
     except HTTPException:
         raise  # Re-raise HTTPException without modification
     except TranscriptsDisabled:
@@ -298,6 +490,90 @@ async def get_transcript(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching transcript: {str(e)}")
 
+@app.post("/transcripts/batch")
+async def get_transcripts_batch(request_body: BatchTranscriptRequest):
+    """
+    Fetch transcripts for many videos in one request, streamed as NDJSON
+
+    Videos are fetched concurrently and each result is written as one JSON
+    line as soon as it completes (in completion order - use "index" to map
+    back to the request). A failing video is reported inline with its
+    status code and does not abort the batch. The last line is a summary.
+
+    Request body:
+        {
+            "video_ids": ["dQw4w9WgXcQ", "jNQXAC9IVRw"],
+            "languages": "en,de",     // Optional, comma-separated (default: "en")
+            "format": "json",         // Optional: json, text, srt, vtt, sbv, or ndjson
+            "concurrency": 8          // Optional, capped at BATCH_MAX_CONCURRENCY
+        }
+
+    Each result line includes "queued_ms" (waiting for a concurrency slot)
+    and "elapsed_ms" (fetching) to help tune the concurrency limit.
+
+    Example:
+        POST /transcripts/batch
+        Body: {"video_ids": ["dQw4w9WgXcQ", "jNQXAC9IVRw"], "format": "text"}
+    """
+    video_ids = [video_id.strip() for video_id in request_body.video_ids if video_id.strip()]
+    if not video_ids:
+        raise HTTPException(status_code=400, detail="video_ids must contain at least one video ID")
+    if len(video_ids) > batch.BATCH_MAX_VIDEOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many video IDs ({len(video_ids)}). Maximum per batch is {batch.BATCH_MAX_VIDEOS}"
+        )
+
+    format_lower = request_body.format.lower()
+    if format_lower != "json" and format_lower not in TRANSCRIPT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format '{request_body.format}'. Must be one of: json, {', '.join(TRANSCRIPT_FORMATS)}"
+        )
+
+    concurrency = request_body.concurrency or batch.BATCH_CONCURRENCY
+    concurrency = max(1, min(concurrency, batch.BATCH_MAX_CONCURRENCY, len(video_ids)))
+
+    async def body():
+        async for result in batch.fetch_batch(video_ids, request_body.languages, format_lower, concurrency):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.get("/transcripts/search")
+async def search_transcripts(
+    q: str = Query(..., description='Search terms; use "double quotes" for phrases'),
+    page: int = Query(1, ge=1, description="Page number (1-based)"),
+    page_size: int = Query(10, ge=1, le=50, description="Videos per page"),
+    language: Optional[str] = Query(None, description="Only search transcripts in this language code")
+):
+    """
+    Full-text search across every transcript fetched through this API
+
+    Transcripts are added to a persistent SQLite FTS5 index whenever they
+    are fetched by any endpoint. Videos are ranked by BM25 over their
+    matching segments; each result lists its best hits with timestamps and
+    a highlighted snippet.
+
+    Args:
+        q: Search terms (all must match); "double quoted" text is a phrase query
+        page: Page number (default: 1)
+        page_size: Videos per page (default: 10, max: 50)
+        language: Restrict to one transcript language code (e.g. "en")
+
+    Examples:
+        /transcripts/search?q=pricing
+        /transcripts/search?q="machine learning" python&page=2
+    """
+    if not search_index.TRANSCRIPT_INDEX_ENABLED:
+        raise HTTPException(status_code=503, detail="Transcript index is disabled (TRANSCRIPT_INDEX_ENABLED=false)")
+    try:
+        return await run_in_threadpool(search_index.search, q, page, page_size, language)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching transcripts: {str(e)}")
+
 @app.get("/transcript/{video_id}/list")
 async def list_transcripts(video_id: str):
     """
@@ -309,8 +585,8 @@ async def list_transcripts(video_id: str):
     Example: /transcript/dQw4w9WgXcQ/list
     """
     try:
-        ytt_api = get_youtube_api()
-        transcript_list = ytt_api.list(video_id)
+        async with admission.youtube.slot():
+            transcript_list = await run_in_threadpool(proxy_pool.run, lambda api: api.list(video_id))
 
         transcripts = []
         for transcript in transcript_list:
@@ -326,6 +602,8 @@ async def list_transcripts(video_id: str):
             "available_transcripts": transcripts
         }
 
+    except HTTPException:
+        raise
     except VideoUnavailable:
         raise HTTPException(status_code=404, detail="Video not found or unavailable")
     except Exception as e:
@@ -338,6 +616,31 @@ async def summarize_transcript(
     model: str = Query(
         default=MODEL_NAME,
         description="OpenRouter model ID (use :free models from openrouter-free-llms.txt)"
+    ),
+    cache: str = Query(
+        default="use",
+        pattern=llm_cache.CACHE_MODE_PATTERN,
+        description="Result cache mode: use (default), refresh (recompute and store), or bypass"
+    ),
+    stream: bool = Query(
+        default=False,
+        description="Stream the response as Server-Sent Events"
+    ),
+    chunking_mode: str = Query(
+        default="auto",
+        alias="chunking",
+        pattern=chunking.CHUNKING_MODE_PATTERN,
+        description="Map-reduce long transcripts: auto (when the prompt exceeds the model's context window), on, or off"
+    ),
+    hedge: Optional[bool] = Query(
+        default=None,
+        description="Race the next fallback model when the first is slower than its p90 latency (default from HEDGE_ENABLED)"
+    ),
+    compaction_level: str = Query(
+        default=compaction.COMPACTION_LEVEL,
+        alias="compaction",
+        pattern=compaction.COMPACTION_MODE_PATTERN,
+        description="Transcript compaction before it is sent to the model: off, light, medium or aggressive (default from COMPACTION_LEVEL)"
     )
 ):
     """
@@ -347,6 +650,12 @@ async def summarize_transcript(
         video_id: YouTube video ID (not full URL)
         languages: Comma-separated language codes (default: "en")
         model: OpenRouter model identifier (default: google/gemini-2.0-flash-exp:free)
+        cache: Result cache mode - use (default), refresh, or bypass
+        stream: Stream tokens as Server-Sent Events ("delta" events, then a final "done" event with model and usage)
+        chunking: Map-reduce long transcripts - auto (default, when the prompt exceeds the model's context window), on, or off
+        hedge: Race the next fallback model when the first is slow; the response reports whether a hedge fired
+        compaction: Merge caption fragments into timestamped blocks and drop [Music], repeated caption text and fillers -
+                    off, light, medium or aggressive (default from COMPACTION_LEVEL); the response reports tokens before and after
 
     Available free models:
         - google/gemini-2.0-flash-exp:free (1M context) - DEFAULT
@@ -365,16 +674,12 @@ async def summarize_transcript(
                 detail="OPENROUTER_API_KEY environment variable not set"
             )
 
-        # Fetch the transcript
-        ytt_api = get_youtube_api()
+        # Fetch the transcript (served from cache when available)
         language_list = [lang.strip() for lang in languages.split(",")]
-        fetched_transcript = ytt_api.fetch(video_id, languages=language_list)
+        fetched_transcript = await fetch_transcript(video_id, language_list)
 
         # Convert transcript to plain text
-        transcript_text = "\n".join([
-            f"[{entry['start']:.2f}s] {entry['text']}"
-            for entry in fetched_transcript.to_raw_data()
-        ])
+        transcript_text, compaction_report = await transcript_to_text(fetched_transcript, compaction_level)
 
         # System prompt for summarization
         system_prompt = (
@@ -384,12 +689,35 @@ async def summarize_transcript(
             "Output only the summary, no explanations."
         )
 
+        if stream:
+            events = stream_openrouter_with_fallback(
+                openrouter_api_key=openrouter_api_key,
+                transcript_text=transcript_text,
+                preferred_model=model,
+                system_prompt=system_prompt,
+                cache_mode=cache,
+                chunking_mode=chunking_mode,
+                hedge=hedge
+            )
+            return await sse_response(
+                events,
+                {
+                    "video_id": video_id,
+                    "language": fetched_transcript.language,
+                    "transcript_length": len(fetched_transcript),
+                    "compaction": compaction_report
+                }
+            )
+
         # Call OpenRouter with automatic fallback
-        result = call_openrouter_with_fallback(
+        result = await call_openrouter_with_fallback(
             openrouter_api_key=openrouter_api_key,
             transcript_text=transcript_text,
             preferred_model=model,
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            cache_mode=cache,
+            chunking_mode=chunking_mode,
+            hedge=hedge
         )
 
         return {
@@ -397,11 +725,18 @@ async def summarize_transcript(
             "language": fetched_transcript.language,
             "model": result["model_used"],
             "summary": result["summary"],
-            "transcript_length": len(fetched_transcript.to_raw_data()),
+            "transcript_length": len(fetched_transcript),
+            "compaction": compaction_report,
             "usage": result.get("usage", {}),
-            "fallback_used": result.get("fallback_used", False)
+            "fallback_used": result.get("fallback_used", False),
+            "hedged": result.get("hedged", False),
+            "chunks": result.get("chunks", 1),
+            "cached": result["cached"],
+            "cache_age_seconds": result["cache_age_seconds"]
         }
 
+    except HTTPException:
+        raise
     except TranscriptsDisabled:
         raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
     except NoTranscriptFound:
@@ -411,7 +746,7 @@ async def summarize_transcript(
         )
     except VideoUnavailable:
         raise HTTPException(status_code=404, detail="Video not found or unavailable")
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="OpenRouter API request timed out")
     except Exception as e:
         import traceback
@@ -421,32 +756,44 @@ async def summarize_transcript(
         raise HTTPException(status_code=500, detail=error_details)
 
 @app.get("/patterns")
-async def list_patterns():
+async def list_patterns(
+    details: bool = Query(
+        default=False,
+        description="Include per-pattern metadata (size, estimated tokens, user.md presence)"
+    )
+):
     """
     List all available Fabric AI patterns
 
+    Args:
+        details: Include size_bytes, estimated_tokens and has_user_md for each pattern
+
     Returns:
         List of available pattern names that can be used with /transcript/{video_id}/pattern/{pattern_name}
     """
-    import os
-    patterns_dir = os.path.join(os.path.dirname(__file__), "patterns")
-    
-    try:
-        patterns = []
-        for item in sorted(os.listdir(patterns_dir)):
-            item_path = os.path.join(patterns_dir, item)
-            if os.path.isdir(item_path) and not item.startswith('.'):
-                # Check if it has a system.md file
-                system_file = os.path.join(item_path, "system.md")
-                if os.path.exists(system_file):
-                    patterns.append(item)
-        
-        return {
-            "total_patterns": len(patterns),
-            "patterns": patterns
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error listing patterns: {str(e)}")
+    patterns = pattern_registry.names()
+    response = {
+        "total_patterns": len(patterns),
+        "patterns": patterns
+    }
+    if details:
+        response["details"] = pattern_registry.metadata()
+    return response
+
+@app.get("/patterns/{pattern_name}")
+async def get_pattern(pattern_name: str):
+    """
+    Get metadata for a single Fabric pattern
+
+    Example: /patterns/extract_wisdom
+    """
+    pattern = pattern_registry.get(pattern_name)
+    if pattern is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Pattern '{pattern_name}' not found. Use GET /patterns to see available patterns."
+        )
+    return pattern.metadata()
 
 @app.get("/transcript/{video_id}/pattern/{pattern_name}")
 async def apply_pattern(
@@ -456,6 +803,41 @@ async def apply_pattern(
     model: str = Query(
         default=MODEL_NAME,
         description="OpenRouter model ID (use :free models from openrouter-free-llms.txt)"
+    ),
+    cache: str = Query(
+        default="use",
+        pattern=llm_cache.CACHE_MODE_PATTERN,
+        description="Result cache mode: use (default), refresh (recompute and store), or bypass"
+    ),
+    stream: bool = Query(
+        default=False,
+        description="Stream the response as Server-Sent Events"
+    ),
+    chunking_mode: str = Query(
+        default="auto",
+        alias="chunking",
+        pattern=chunking.CHUNKING_MODE_PATTERN,
+        description="Map-reduce long transcripts: auto (when the prompt exceeds the model's context window), on, or off"
+    ),
+    hedge: Optional[bool] = Query(
+        default=None,
+        description="Race the next fallback model when the first is slower than its p90 latency (default from HEDGE_ENABLED)"
+    ),
+    compaction_level: str = Query(
+        default=compaction.COMPACTION_LEVEL,
+        alias="compaction",
+        pattern=compaction.COMPACTION_MODE_PATTERN,
+        description="Transcript compaction before it is sent to the model: off, light, medium or aggressive (default from COMPACTION_LEVEL)"
+    ),
+    start: Optional[float] = Query(
+        default=None,
+        ge=0,
+        description="Only cues from this many seconds into the video"
+    ),
+    end: Optional[float] = Query(
+        default=None,
+        ge=0,
+        description="Only cues starting before this many seconds into the video"
     )
 ):
     """
@@ -466,17 +848,23 @@ async def apply_pattern(
         pattern_name: Name of the Fabric pattern to apply (e.g., 'extract_wisdom', 'create_summary', 'analyze_paper')
         languages: Comma-separated language codes (default: "en")
         model: OpenRouter model identifier
+        cache: Result cache mode - use (default), refresh, or bypass
+        stream: Stream tokens as Server-Sent Events ("delta" events, then a final "done" event with model and usage)
+        chunking: Map-reduce long transcripts - auto (default, when the prompt exceeds the model's context window), on, or off
+        hedge: Race the next fallback model when the first is slow; the response reports whether a hedge fired
+        compaction: Merge caption fragments into timestamped blocks and drop [Music], repeated caption text and fillers -
+                    off, light, medium or aggressive (default from COMPACTION_LEVEL); the response reports tokens before and after
+        start, end: Only apply the pattern to the part of the video between these times (seconds)
 
     Examples:
         /transcript/dQw4w9WgXcQ/pattern/extract_wisdom
         /transcript/VIDEO_ID/pattern/create_summary
         /transcript/VIDEO_ID/pattern/analyze_paper
         /transcript/VIDEO_ID/pattern/create_quiz
+        /transcript/VIDEO_ID/pattern/extract_wisdom?start=600&end=1200
 
     Use GET /patterns to see all available patterns
     """
-    import os
-    
     try:
         # Get OpenRouter API key
         openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
@@ -486,38 +874,52 @@ async def apply_pattern(
                 detail="OPENROUTER_API_KEY environment variable not set"
             )
 
-        # Load the pattern's system prompt
-        patterns_dir = os.path.join(os.path.dirname(__file__), "patterns")
-        pattern_dir = os.path.join(patterns_dir, pattern_name)
-        system_file = os.path.join(pattern_dir, "system.md")
-        
-        if not os.path.exists(system_file):
+        # Look up the pattern's system prompt in the in-memory registry
+        pattern = load_pattern(pattern_name)
+        if pattern is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"Pattern '{pattern_name}' not found. Use GET /patterns to see available patterns."
             )
-        
-        # Read the system prompt
-        with open(system_file, 'r', encoding='utf-8') as f:
-            system_prompt = f.read()
+        system_prompt = pattern.system_prompt
 
-        # Fetch the transcript
-        ytt_api = get_youtube_api()
+        # Fetch the transcript (served from cache when available)
         language_list = [lang.strip() for lang in languages.split(",")]
-        fetched_transcript = ytt_api.fetch(video_id, languages=language_list)
+        fetched_transcript = slice_transcript(await fetch_transcript(video_id, language_list), start, end)
 
         # Convert transcript to plain text
-        transcript_text = "\n".join([
-            f"[{entry['start']:.2f}s] {entry['text']}"
-            for entry in fetched_transcript.to_raw_data()
-        ])
+        transcript_text, compaction_report = await transcript_to_text(fetched_transcript, compaction_level)
+
+        if stream:
+            events = stream_openrouter_with_fallback(
+                openrouter_api_key=openrouter_api_key,
+                transcript_text=transcript_text,
+                preferred_model=model,
+                system_prompt=system_prompt,
+                cache_mode=cache,
+                chunking_mode=chunking_mode,
+                hedge=hedge
+            )
+            return await sse_response(
+                events,
+                {
+                    "video_id": video_id,
+                    "language": fetched_transcript.language,
+                    "pattern": pattern_name,
+                    "transcript_length": len(fetched_transcript),
+                    "compaction": compaction_report
+                }
+            )
 
         # Call OpenRouter with automatic fallback
-        result = call_openrouter_with_fallback(
+        result = await call_openrouter_with_fallback(
             openrouter_api_key=openrouter_api_key,
             transcript_text=transcript_text,
             preferred_model=model,
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            cache_mode=cache,
+            chunking_mode=chunking_mode,
+            hedge=hedge
         )
 
         return {
@@ -526,9 +928,14 @@ async def apply_pattern(
             "pattern": pattern_name,
             "model": result["model_used"],
             "result": result["summary"],  # Still called 'summary' in fallback function
-            "transcript_length": len(fetched_transcript.to_raw_data()),
+            "transcript_length": len(fetched_transcript),
+            "compaction": compaction_report,
             "usage": result.get("usage", {}),
-            "fallback_used": result.get("fallback_used", False)
+            "fallback_used": result.get("fallback_used", False),
+            "hedged": result.get("hedged", False),
+            "chunks": result.get("chunks", 1),
+            "cached": result["cached"],
+            "cache_age_seconds": result["cache_age_seconds"]
         }
 
     except HTTPException:
@@ -542,7 +949,7 @@ async def apply_pattern(
         )
     except VideoUnavailable:
         raise HTTPException(status_code=404, detail="Video not found or unavailable")
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="OpenRouter API request timed out")
     except Exception as e:
         import traceback
@@ -551,6 +958,211 @@ async def apply_pattern(
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=error_details)
 
+@app.get("/transcript/{video_id}/patterns")
+async def apply_patterns(
+    video_id: str,
+    names: str = Query(
+        ...,
+        description="Comma-separated Fabric pattern names, e.g. extract_wisdom,create_quiz,summarize"
+    ),
+    languages: str = "en",
+    model: str = Query(
+        default=MODEL_NAME,
+        description="OpenRouter model ID (use :free models from openrouter-free-llms.txt)"
+    ),
+    cache: str = Query(
+        default="use",
+        pattern=llm_cache.CACHE_MODE_PATTERN,
+        description="Result cache mode: use (default), refresh (recompute and store), or bypass"
+    ),
+    chunking_mode: str = Query(
+        default="auto",
+        alias="chunking",
+        pattern=chunking.CHUNKING_MODE_PATTERN,
+        description="Map-reduce long transcripts: auto (when the prompt exceeds the model's context window), on, or off"
+    ),
+    hedge: Optional[bool] = Query(
+        default=None,
+        description="Race the next fallback model when the first is slower than its p90 latency (default from HEDGE_ENABLED)"
+    ),
+    compaction_level: str = Query(
+        default=compaction.COMPACTION_LEVEL,
+        alias="compaction",
+        pattern=compaction.COMPACTION_MODE_PATTERN,
+        description="Transcript compaction before it is sent to the model: off, light, medium or aggressive (default from COMPACTION_LEVEL)"
+    ),
+    parallelism: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Pattern prompts run at once (default PATTERN_PARALLELISM, capped at PATTERN_MAX_PARALLELISM)"
+    )
+):
+    """
+    Apply several Fabric AI patterns to one YouTube transcript, streamed as NDJSON
+
+    The transcript is fetched and formatted once and the pattern prompts run
+    concurrently. Each pattern's result is written as one JSON line as soon
+    as it finishes, with its model, usage and timing. A pattern that fails is
+    reported inline with its status code; the others still complete. The
+    last line is a summary.
+
+    Args:
+        video_id: YouTube video ID (not full URL)
+        names: Comma-separated pattern names (see GET /patterns)
+        languages: Comma-separated language codes (default: "en")
+        model: OpenRouter model identifier
+        cache: Result cache mode - use (default), refresh, or bypass
+        chunking: Map-reduce long transcripts - auto (default), on, or off
+        hedge: Race the next fallback model when the first is slow
+        compaction: Merge caption fragments into timestamped blocks and drop [Music], repeated caption text and fillers -
+                    off, light, medium or aggressive (default from COMPACTION_LEVEL); the response reports tokens before and after
+        parallelism: Pattern prompts run at once
+
+    Example: /transcript/dQw4w9WgXcQ/patterns?names=extract_wisdom,create_quiz,summarize
+    """
+    # Get OpenRouter API key
+    openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+    if not openrouter_api_key:
+        raise HTTPException(
+            status_code=500,
+            detail="OPENROUTER_API_KEY environment variable not set"
+        )
+
+    # Resolve every pattern up front so a typo doesn't cost the other LLM calls
+    pattern_names = list(dict.fromkeys(name.strip() for name in names.split(",") if name.strip()))
+    if not pattern_names:
+        raise HTTPException(status_code=400, detail="names must contain at least one pattern name")
+    if len(pattern_names) > PATTERN_FANOUT_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many patterns ({len(pattern_names)}). Maximum per request is {PATTERN_FANOUT_MAX}"
+        )
+    patterns = {name: load_pattern(name) for name in pattern_names}
+    unknown = [name for name, pattern in patterns.items() if pattern is None]
+    if unknown:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Patterns not found: {', '.join(unknown)}. Use GET /patterns to see available patterns."
+        )
+    system_prompts = {name: pattern.system_prompt for name, pattern in patterns.items()}
+
+    try:
+        # Fetch and format the transcript once for all patterns
+        language_list = [lang.strip() for lang in languages.split(",")]
+        fetched_transcript = await fetch_transcript(video_id, language_list)
+    except HTTPException:
+        raise
+    except TranscriptsDisabled:
+        raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
+    except NoTranscriptFound:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No transcript found for languages: {languages}"
+        )
+    except VideoUnavailable:
+        raise HTTPException(status_code=404, detail="Video not found or unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching transcript: {str(e)}")
+
+    transcript_text, compaction_report = await transcript_to_text(fetched_transcript, compaction_level)
+
+    semaphore = asyncio.Semaphore(min(parallelism or PATTERN_PARALLELISM, PATTERN_MAX_PARALLELISM))
+    started = time.perf_counter()
+
+    async def run_pattern(pattern_name: str) -> dict:
+        async with semaphore:
+            pattern_started = time.perf_counter()
+            try:
+                # Each pattern gets the full budget once it has a slot
+                with deadlines.item():
+                    result = await call_openrouter_with_fallback(
+                        openrouter_api_key=openrouter_api_key,
+                        transcript_text=transcript_text,
+                        preferred_model=model,
+                        system_prompt=system_prompts[pattern_name],
+                        cache_mode=cache,
+                        chunking_mode=chunking_mode,
+                        hedge=hedge
+                    )
+                line = {
+                    "pattern": pattern_name,
+                    "status": "ok",
+                    "model": result["model_used"],
+                    "result": result["summary"],
+                    "usage": result.get("usage", {}),
+                    "fallback_used": result.get("fallback_used", False),
+                    "hedged": result.get("hedged", False),
+                    "chunks": result.get("chunks", 1),
+                    "cached": result["cached"],
+                    "cache_age_seconds": result["cache_age_seconds"]
+                }
+            except HTTPException as e:
+                line = {"pattern": pattern_name, "status": "error", "status_code": e.status_code, "detail": e.detail}
+            except httpx.TimeoutException:
+                line = {
+                    "pattern": pattern_name,
+                    "status": "error",
+                    "status_code": 504,
+                    "detail": "OpenRouter API request timed out"
+                }
+            except Exception as e:
+                print(f"Pattern application error ({pattern_name}): {type(e).__name__}: {str(e)}")
+                line = {
+                    "pattern": pattern_name,
+                    "status": "error",
+                    "status_code": 500,
+                    "detail": f"{type(e).__name__}: {str(e)}"
+                }
+            line["elapsed_ms"] = round((time.perf_counter() - pattern_started) * 1000, 1)
+            return line
+
+    async def body():
+        tasks = [asyncio.ensure_future(run_pattern(name)) for name in pattern_names]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                succeeded += line["status"] == "ok"
+                yield json.dumps(line) + "\n"
+        finally:
+            # Client went away: stop the remaining LLM calls
+            for task in tasks:
+                task.cancel()
+
+        yield json.dumps({
+            "summary": {
+                "video_id": video_id,
+                "language": fetched_transcript.language,
+                "transcript_length": len(fetched_transcript),
+                "compaction": compaction_report,
+                "patterns": len(pattern_names),
+                "succeeded": succeeded,
+                "failed": len(pattern_names) - succeeded,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+        }) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+# System prompt for /transcript/{video_id}/extract-wisdom
+EXTRACT_WISDOM_PROMPT = (
+    "You extract surprising, insightful, and interesting information from text content. "
+    "You are interested in insights related to the purpose and meaning of life, human flourishing, "
+    "the role of technology in the future of humanity, artificial intelligence, learning, and continuous improvement.\n\n"
+    "Extract from the content:\n"
+    "- SUMMARY (25 words with who is presenting and content discussed)\n"
+    "- IDEAS (20-50 items, exactly 16 words each)\n"
+    "- INSIGHTS (10-20 items, exactly 16 words each - refined versions of best ideas)\n"
+    "- QUOTES (15-30 exact quotes from input)\n"
+    "- HABITS (15-30 personal habits mentioned, exactly 16 words each)\n"
+    "- FACTS (15-30 facts about the world, exactly 16 words each)\n"
+    "- REFERENCES (all books, tools, projects mentioned)\n"
+    "- ONE-SENTENCE TAKEAWAY (exactly 15 words capturing essence)\n"
+    "- RECOMMENDATIONS (15-30 items, exactly 16 words each)\n\n"
+    "Output only Markdown. Use bulleted lists. No warnings or notes. "
+    "Do not repeat items. Do not start items with same words."
+)
+
 @app.get("/transcript/{video_id}/extract-wisdom")
 async def extract_wisdom(
     video_id: str,
@@ -558,6 +1170,25 @@ async def extract_wisdom(
     model: str = Query(
         default=MODEL_NAME,
         description="OpenRouter model ID (use :free models from openrouter-free-llms.txt)"
+    ),
+    cache: str = Query(
+        default="use",
+        pattern=llm_cache.CACHE_MODE_PATTERN,
+        description="Result cache mode: use (default), refresh (recompute and store), or bypass"
+    ),
+    stream: bool = Query(
+        default=False,
+        description="Stream the response as Server-Sent Events"
+    ),
+    hedge: Optional[bool] = Query(
+        default=None,
+        description="Race the next fallback model when the first is slower than its p90 latency (default from HEDGE_ENABLED)"
+    ),
+    compaction_level: str = Query(
+        default=compaction.COMPACTION_LEVEL,
+        alias="compaction",
+        pattern=compaction.COMPACTION_MODE_PATTERN,
+        description="Transcript compaction before it is sent to the model: off, light, medium or aggressive (default from COMPACTION_LEVEL)"
     )
 ):
     """
@@ -568,6 +1199,11 @@ async def extract_wisdom(
         video_id: YouTube video ID (not full URL)
         languages: Comma-separated language codes (default: "en")
         model: OpenRouter model identifier (default from env)
+        cache: Result cache mode - use (default), refresh, or bypass
+        stream: Stream tokens as Server-Sent Events ("delta" events, then a final "done" event with model and usage)
+        hedge: Race the next fallback model when the first is slow; the response reports whether a hedge fired
+        compaction: Merge caption fragments into timestamped blocks and drop [Music], repeated caption text and fillers -
+                    off, light, medium or aggressive (default from COMPACTION_LEVEL); the response reports tokens before and after
 
     Returns structured wisdom extraction with:
         - SUMMARY (25 words)
@@ -591,81 +1227,89 @@ async def extract_wisdom(
                 detail="OPENROUTER_API_KEY environment variable not set"
             )
 
-        # Fetch the transcript
-        ytt_api = get_youtube_api()
+        # Fetch the transcript (served from cache when available)
         language_list = [lang.strip() for lang in languages.split(",")]
-        fetched_transcript = ytt_api.fetch(video_id, languages=language_list)
+        fetched_transcript = await fetch_transcript(video_id, language_list)
 
         # Convert transcript to plain text
-        transcript_text = "\n".join([
-            f"[{entry['start']:.2f}s] {entry['text']}"
-            for entry in fetched_transcript.to_raw_data()
-        ])
-
-        # Prepare OpenRouter API request with extract_wisdom system prompt
-        headers = {
-            "Authorization": f"Bearer {openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/creativerezz/fastapi",
-            "X-Title": "FastAPI YouTube Transcript Wisdom Extractor"
-        }
+        transcript_text, compaction_report = await transcript_to_text(fetched_transcript, compaction_level)
+
+        messages = [
+            {"role": "system", "content": EXTRACT_WISDOM_PROMPT},
+            {"role": "user", "content": f"Extract wisdom from this content:\n\n{transcript_text}"}
+        ]
+        cache_key = llm_cache.result_key(transcript_text, EXTRACT_WISDOM_PROMPT, model)
+        # Same health-aware fallback chain as summarize and chat
+        fallback_models = chunking.usable_fallbacks(
+            FALLBACK_MODELS, model, EXTRACT_WISDOM_PROMPT, transcript_text, chunked=False
+        )
 
-        payload = {
-            "model": model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "You extract surprising, insightful, and interesting information from text content. "
-                        "You are interested in insights related to the purpose and meaning of life, human flourishing, "
-                        "the role of technology in the future of humanity, artificial intelligence, learning, and continuous improvement.\n\n"
-                        "Extract from the content:\n"
-                        "- SUMMARY (25 words with who is presenting and content discussed)\n"
-                        "- IDEAS (20-50 items, exactly 16 words each)\n"
-                        "- INSIGHTS (10-20 items, exactly 16 words each - refined versions of best ideas)\n"
-                        "- QUOTES (15-30 exact quotes from input)\n"
-                        "- HABITS (15-30 personal habits mentioned, exactly 16 words each)\n"
-                        "- FACTS (15-30 facts about the world, exactly 16 words each)\n"
-                        "- REFERENCES (all books, tools, projects mentioned)\n"
-                        "- ONE-SENTENCE TAKEAWAY (exactly 15 words capturing essence)\n"
-                        "- RECOMMENDATIONS (15-30 items, exactly 16 words each)\n\n"
-                        "Output only Markdown. Use bulleted lists. No warnings or notes. "
-                        "Do not repeat items. Do not start items with same words."
-                    )
-                },
+        if stream:
+            events = llm_cache.stream_with_cache(
+                cache_key,
+                lambda: openrouter.stream_with_fallback(
+                    openrouter_api_key=openrouter_api_key,
+                    messages=messages,
+                    preferred_model=model,
+                    fallback_models=fallback_models,
+                    title="FastAPI YouTube Transcript Wisdom Extractor",
+                    timeout=90,
+                    hedge=hedge
+                ),
+                content_field="wisdom",
+                mode=cache
+            )
+            return await sse_response(
+                events,
                 {
-                    "role": "user",
-                    "content": f"Extract wisdom from this content:\n\n{transcript_text}"
+                    "video_id": video_id,
+                    "language": fetched_transcript.language,
+                    "transcript_length": len(fetched_transcript),
+                    "compaction": compaction_report
                 }
-            ]
-        }
-
-        # Call OpenRouter API
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=90  # Longer timeout for wisdom extraction
-        )
+            )
 
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"OpenRouter API error: {response.text}"
+        # Call OpenRouter with the extract_wisdom system prompt (cached by content)
+        async def call_model() -> dict:
+            result = await openrouter.complete_with_fallback(
+                openrouter_api_key=openrouter_api_key,
+                messages=messages,
+                preferred_model=model,
+                fallback_models=fallback_models,
+                title="FastAPI YouTube Transcript Wisdom Extractor",
+                timeout=90,  # Longer timeout for wisdom extraction
+                hedge=hedge
             )
+            return {
+                "wisdom": result["content"],
+                "model_used": result["model_used"],
+                "usage": result["usage"],
+                "fallback_used": result["fallback_used"],
+                "hedged": result["hedged"]
+            }
 
-        result = response.json()
-        wisdom = result["choices"][0]["message"]["content"]
+        result = await llm_cache.get_or_compute(
+            cache_key,
+            call_model,
+            mode=cache
+        )
 
         return {
             "video_id": video_id,
             "language": fetched_transcript.language,
-            "model_used": model,
-            "wisdom": wisdom,
-            "transcript_length": len(fetched_transcript.to_raw_data()),
-            "usage": result.get("usage", {})
+            "model_used": result.get("model_used", model),
+            "wisdom": result["wisdom"],
+            "transcript_length": len(fetched_transcript),
+            "compaction": compaction_report,
+            "fallback_used": result.get("fallback_used", False),
+            "hedged": result.get("hedged", False),
+            "usage": result["usage"],
+            "cached": result["cached"],
+            "cache_age_seconds": result["cache_age_seconds"]
         }
 
+    except HTTPException:
+        raise
     except TranscriptsDisabled:
         raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
     except NoTranscriptFound:
@@ -675,7 +1319,7 @@ async def extract_wisdom(
         )
     except VideoUnavailable:
         raise HTTPException(status_code=404, detail="Video not found or unavailable")
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="OpenRouter API request timed out")
     except Exception as e:
         import traceback
@@ -692,6 +1336,26 @@ async def chat_about_video(
     model: str = Query(
         default=MODEL_NAME,
         description="OpenRouter model ID (use :free models from openrouter-free-llms.txt)"
+    ),
+    stream: bool = Query(
+        default=False,
+        description="Stream the response as Server-Sent Events"
+    ),
+    hedge: Optional[bool] = Query(
+        default=None,
+        description="Race the next fallback model when the first is slower than its p90 latency (default from HEDGE_ENABLED)"
+    ),
+    compaction_level: str = Query(
+        default=compaction.COMPACTION_LEVEL,
+        alias="compaction",
+        pattern=compaction.COMPACTION_MODE_PATTERN,
+        description="Transcript compaction before it is sent to the model: off, light, medium or aggressive (default from COMPACTION_LEVEL)"
+    ),
+    retrieval_mode: str = Query(
+        default="off",
+        alias="retrieval",
+        pattern=retrieval.RETRIEVAL_MODE_PATTERN,
+        description="Send only the transcript windows relevant to the question: off (default), on, or auto (long transcripts)"
     )
 ):
     """
@@ -710,6 +1374,13 @@ async def chat_about_video(
         video_id: YouTube video ID
         languages: Comma-separated language codes (default: "en")
         model: OpenRouter model identifier
+        stream: Stream tokens as Server-Sent Events ("delta" events, then a final "done" event with model and usage)
+        hedge: Race the next fallback model when the first is slow; the response reports whether a hedge fired
+        compaction: Merge caption fragments into timestamped blocks and drop [Music], repeated caption text and fillers -
+                    off, light, medium or aggressive (default from COMPACTION_LEVEL); the response reports tokens before and after
+        retrieval: Send only the top-k transcript windows (BM25 over time windows) instead of the full
+                   transcript - off (default), on, or auto (when the transcript is long or doesn't fit the model).
+                   The response reports the windows used and the tokens saved.
     
     Example:
         POST /transcript/dQw4w9WgXcQ/chat
@@ -731,25 +1402,34 @@ async def chat_about_video(
                 detail="OPENROUTER_API_KEY environment variable not set"
             )
         
-        # Fetch the transcript
-        ytt_api = get_youtube_api()
+        # Fetch the transcript (served from cache when available)
         language_list = [lang.strip() for lang in languages.split(",")]
-        fetched_transcript = ytt_api.fetch(video_id, languages=language_list)
+        fetched_transcript = await fetch_transcript(video_id, language_list)
         
         # Convert transcript to plain text
-        transcript_text = "\n".join([
-            f"[{entry['start']:.2f}s] {entry['text']}"
-            for entry in fetched_transcript.to_raw_data()
-        ])
+        transcript_text, compaction_report = await transcript_to_text(fetched_transcript, compaction_level)
         
         # Build system prompt with transcript context
-        system_prompt = (
-            "You are a helpful AI assistant that answers questions about a YouTube video. "
-            "You have access to the full transcript with timestamps. "
-            "Be concise, accurate, and reference specific timestamps when relevant.\n\n"
-            f"TRANSCRIPT:\n{transcript_text}\n\n"
-            "Answer the user's questions based solely on this transcript content."
+        system_prompt = sessions.build_chat_system_prompt(transcript_text)
+
+        # Optionally replace the full transcript with the windows relevant to the question
+        retrieval_info = None
+        use_retrieval = retrieval.should_retrieve(
+            retrieval_mode,
+            estimate_tokens(transcript_text),
+            chunking.fits(model, "", system_prompt)
         )
+        if use_retrieval:
+            index, index_cached, build_ms = await retrieval.get_index(fetched_transcript)
+            # Follow-ups ("tell me more") are resolved against the previous question too
+            previous_questions = [msg.content for msg in conversation_history if msg.role == "user"][-1:]
+            hits = index.search(" ".join(previous_questions + [user_message]))
+            full_system_prompt = system_prompt
+            if hits:
+                system_prompt = retrieval.build_retrieval_system_prompt([window for window, _ in hits])
+            retrieval_info = retrieval.retrieval_report(
+                index, hits, full_system_prompt, system_prompt, index_cached, build_ms
+            )
         
         # Build conversation messages
         messages = [{"role": "system", "content": system_prompt}]
@@ -764,80 +1444,228 @@ async def chat_about_video(
         
         # Add current user message
         messages.append({"role": "user", "content": user_message})
+
+        # Skip fallback models too small for the conversation, as summarize does
+        fallback_models = chunking.usable_chat_fallbacks(FALLBACK_MODELS, messages)
         
+        if stream:
+            events = openrouter.stream_with_fallback(
+                openrouter_api_key=openrouter_api_key,
+                messages=messages,
+                preferred_model=model,
+                fallback_models=fallback_models,
+                title="Automatehub Video Chat",
+                hedge=hedge
+            )
+            return await sse_response(
+                events,
+                {
+                    "video_id": video_id,
+                    "language": fetched_transcript.language,
+                    "user_message": user_message,
+                    "retrieval": retrieval_info,
+                    "compaction": compaction_report
+                }
+            )
+
         # Call OpenRouter with fallback
-        models_to_try = [model] if model not in FALLBACK_MODELS else []
-        models_to_try.extend(FALLBACK_MODELS)
-        
-        headers = {
-            "Authorization": f"Bearer {openrouter_api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/creativerezz/fastapi",
-            "X-Title": "Automatehub Video Chat"
+        result = await openrouter.complete_with_fallback(
+            openrouter_api_key=openrouter_api_key,
+            messages=messages,
+            preferred_model=model,
+            fallback_models=fallback_models,
+            title="Automatehub Video Chat",
+            hedge=hedge
+        )
+
+        return {
+            "video_id": video_id,
+            "language": fetched_transcript.language,
+            "model": result["model_used"],
+            "user_message": user_message,
+            "assistant_response": result["content"],
+            "fallback_used": result["fallback_used"],
+            "hedged": result["hedged"],
+            "usage": result["usage"],
+            "retrieval": retrieval_info,
+            "compaction": compaction_report
         }
-        
-        last_error = None
-        
-        for current_model in models_to_try:
-            try:
-                payload = {"model": current_model, "messages": messages}
-                
-                response = requests.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers=headers,
-                    json=payload,
-                    timeout=60
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    assistant_message = result["choices"][0]["message"]["content"]
-                    
-                    return {
-                        "video_id": video_id,
-                        "language": fetched_transcript.language,
-                        "model": current_model,
-                        "user_message": user_message,
-                        "assistant_response": assistant_message,
-                        "fallback_used": current_model != model,
-                        "usage": result.get("usage", {})
-                    }
-                
-                if response.status_code == 429:
-                    print(f"Model {current_model} is rate-limited, trying next...")
-                    last_error = f"Rate limited: {current_model}"
-                    continue
-                
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"OpenRouter API error: {response.text}"
-                )
-                
-            except requests.exceptions.Timeout:
-                print(f"Model {current_model} timed out, trying next...")
-                last_error = f"Timeout: {current_model}"
-                continue
-            except HTTPException:
-                raise
-            except Exception as e:
-                print(f"Error with model {current_model}: {str(e)}")
-                last_error = f"Error: {str(e)}"
-                continue
-        
+
+    except TranscriptsDisabled:
+        raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
+    except NoTranscriptFound:
         raise HTTPException(
-            status_code=503,
-            detail=f"All models unavailable. Last error: {last_error}"
+            status_code=404,
+            detail=f"No transcript found for languages: {languages}"
         )
-        
+    except VideoUnavailable:
+        raise HTTPException(status_code=404, detail="Video not found or unavailable")
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        error_details = f"{type(e).__name__}: {str(e)}"
+        print(f"Chat error: {error_details}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_details)
+
+
+@app.post("/transcript/{video_id}/chat/sessions")
+async def create_chat_session(video_id: str, request_body: Optional[ChatSessionRequest] = None):
+    """
+    Start a server-side chat session about a video
+
+    The transcript is fetched once and kept with the conversation history on
+    the server, so later turns only send the new message. The transcript
+    part of the prompt is identical on every turn, which lets provider-side
+    prompt caching kick in. Old turns are trimmed (or summarized) to stay
+    within CHAT_SESSION_HISTORY_TOKENS, and idle sessions expire after
+    CHAT_SESSION_TTL seconds.
+
+    Request body (optional):
+        {
+            "languages": "en",           // Comma-separated language codes
+            "model": "qwen/qwen3-coder:free",  // Default from env
+            "compaction": "medium"       // off, light, medium or aggressive (default from COMPACTION_LEVEL)
+        }
+
+    Example:
+        POST /transcript/dQw4w9WgXcQ/chat/sessions
+        POST /transcript/dQw4w9WgXcQ/chat/sessions/{session_id}/messages
+        Body: {"message": "What are the main tools mentioned?"}
+    """
+    request_body = request_body or ChatSessionRequest()
+    try:
+        language_list = [lang.strip() for lang in request_body.languages.split(",")]
+        fetched_transcript = await fetch_transcript(video_id, language_list)
+    except HTTPException:
+        raise
     except TranscriptsDisabled:
         raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
     except NoTranscriptFound:
         raise HTTPException(
             status_code=404,
-            detail=f"No transcript found for languages: {languages}"
+            detail=f"No transcript found for languages: {request_body.languages}"
         )
     except VideoUnavailable:
         raise HTTPException(status_code=404, detail="Video not found or unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching transcript: {str(e)}")
+
+    transcript_text, compaction_report = await transcript_to_text(fetched_transcript, request_body.compaction)
+    session = await sessions.create_session(
+        video_id,
+        fetched_transcript.language,
+        request_body.model or MODEL_NAME,
+        transcript_text
+    )
+    return {**session.info(), "compaction": compaction_report}
+
+async def get_chat_session(video_id: str, session_id: str) -> sessions.ChatSession:
+    session = await sessions.get_session(session_id)
+    if session is None or session.video_id != video_id:
+        raise HTTPException(status_code=404, detail=f"Chat session '{session_id}' not found or expired")
+    return session
+
+@app.get("/transcript/{video_id}/chat/sessions/{session_id}")
+async def chat_session_status(video_id: str, session_id: str):
+    """
+    Show a chat session's history, running summary and token usage
+
+    Example: /transcript/dQw4w9WgXcQ/chat/sessions/{session_id}
+    """
+    session = await get_chat_session(video_id, session_id)
+    return {**session.info(), "history": session.history}
+
+@app.delete("/transcript/{video_id}/chat/sessions/{session_id}")
+async def delete_chat_session(video_id: str, session_id: str):
+    """End a chat session and free its memory"""
+    await get_chat_session(video_id, session_id)
+    await sessions.delete_session(session_id)
+    return {"session_id": session_id, "deleted": True}
+
+@app.post("/transcript/{video_id}/chat/sessions/{session_id}/messages")
+async def send_chat_session_message(
+    video_id: str,
+    session_id: str,
+    request_body: ChatSessionMessage,
+    stream: bool = Query(
+        default=False,
+        description="Stream the response as Server-Sent Events"
+    ),
+    hedge: Optional[bool] = Query(
+        default=None,
+        description="Race the next fallback model when the first is slower than its p90 latency (default from HEDGE_ENABLED)"
+    )
+):
+    """
+    Send the next message in a chat session
+
+    Only the new message is sent; the transcript and earlier turns are kept
+    on the server. Turns in one session are processed one at a time.
+
+    Args:
+        video_id: YouTube video ID
+        session_id: ID returned by POST /transcript/{video_id}/chat/sessions
+        stream: Stream tokens as Server-Sent Events ("delta" events, then a final "done" event with model and usage)
+        hedge: Race the next fallback model when the first is slow; the response reports whether a hedge fired
+
+    Example:
+        POST /transcript/dQw4w9WgXcQ/chat/sessions/{session_id}/messages
+        Body: {"message": "What are the main tools mentioned?"}
+    """
+    user_message = request_body.message
+    if not user_message:
+        raise HTTPException(status_code=400, detail="Message field is required")
+
+    openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+    if not openrouter_api_key:
+        raise HTTPException(
+            status_code=500,
+            detail="OPENROUTER_API_KEY environment variable not set"
+        )
+
+    session = await get_chat_session(video_id, session_id)
+
+    if stream:
+        async def events():
+            async with sessions.turn(session):
+                await sessions.trim_history(session, openrouter_api_key, FALLBACK_MODELS)
+                messages = session.build_messages(user_message)
+                parts = []
+                async for event, data in openrouter.stream_with_fallback(
+                    openrouter_api_key=openrouter_api_key,
+                    messages=messages,
+                    preferred_model=session.model,
+                    fallback_models=chunking.usable_chat_fallbacks(FALLBACK_MODELS, messages),
+                    title="Automatehub Video Chat",
+                    hedge=hedge
+                ):
+                    if event == "delta":
+                        parts.append(data["content"])
+                    elif event == "done":
+                        await sessions.record_turn(session, user_message, "".join(parts))
+                        data = {**data, "turns": session.turns, "history_tokens": session.history_tokens()}
+                    yield event, data
+
+        return await sse_response(
+            events(),
+            {"session_id": session_id, "video_id": video_id, "user_message": user_message}
+        )
+
+    try:
+        async with sessions.turn(session):
+            await sessions.trim_history(session, openrouter_api_key, FALLBACK_MODELS)
+            messages = session.build_messages(user_message)
+            result = await openrouter.complete_with_fallback(
+                openrouter_api_key=openrouter_api_key,
+                messages=messages,
+                preferred_model=session.model,
+                fallback_models=chunking.usable_chat_fallbacks(FALLBACK_MODELS, messages),
+                title="Automatehub Video Chat",
+                hedge=hedge
+            )
+            await sessions.record_turn(session, user_message, result["content"])
     except HTTPException:
         raise
     except Exception as e:
@@ -847,11 +1675,151 @@ async def chat_about_video(
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=error_details)
 
+    return {
+        "session_id": session_id,
+        "video_id": video_id,
+        "model": result["model_used"],
+        "user_message": user_message,
+        "assistant_response": result["content"],
+        "fallback_used": result["fallback_used"],
+        "hedged": result["hedged"],
+        "usage": result["usage"],
+        "turns": session.turns,
+        "history_tokens": session.history_tokens(),
+        "trimmed_turns": session.trimmed_turns
+    }
+
+# Background jobs run the same code as the synchronous endpoints
+async def run_summarize_job(params: dict) -> dict:
+    return await summarize_transcript(
+        video_id=params["video_id"],
+        languages=params["languages"],
+        model=params["model"] or MODEL_NAME,
+        cache=params["cache"],
+        stream=False,
+        chunking_mode=params["chunking"],
+        compaction_level=params.get("compaction", compaction.COMPACTION_LEVEL),
+        hedge=params["hedge"]
+    )
+
+async def run_pattern_job(params: dict) -> dict:
+    return await apply_pattern(
+        video_id=params["video_id"],
+        pattern_name=params["pattern_name"],
+        languages=params["languages"],
+        model=params["model"] or MODEL_NAME,
+        cache=params["cache"],
+        stream=False,
+        chunking_mode=params["chunking"],
+        compaction_level=params.get("compaction", compaction.COMPACTION_LEVEL),
+        hedge=params["hedge"],
+        start=params.get("start"),
+        end=params.get("end")
+    )
+
+async def run_extract_wisdom_job(params: dict) -> dict:
+    return await extract_wisdom(
+        video_id=params["video_id"],
+        languages=params["languages"],
+        model=params["model"] or MODEL_NAME,
+        cache=params["cache"],
+        stream=False,
+        compaction_level=params.get("compaction", compaction.COMPACTION_LEVEL),
+        hedge=params["hedge"]
+    )
+
+jobs.register("summarize", run_summarize_job)
+jobs.register("pattern", run_pattern_job)
+jobs.register("extract_wisdom", run_extract_wisdom_job)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request_body: JobRequest):
+    """
+    Queue a summarize, pattern or extract-wisdom run and return immediately
+
+    Long videos can take longer than gateway timeouts allow. A job keeps
+    running regardless of the client connection; poll GET /jobs/{job_id}
+    for the result, or pass a webhook_url to have it POSTed when the job
+    finishes. Jobs are stored in SQLite and survive restarts. Higher
+    priority jobs run first; transient failures (5xx, timeouts) are retried.
+
+    Body:
+        kind: summarize, pattern or extract_wisdom
+        video_id: YouTube video ID
+        pattern_name: Fabric pattern (required for kind=pattern)
+        languages, model, cache, chunking, compaction, hedge: as on the synchronous endpoints
+        start, end: Time range (seconds) for kind=pattern
+        priority: Higher runs first (default: 0)
+        webhook_url: Public http(s) URL that receives the finished job as JSON
+
+    Example:
+        curl -X POST /jobs -H "Content-Type: application/json" \
+          -d '{"kind": "pattern", "video_id": "dQw4w9WgXcQ", "pattern_name": "extract_wisdom"}'
+    """
+    if request_body.kind == "pattern":
+        if not request_body.pattern_name:
+            raise HTTPException(status_code=400, detail="pattern_name is required for kind=pattern")
+        if pattern_registry.get(request_body.pattern_name) is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Pattern '{request_body.pattern_name}' not found. Use GET /patterns to see available patterns."
+            )
+
+    params = request_body.model_dump(exclude={"kind", "priority", "webhook_url"})
+    job = await jobs.submit(
+        request_body.kind,
+        params,
+        priority=request_body.priority,
+        webhook_url=request_body.webhook_url
+    )
+    return {**job, "status_url": f"/jobs/{job['job_id']}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Job status, attempts, wait time and, once it has succeeded, the result
+    (the same JSON the synchronous endpoint returns)
+
+    Example: /jobs/3f2a...
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job that hasn't started yet"""
+    job = await jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    if job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']} and can no longer be cancelled")
+    return job
+
+@app.get("/admin/jobs")
+async def job_queue_status():
+    """
+    Report the background job queue: jobs by status, queue depth, age of
+    the oldest waiting job and recent wait times
+
+    Example: /admin/jobs
+    """
+    return await jobs.queue_stats()
 
 @app.get("/search")
 async def search_youtube(
     q: str = Query(..., description="Search query"),
-    max_results: int = Query(10, ge=1, le=50, description="Maximum number of results")
+    max_results: int = Query(10, ge=1, le=50, description="Maximum number of results"),
+    details: bool = Query(
+        default=False,
+        description="Add duration, view/like/comment counts and caption flag (one batched videos.list call, 1 quota unit)"
+    ),
+    check_transcripts: bool = Query(
+        default=False,
+        alias="transcripts",
+        description="Check each result for available transcripts and their languages"
+    )
 ):
     """
     Search YouTube videos using YouTube Data API v3
@@ -863,6 +1831,17 @@ async def search_youtube(
     - thumbnailUrl: Video thumbnail URL
     - publishedAt: Publication date
     - description: Video description snippet
+
+    Results are cached per normalized query for YOUTUBE_SEARCH_CACHE_TTL
+    seconds, so repeated searches cost no quota (a search costs 100 units).
+    With details=true each result also gets duration, durationSeconds,
+    viewCount, likeCount, commentCount, hasCaptions, definition,
+    privacyStatus and embeddable. With transcripts=true each result gets
+    transcriptAvailable and transcriptLanguages (null when the check failed).
+
+    Example:
+        /search?q=python tutorial&max_results=5
+        /search?q=python tutorial&details=true&transcripts=true
     """
     try:
         # Get YouTube Data API key from environment
@@ -872,47 +1851,44 @@ async def search_youtube(
                 status_code=500,
                 detail="YouTube API key not configured. Please set YOUTUBE_API_KEY environment variable."
             )
-        
-        # Call YouTube Data API v3 Search endpoint
-        search_url = "https://www.googleapis.com/youtube/v3/search"
-        params = {
-            "part": "snippet",
-            "q": q,
-            "type": "video",
-            "maxResults": max_results,
-            "key": api_key
-        }
-        
-        response = requests.get(search_url, params=params, timeout=10)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"YouTube API error: {response.text}"
-            )
-        
-        data = response.json()
-        
-        # Transform results to simplified format
-        results = []
-        for item in data.get("items", []):
-            snippet = item.get("snippet", {})
-            video_id = item.get("id", {}).get("videoId")
-            
-            if video_id:  # Only include valid video results
-                results.append({
-                    "videoId": video_id,
-                    "title": snippet.get("title", ""),
-                    "channelTitle": snippet.get("channelTitle", ""),
-                    "thumbnailUrl": snippet.get("thumbnails", {}).get("medium", {}).get("url", ""),
-                    "publishedAt": snippet.get("publishedAt", ""),
-                    "description": snippet.get("description", "")
-                })
-        
+
+        found = await youtube_search.search(q, max_results, api_key)
+        results = found["results"]
+        video_ids = [result["videoId"] for result in results]
+
+        # Details and transcript checks are independent, so they run side by side
+        lookups = {}
+        if details and video_ids:
+            lookups["details"] = youtube_search.video_details(video_ids, api_key)
+        if check_transcripts and video_ids:
+            lookups["transcripts"] = youtube_search.transcript_availability(video_ids)
+        answers = dict(zip(lookups, await asyncio.gather(*lookups.values(), return_exceptions=True)))
+
+        video_details = answers.get("details", {})
+        if isinstance(video_details, Exception):
+            # Enrichment is best effort - the search results are still returned
+            print(f"Video details lookup failed: {type(video_details).__name__}: {str(video_details)}")
+            video_details = {}
+        availability = answers.get("transcripts", {})
+        if isinstance(availability, Exception):
+            # Same as details: every result gets null transcriptAvailable/transcriptLanguages
+            print(f"Transcript availability lookup failed: {type(availability).__name__}: {str(availability)}")
+            availability = {}
+
+        for result in results:
+            if details:
+                result.update(video_details.get(result["videoId"], {}))
+            if check_transcripts:
+                checked = availability.get(result["videoId"])
+                result["transcriptAvailable"] = checked["available"] if checked else None
+                result["transcriptLanguages"] = checked["languages"] if checked else None
+
         return {
             "query": q,
             "resultCount": len(results),
-            "results": results
+            "results": results,
+            "cached": found["cached"],
+            "cache_age_seconds": found["cache_age_seconds"]
         }
         
     except HTTPException:
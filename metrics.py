@@ -0,0 +1,425 @@
+import asyncio
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+# Record metrics and serve them on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Each worker process writes its counters here and /metrics merges every
+# worker's file, so totals are correct whichever worker answers the scrape.
+# Empty to only report the answering worker (fine with a single worker).
+METRICS_DIR = os.getenv(
+    "METRICS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "metrics")
+)
+# Seconds between snapshot writes; other workers' numbers are at most this stale
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Histogram bucket upper bounds in seconds, from cache hits to long LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# name -> (type, help)
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by route, method and status"),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route, until the last body byte is sent"),
+    "http_requests_in_flight": ("gauge", "HTTP requests currently being handled, by route"),
+    "stage_duration_seconds": ("histogram", "Time spent in each request stage: youtube_fetch, transcript_format, pattern_load, llm"),
+    "request_deadline_exceeded_total": ("counter", "Requests that ran out of their deadline, by the stage that was running"),
+    "youtube_fetches_in_flight": ("gauge", "Transcript fetches from YouTube currently running"),
+    "openrouter_requests_total": ("counter", "OpenRouter attempts by model and outcome"),
+    "openrouter_request_duration_seconds": ("histogram", "OpenRouter attempt latency by model and outcome"),
+    "openrouter_requests_in_flight": ("gauge", "OpenRouter attempts currently running by model"),
+    "llm_calls_total": ("counter", "Completed LLM calls, by whether a fallback model answered and whether the call was hedged"),
+    "llm_tokens_total": ("counter", "Tokens reported in OpenRouter usage, by model and type (prompt/completion)"),
+    "transcript_compaction_tokens_total": ("counter", "Estimated transcript tokens before and after compaction, by level"),
+    "transcript_cache_requests_total": ("counter", "Transcript requests by cache result"),
+    "llm_cache_requests_total": ("counter", "LLM result cache lookups by result"),
+    "coalesced_requests_total": ("counter", "Requests that joined an identical in-flight fetch or LLM call"),
+    "jobs_finished_total": ("counter", "Background jobs finished by kind and final status"),
+    "jobs_running": ("gauge", "Background jobs currently running by kind"),
+    "jobs_in_queue": ("gauge", "Background jobs queued or running, across all workers"),
+    "job_wait_seconds": ("histogram", "Time background jobs waited in the queue before a worker picked them up"),
+    "job_run_seconds": ("histogram", "Background job attempt duration by kind and status"),
+    "youtube_api_quota_units_total": ("counter", "YouTube Data API quota units spent, by endpoint (search, videos)"),
+    "youtube_search_cache_requests_total": ("counter", "YouTube search cache lookups by result"),
+    "youtube_proxy_requests_total": ("counter", "YouTube requests per proxy slot by outcome (success, failure, blocked)"),
+    "admission_in_flight": ("gauge", "LLM attempts and YouTube requests holding an admission slot, by pool"),
+    "admission_queued": ("gauge", "Requests waiting for an admission slot, by pool"),
+    "admission_queue_wait_seconds": ("histogram", "Time admitted requests waited for a slot, by pool"),
+    "admission_rejections_total": ("counter", "Requests turned away by pool (llm, youtube, client) and reason (queue_full, queue_timeout, rate_limited)"),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_counters: Dict[Tuple[str, LabelKey], float] = {}
+_gauges: Dict[Tuple[str, LabelKey], float] = {}
+# (name, labels) -> [per-bucket counts (+Inf last), sum, count]
+_histograms: Dict[Tuple[str, LabelKey], list] = {}
+_collectors: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+_global_collectors: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+
+# All recording happens on the event loop thread, so these plain dict updates
+# need no locks - record around run_in_threadpool calls, never inside them.
+
+
+def _key(name: str, labels: dict) -> Tuple[str, LabelKey]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    if METRICS_ENABLED:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge_add(name: str, value: float, **labels):
+    if METRICS_ENABLED:
+        key = _key(name, labels)
+        _gauges[key] = _gauges.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+    histogram[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    histogram[1] += seconds
+    histogram[2] += 1
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the duration of the block into histogram `name`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed_iter(iterator: Iterable, name: str, **labels) -> Iterator:
+    """
+    Pass iterator through, observing the total time spent producing its
+    items - for work done lazily while a response streams. Create it on the
+    event loop; it may then be consumed from the threadpool (StreamingResponse
+    does that for plain iterators) and still records on the loop.
+    """
+    loop = asyncio.get_running_loop()
+
+    def timed() -> Iterator:
+        elapsed = 0.0
+        items = iter(iterator)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            loop.call_soon_threadsafe(lambda: observe(name, elapsed, **labels))
+
+    return timed()
+
+
+@contextmanager
+def in_flight(name: str, **labels):
+    gauge_add(name, 1, **labels)
+    try:
+        yield
+    finally:
+        gauge_add(name, -1, **labels)
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, dict, float]]]):
+    """
+    Register a function returning (name, labels, value) samples read at
+    snapshot time - for counters that modules already keep themselves
+    """
+    _collectors.append(collector)
+
+
+def register_global_collector(collector: Callable[[], Iterable[Tuple[str, dict, float]]]):
+    """
+    Register a function returning (name, labels, value) gauge samples that
+    describe state shared by all workers (e.g. a database). It is called
+    once per scrape, from the threadpool, instead of once per worker.
+    """
+    _global_collectors.append(collector)
+
+
+def record_llm_call(result: dict):
+    """Count a finished fallback-chain call (a completion result or a stream's done event)"""
+    inc(
+        "llm_calls_total",
+        fallback_used=str(bool(result.get("fallback_used"))).lower(),
+        hedged=str(bool(result.get("hedged"))).lower()
+    )
+
+
+def record_usage(model: str, usage: dict):
+    for kind in ("prompt", "completion"):
+        tokens = (usage or {}).get(f"{kind}_tokens")
+        if tokens:
+            inc("llm_tokens_total", tokens, model=model, type=kind)
+
+
+def snapshot() -> dict:
+    """This worker's metrics as a JSON-serializable dict"""
+    counters = dict(_counters)
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+        except Exception as e:
+            print(f"Metrics collector failed: {str(e)}")
+    return {
+        "pid": os.getpid(),
+        "written_at": time.time(),
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "gauges": [[name, labels, value] for (name, labels), value in _gauges.items()],
+        "histograms": [
+            [name, labels, list(buckets), total, count]
+            for (name, labels), (buckets, total, count) in _histograms.items()
+        ],
+    }
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"worker-{pid}.json")
+
+
+def _write(data: dict):
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(data["pid"])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_dead_workers():
+    """Drop snapshots left behind by earlier runs so restarts start from zero"""
+    for path in glob.glob(os.path.join(METRICS_DIR, "worker-*.json")):
+        try:
+            pid = int(os.path.basename(path)[len("worker-"):-len(".json")])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _pid_alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+async def flush():
+    """Write this worker's snapshot (serialized on the loop, written in the threadpool)"""
+    if METRICS_ENABLED and METRICS_DIR:
+        await run_in_threadpool(_write, snapshot())
+
+
+async def flush_periodically():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as e:
+            print(f"Could not write metrics snapshot: {str(e)}")
+
+
+def start():
+    """Clean up stale snapshots and start the flush task (call from the app lifespan)"""
+    if not (METRICS_ENABLED and METRICS_DIR):
+        return None
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _remove_dead_workers()
+    return asyncio.create_task(flush_periodically())
+
+
+def _load_snapshots(own: dict) -> List[dict]:
+    """Every worker's latest snapshot, with this worker's taken fresh"""
+    snapshots = [own]
+    if not METRICS_DIR:
+        return snapshots
+    for path in glob.glob(os.path.join(METRICS_DIR, "worker-*.json")):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if data.get("pid") != own["pid"]:
+            snapshots.append(data)
+    return snapshots
+
+
+def merge(snapshots: List[dict]) -> dict:
+    """
+    Sum counters and histograms across workers. Gauges only count live
+    workers - a dead worker's in-flight requests are not in flight anymore.
+    """
+    counters: Dict[Tuple[str, LabelKey], float] = {}
+    gauges: Dict[Tuple[str, LabelKey], float] = {}
+    histograms: Dict[Tuple[str, LabelKey], list] = {}
+    for data in snapshots:
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        if data["pid"] == os.getpid() or _pid_alive(data["pid"]):
+            for name, labels, value in data["gauges"]:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+        for name, labels, buckets, total, count in data["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(buckets), total, count]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+    return {"counters": counters, "gauges": gauges, "histograms": histograms, "workers": len(snapshots)}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(merged: dict) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    by_name: Dict[str, List[str]] = {}
+    for (name, labels), value in sorted(merged["counters"].items()):
+        by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+    for (name, labels), value in sorted(merged["gauges"].items()):
+        by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+    for (name, labels), (buckets, total, count) in sorted(merged["histograms"].items()):
+        lines = by_name.setdefault(name, [])
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS + (float("inf"),), buckets):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f"{name}_bucket{_labels(labels, (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    out = []
+    for name in sorted(by_name):
+        kind, help_text = METRICS.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(by_name[name])
+    out.append("# HELP metrics_workers Worker processes included in these metrics")
+    out.append("# TYPE metrics_workers gauge")
+    out.append(f"metrics_workers {merged['workers']}")
+    return "\n".join(out) + "\n"
+
+
+def exposition(own: dict) -> str:
+    """
+    Render every worker's metrics given this worker's snapshot() (taken on
+    the event loop). Reads the other workers' files - call from the threadpool.
+    """
+    merged = merge(_load_snapshots(own))
+    for collector in _global_collectors:
+        try:
+            for name, labels, value in collector():
+                merged["gauges"][_key(name, labels)] = value
+        except Exception as e:
+            print(f"Metrics collector failed: {str(e)}")
+    return render(merged)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route request counts, latency and
+    in-flight requests. Routes are labelled by their path template
+    (/transcript/{video_id}), never the raw path, to keep cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[Callable, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            for route in getattr(scope.get("app"), "routes", []):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            path = self._route_paths[endpoint] = path or "unmatched"
+        return path
+
+    def _match(self, scope) -> str:
+        """Path template of the route that will handle a request not routed yet (as the router picks it)"""
+        partial = None
+        for route in getattr(scope.get("app"), "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+            if match == Match.PARTIAL and partial is None:
+                partial = route
+        return getattr(partial, "path", "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        # The gauge goes up before routing has run, so match the route here
+        in_flight_route = self._match(scope)
+        gauge_add("http_requests_in_flight", 1, route=in_flight_route)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            gauge_add("http_requests_in_flight", -1, route=in_flight_route)
+            route = self._route(scope)
+            method = scope["method"]
+            inc("http_requests_total", route=route, method=method, status=status)
+            observe("http_request_duration_seconds", time.perf_counter() - started, route=route, method=method)
@@ -0,0 +1,290 @@
+import os
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, Optional
+
+# Outcomes kept per model for failure-rate and latency percentile estimates
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "20"))
+# Weight of the newest sample in the latency moving average
+ROUTER_LATENCY_ALPHA = float(os.getenv("ROUTER_LATENCY_ALPHA", "0.3"))
+# Latency assumed for models we have no samples for yet (seconds)
+ROUTER_DEFAULT_LATENCY = float(os.getenv("ROUTER_DEFAULT_LATENCY", "10"))
+# Circuit opens when the failure rate over the window reaches this threshold...
+ROUTER_FAILURE_THRESHOLD = float(os.getenv("ROUTER_FAILURE_THRESHOLD", "0.5"))
+# ...with at least this many samples, or after this many consecutive failures
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "4"))
+ROUTER_MAX_CONSECUTIVE_FAILURES = int(os.getenv("ROUTER_MAX_CONSECUTIVE_FAILURES", "3"))
+# How long an open circuit stays open before a single trial request is allowed
+ROUTER_OPEN_SECONDS = float(os.getenv("ROUTER_OPEN_SECONDS", "60"))
+# Cooldown after a 429 without a usable Retry-After header, and the upper bound for one with it
+ROUTER_RATE_LIMIT_COOLDOWN = float(os.getenv("ROUTER_RATE_LIMIT_COOLDOWN", "30"))
+ROUTER_MAX_COOLDOWN = float(os.getenv("ROUTER_MAX_COOLDOWN", "600"))
+
+# Hedging: when the first model is slow, race the next candidate against it.
+# Off by default; endpoints can enable it per request with ?hedge=true
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Hedge after the primary's observed latency at this percentile...
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+# ...once it has this many samples; until then wait HEDGE_DEFAULT_DELAY seconds
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "5"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
+# Hedges earned per hedge-eligible request, and how many can be saved up. With
+# the default 0.1 at most ~10% of requests send a second upstream call.
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "5"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_KINDS = ("rate_limited", "server_error", "timeout", "error")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelHealth:
+    """Rolling health statistics and circuit breaker state for one model"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.latency_ewma: Optional[float] = None
+        self.latencies: Deque[float] = deque(maxlen=ROUTER_WINDOW)
+        self.first_token_latencies: Deque[float] = deque(maxlen=ROUTER_WINDOW)
+        self.outcomes: Deque[str] = deque(maxlen=ROUTER_WINDOW)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.totals: Dict[str, int] = {"ok": 0, **{kind: 0 for kind in FAILURE_KINDS}}
+
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for outcome in self.outcomes if outcome != "ok") / len(self.outcomes)
+
+    def expected_latency(self) -> float:
+        """Latency estimate penalized by the chance of having to retry elsewhere"""
+        latency = self.latency_ewma if self.latency_ewma is not None else ROUTER_DEFAULT_LATENCY
+        return latency / max(1.0 - self.failure_rate(), 0.1)
+
+    def latency_percentile(self, q: float, first_token: bool = False) -> Optional[float]:
+        samples = self.first_token_latencies if first_token else self.latencies
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def available_at(self) -> float:
+        """Earliest time a request may be sent to this model"""
+        if self.state == OPEN:
+            return max(self.opened_at + ROUTER_OPEN_SECONDS, self.cooldown_until)
+        return self.cooldown_until
+
+    def is_available(self, now: float) -> bool:
+        if now < self.available_at():
+            return False
+        # Only one trial request at a time while the circuit is half-open
+        return not (self.state in (OPEN, HALF_OPEN) and self.trial_in_flight)
+
+    def snapshot(self, now: float) -> dict:
+        p50 = self.latency_percentile(0.5)
+        p90 = self.latency_percentile(0.9)
+        first_token_p90 = self.latency_percentile(0.9, first_token=True)
+        return {
+            "state": self.state,
+            "available": self.is_available(now),
+            "available_in_seconds": round(max(self.available_at() - now, 0.0), 1),
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p90": round(p90, 3) if p90 is not None else None,
+            "first_token_p90": round(first_token_p90, 3) if first_token_p90 is not None else None,
+            "expected_latency": round(self.expected_latency(), 3),
+            "failure_rate": round(self.failure_rate(), 3),
+            "recent": {
+                kind: sum(1 for outcome in self.outcomes if outcome == kind)
+                for kind in ("ok",) + FAILURE_KINDS
+            },
+            "totals": dict(self.totals),
+            "consecutive_failures": self.consecutive_failures
+        }
+
+
+class ModelRouter:
+    """
+    Orders candidate models by health and expected latency.
+
+    Callers ask for an ordering with candidates(), call begin_attempt()
+    right before sending a request, and report the result with
+    record_success() / record_failure().
+    """
+
+    def __init__(self):
+        self._health: Dict[str, ModelHealth] = {}
+
+    def health(self, model: str) -> ModelHealth:
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth(model)
+        return health
+
+    def candidates(self, preferred_model: str, fallback_models: List[str]) -> List[str]:
+        """
+        Return the models worth trying, best first.
+
+        The preferred model leads while it is available; the fallbacks are
+        ordered by expected latency. Models in cooldown or with an open
+        circuit are left out.
+        """
+        now = time.time()
+        fallbacks = [m for m in fallback_models if m != preferred_model]
+        ordered = sorted(
+            (m for m in fallbacks if self.health(m).is_available(now)),
+            key=lambda m: self.health(m).expected_latency()
+        )
+        if self.health(preferred_model).is_available(now):
+            ordered.insert(0, preferred_model)
+        return ordered
+
+    def retry_after(self, models: List[str]) -> float:
+        """Seconds until the first of models becomes available again"""
+        now = time.time()
+        return max(min(self.health(m).available_at() for m in models) - now, 1.0)
+
+    def begin_attempt(self, model: str) -> bool:
+        """Claim an attempt slot; returns False if the model became unavailable"""
+        health = self.health(model)
+        now = time.time()
+        if not health.is_available(now):
+            return False
+        if health.state == OPEN:
+            health.state = HALF_OPEN
+        if health.state == HALF_OPEN:
+            health.trial_in_flight = True
+        return True
+
+    def record_success(self, model: str, latency: float):
+        health = self.health(model)
+        health.outcomes.append("ok")
+        health.latencies.append(latency)
+        health.totals["ok"] += 1
+        if health.latency_ewma is None:
+            health.latency_ewma = latency
+        else:
+            health.latency_ewma += ROUTER_LATENCY_ALPHA * (latency - health.latency_ewma)
+        health.consecutive_failures = 0
+        health.trial_in_flight = False
+        health.state = CLOSED
+
+    def record_failure(self, model: str, kind: str, retry_after: Optional[float] = None):
+        health = self.health(model)
+        now = time.time()
+        health.outcomes.append(kind)
+        health.totals[kind] += 1
+        health.consecutive_failures += 1
+        health.trial_in_flight = False
+
+        if kind == "rate_limited":
+            cooldown = ROUTER_RATE_LIMIT_COOLDOWN if retry_after is None else retry_after
+            health.cooldown_until = max(health.cooldown_until, now + min(cooldown, ROUTER_MAX_COOLDOWN))
+
+        tripped = (
+            health.state == HALF_OPEN
+            or health.consecutive_failures >= ROUTER_MAX_CONSECUTIVE_FAILURES
+            or (len(health.outcomes) >= ROUTER_MIN_SAMPLES and health.failure_rate() >= ROUTER_FAILURE_THRESHOLD)
+        )
+        if tripped:
+            if health.state != OPEN:
+                print(f"Circuit opened for model {model} ({kind})")
+            health.state = OPEN
+            health.opened_at = now
+
+    def record_first_token(self, model: str, latency: float):
+        """Record time to first streamed token (used for streaming hedge delays)"""
+        self.health(model).first_token_latencies.append(latency)
+
+    def hedge_delay(self, model: str, streaming: bool = False) -> float:
+        """Seconds to wait on model before hedging: its observed HEDGE_PERCENTILE latency"""
+        health = self.health(model)
+        samples = health.first_token_latencies if streaming else health.latencies
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(health.latency_percentile(HEDGE_PERCENTILE, first_token=streaming), HEDGE_MIN_DELAY)
+
+    def release(self, model: str):
+        """Give back an attempt slot without recording an outcome (e.g. cancelled)"""
+        self.health(model).trial_in_flight = False
+
+    def cooldowns(self) -> Dict[str, float]:
+        """Models currently cooling down after a 429, with the time the cooldown ends"""
+        now = time.time()
+        return {model: health.cooldown_until for model, health in self._health.items() if health.cooldown_until > now}
+
+    def apply_cooldowns(self, cooldowns: Dict[str, float]):
+        """Adopt cooldowns reported by other worker processes"""
+        for model, until in cooldowns.items():
+            health = self.health(model)
+            health.cooldown_until = max(health.cooldown_until, until)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        return {model: health.snapshot(now) for model, health in sorted(self._health.items())}
+
+
+class HedgeBudget:
+    """
+    Token bucket limiting hedged requests per process.
+
+    Every hedge-eligible request deposits HEDGE_BUDGET_RATIO tokens (capped
+    at HEDGE_BUDGET_BURST) and each hedge spends one, so hedges can never
+    exceed that fraction of traffic for long.
+    """
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.fired = 0
+        self.denied = 0
+        self.won = 0
+
+    def deposit(self):
+        self.requests += 1
+        self.tokens = min(self.tokens + self.ratio, self.burst)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.fired += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "enabled_by_default": HEDGE_ENABLED,
+            "tokens": round(self.tokens, 2),
+            "requests": self.requests,
+            "fired": self.fired,
+            "denied": self.denied,
+            "won": self.won
+        }
+
+
+router = ModelRouter()
+hedge_budget = HedgeBudget()
@@ -0,0 +1,674 @@
+import asyncio
+import json
+import os
+import time
+import httpx
+from fastapi import HTTPException
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+
+import admission
+import deadlines
+import metrics
+from model_router import HEDGE_ENABLED, hedge_budget, router, parse_retry_after
+
+# OpenRouter endpoint (overridable so local stand-ins can be used for benchmarks)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Timeouts in seconds - read timeout is per attempt, connect is kept short so a
+# dead upstream fails fast and the fallback chain can move on
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "60"))
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+
+# Connection pool limits - the client only ever talks to OpenRouter, so these
+# are effectively per-host limits
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "100"))
+OPENROUTER_MAX_KEEPALIVE = int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "20"))
+OPENROUTER_KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "30"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=OPENROUTER_BASE_URL,
+            limits=httpx.Limits(
+                max_connections=OPENROUTER_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENROUTER_MAX_KEEPALIVE,
+                keepalive_expiry=OPENROUTER_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(OPENROUTER_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_client():
+    """Close the shared client and release pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def build_headers(openrouter_api_key: str, title: str) -> dict:
+    """Build the request headers OpenRouter expects"""
+    return {
+        "Authorization": f"Bearer {openrouter_api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://github.com/creativerezz/fastapi",
+        "X-Title": title
+    }
+
+
+async def post_chat_completion(
+    openrouter_api_key: str,
+    payload: dict,
+    title: str,
+    timeout: Optional[float] = None
+) -> httpx.Response:
+    """
+    POST a chat completion request through the pooled client.
+
+    Raises httpx.TimeoutException when the attempt exceeds its timeout.
+    """
+    request_timeout = httpx.Timeout(
+        timeout if timeout is not None else OPENROUTER_TIMEOUT,
+        connect=OPENROUTER_CONNECT_TIMEOUT
+    )
+    return await get_client().post(
+        "/chat/completions",
+        headers=build_headers(openrouter_api_key, title),
+        json=payload,
+        timeout=request_timeout
+    )
+
+
+def _record_attempt(model: str, outcome: str, started: float):
+    metrics.inc("openrouter_requests_total", model=model, outcome=outcome)
+    metrics.observe("openrouter_request_duration_seconds", time.perf_counter() - started, model=model, outcome=outcome)
+
+
+async def _admit(model: str, timeout: Optional[float]) -> Optional[Tuple[float, float]]:
+    """
+    Wait for an LLM slot for model (see admission), then claim the router's
+    attempt slot. Returns (attempt timeout, slot grant time), or None when
+    the model became unavailable in the meantime. Raises Overloaded (503)
+    when the admission queue is full and DeadlineExceeded when the
+    request's deadline runs out first.
+    """
+    granted = await admission.llm.acquire(model)
+    try:
+        attempt_timeout = deadlines.attempt_timeout(timeout if timeout is not None else OPENROUTER_TIMEOUT)
+    except deadlines.DeadlineExceeded:
+        admission.llm.release(model, granted)
+        raise
+    if not router.begin_attempt(model):
+        admission.llm.release(model, granted)
+        return None
+    return attempt_timeout, granted
+
+
+def _all_unavailable(preferred_model: str, fallback_models: List[str], last_error: Optional[str]) -> HTTPException:
+    """503 for when every candidate failed or is cooling down, with a Retry-After hint"""
+    models = [preferred_model] + [m for m in fallback_models if m != preferred_model]
+    retry_after = int(router.retry_after(models) + 0.999)
+    if last_error is None:
+        last_error = "all models are cooling down or have open circuits"
+    return HTTPException(
+        status_code=503,
+        detail=f"All models are currently unavailable. Last error: {last_error}. Please try again in a few minutes.",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+async def _complete_with_fallback(
+    openrouter_api_key: str,
+    messages: List[Dict[str, Any]],
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    timeout: Optional[float] = None
+) -> dict:
+    """
+    Run a chat completion, falling back through fallback_models when the
+    preferred model is rate-limited, times out or fails upstream (5xx).
+
+    Candidates are ordered by the model router: the preferred model first
+    while it is healthy, then fallbacks by expected latency. Models cooling
+    down after a 429 or with an open circuit are skipped. Each attempt
+    first waits for an LLM slot (see admission); a full queue raises 503.
+
+    Each attempt only gets what is left of the request's deadline (see
+    deadlines); running out raises DeadlineExceeded (504) without counting
+    against the model that was cut short.
+
+    Returns: dict with 'content', 'model_used', 'usage', 'fallback_used' and 'hedged' keys
+    """
+    last_error = None
+
+    for model in router.candidates(preferred_model, fallback_models):
+        admitted = await _admit(model, timeout)
+        if admitted is None:
+            continue
+        attempt_timeout, granted = admitted
+        # Sized down to the deadline, which a later waiter on shared work may have extended since
+        cut_short = attempt_timeout < (timeout if timeout is not None else OPENROUTER_TIMEOUT)
+        started = time.perf_counter()
+        metrics.gauge_add("openrouter_requests_in_flight", 1, model=model)
+        try:
+            response = await deadlines.wait(
+                post_chat_completion(
+                    openrouter_api_key,
+                    {"model": model, "messages": messages},
+                    title,
+                    timeout=attempt_timeout
+                ),
+                stage="llm"
+            )
+
+            # If successful, return immediately
+            if response.status_code == 200:
+                result = response.json()
+                router.record_success(model, time.perf_counter() - started)
+                _record_attempt(model, "success", started)
+                metrics.record_usage(model, result.get("usage", {}))
+                return {
+                    "content": result["choices"][0]["message"]["content"],
+                    "model_used": model,
+                    "usage": result.get("usage", {}),
+                    "fallback_used": model != preferred_model,
+                    "hedged": False
+                }
+
+            # If rate-limited (429), cool the model down and try the next one
+            if response.status_code == 429:
+                print(f"Model {model} is rate-limited, trying next fallback...")
+                router.record_failure(
+                    model, "rate_limited", parse_retry_after(response.headers.get("Retry-After"))
+                )
+                _record_attempt(model, "rate_limited", started)
+                last_error = f"Rate limited: {model}"
+                continue
+
+            # Upstream failures count against the model's health
+            if response.status_code >= 500:
+                print(f"Model {model} returned {response.status_code}, trying next fallback...")
+                router.record_failure(model, "server_error")
+                _record_attempt(model, "server_error", started)
+                last_error = f"HTTP {response.status_code}: {model}"
+                continue
+
+            # For other errors (bad request, auth), raise immediately
+            router.release(model)
+            _record_attempt(model, "client_error", started)
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"OpenRouter API error with {model}: {response.text}"
+            )
+
+        except deadlines.DeadlineExceeded:
+            router.release(model)
+            _record_attempt(model, "deadline", started)
+            raise
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            if deadlines.expired():
+                router.release(model)
+                _record_attempt(model, "deadline", started)
+                raise deadlines.exceeded("llm")
+            if cut_short:
+                # Stopped by the deadline, not the model's fault; try the next one with the extra time
+                router.release(model)
+                _record_attempt(model, "deadline", started)
+                last_error = f"Timeout: {model}"
+                continue
+            print(f"Model {model} timed out, trying next fallback...")
+            router.record_failure(model, "timeout")
+            _record_attempt(model, "timeout", started)
+            last_error = f"Timeout: {model}"
+            continue
+        except HTTPException:
+            raise
+        except asyncio.CancelledError:
+            router.release(model)
+            _record_attempt(model, "cancelled", started)
+            raise
+        except Exception as e:
+            print(f"Error with model {model}: {str(e)}, trying next fallback...")
+            router.record_failure(model, "error")
+            _record_attempt(model, "error", started)
+            last_error = f"Error with {model}: {str(e)}"
+            continue
+        finally:
+            metrics.gauge_add("openrouter_requests_in_flight", -1, model=model)
+            admission.llm.release(model, granted)
+
+    # If all models failed, raise error with details
+    raise _all_unavailable(preferred_model, fallback_models, last_error)
+
+
+def _use_hedging(hedge: Optional[bool]) -> bool:
+    return HEDGE_ENABLED if hedge is None else hedge
+
+
+def _exhausted(error: BaseException) -> bool:
+    """
+    True for the 503 raised once every candidate failed - other errors are
+    not retryable. An admission Overloaded is a 503 too, but it means this
+    worker is shedding load, not that the models failed: trying more
+    fallbacks would only ask for more slots.
+    """
+    if isinstance(error, admission.Overloaded):
+        return False
+    return isinstance(error, HTTPException) and error.status_code == 503
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def complete_with_fallback(
+    openrouter_api_key: str,
+    messages: List[Dict[str, Any]],
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    timeout: Optional[float] = None,
+    hedge: Optional[bool] = None
+) -> dict:
+    """
+    Run a chat completion with router-ordered fallbacks and optional hedging
+    (see _complete_hedged), recording the call in the llm stage metrics.
+
+    Returns: dict with 'content', 'model_used', 'usage', 'fallback_used' and 'hedged' keys
+    """
+    with deadlines.stage("llm"):
+        result = await _complete_hedged(
+            openrouter_api_key, messages, preferred_model, fallback_models, title, timeout, hedge
+        )
+    metrics.record_llm_call(result)
+    return result
+
+
+async def _complete_hedged(
+    openrouter_api_key: str,
+    messages: List[Dict[str, Any]],
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    timeout: Optional[float] = None,
+    hedge: Optional[bool] = None
+) -> dict:
+    """
+    Run a chat completion with router-ordered fallbacks (see _complete_with_fallback).
+
+    With hedging on (hedge=True, or HEDGE_ENABLED when hedge is None) the
+    best candidate is raced against the next one once it has been running
+    longer than its observed p90 latency. The first successful answer wins
+    and the other request is cancelled. Hedges are limited by a per-process
+    budget (see model_router.HedgeBudget).
+
+    Returns: dict with 'content', 'model_used', 'usage', 'fallback_used' and 'hedged' keys
+    """
+    candidates = router.candidates(preferred_model, fallback_models)
+    if not _use_hedging(hedge) or len(candidates) < 2:
+        return await _complete_with_fallback(
+            openrouter_api_key, messages, preferred_model, fallback_models, title, timeout
+        )
+
+    primary, backup = candidates[0], candidates[1]
+    hedge_budget.deposit()
+
+    def attempt(model: str) -> asyncio.Task:
+        return asyncio.ensure_future(
+            _complete_with_fallback(openrouter_api_key, messages, model, [], title, timeout)
+        )
+
+    tasks = {attempt(primary): primary}
+    tried = [primary]
+    hedged = False
+    errors: List[BaseException] = []
+    try:
+        done, _ = await asyncio.wait(set(tasks), timeout=router.hedge_delay(primary))
+        if not done and hedge_budget.try_spend():
+            print(f"Model {primary} is slow, hedging with {backup}...")
+            tasks[attempt(backup)] = backup
+            tried.append(backup)
+            hedged = True
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [task for task in done if task.exception() is None]
+            errors.extend(task.exception() for task in done if task.exception() is not None)
+            if winners:
+                result = winners[0].result()
+                if hedged and tasks[winners[0]] == backup:
+                    hedge_budget.won += 1
+                return {
+                    **result,
+                    "fallback_used": result["model_used"] != preferred_model,
+                    "hedged": hedged
+                }
+    finally:
+        await _cancel([task for task in tasks if not task.done()])
+
+    for error in errors:
+        if not _exhausted(error):
+            raise error
+
+    # Both raced models failed - continue down the rest of the chain
+    rest = [m for m in candidates if m not in tried]
+    if not rest:
+        raise errors[-1]
+    result = await _complete_with_fallback(openrouter_api_key, messages, rest[0], rest[1:], title, timeout)
+    return {**result, "fallback_used": True, "hedged": hedged}
+
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield the data payloads of a server-sent event stream"""
+    async for line in response.aiter_lines():
+        # Lines starting with ':' are keep-alive comments
+        if line.startswith("data:"):
+            yield line[5:].strip()
+
+
+async def _stream_with_fallback(
+    openrouter_api_key: str,
+    messages: List[Dict[str, Any]],
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    timeout: Optional[float] = None
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Stream a chat completion as (event, data) tuples.
+
+    Yields ("delta", {"content": ...}) for each token chunk and finally
+    ("done", {"model_used", "usage", "fallback_used", "hedged"}). A model that fails
+    before emitting any token is skipped in favour of the next candidate
+    from the model router; a failure after tokens were emitted yields
+    ("error", {"detail": ...}).
+    Raises HTTPException if every model fails before streaming, and
+    DeadlineExceeded if the request's deadline runs out first.
+    """
+    last_error = None
+
+    for model in router.candidates(preferred_model, fallback_models):
+        admitted = await _admit(model, timeout)
+        if admitted is None:
+            continue
+        attempt_timeout, granted = admitted
+        cut_short = attempt_timeout < (timeout if timeout is not None else OPENROUTER_TIMEOUT)
+        # Reads may not wait past the request's deadline
+        request_timeout = httpx.Timeout(attempt_timeout, connect=OPENROUTER_CONNECT_TIMEOUT)
+        started = time.perf_counter()
+        emitted = False
+        finished = False
+        outcome = "cancelled"
+        metrics.gauge_add("openrouter_requests_in_flight", 1, model=model)
+        try:
+            async with get_client().stream(
+                "POST",
+                "/chat/completions",
+                headers=build_headers(openrouter_api_key, title),
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "stream": True,
+                    "usage": {"include": True}
+                },
+                timeout=request_timeout
+            ) as response:
+                if response.status_code == 429:
+                    print(f"Model {model} is rate-limited, trying next fallback...")
+                    router.record_failure(
+                        model, "rate_limited", parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                    finished = True
+                    outcome = "rate_limited"
+                    last_error = f"Rate limited: {model}"
+                    continue
+
+                if response.status_code >= 500:
+                    print(f"Model {model} returned {response.status_code}, trying next fallback...")
+                    router.record_failure(model, "server_error")
+                    finished = True
+                    outcome = "server_error"
+                    last_error = f"HTTP {response.status_code}: {model}"
+                    continue
+
+                if response.status_code != 200:
+                    outcome = "client_error"
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    raise HTTPException(
+                        status_code=response.status_code,
+                        detail=f"OpenRouter API error with {model}: {body}"
+                    )
+
+                usage = {}
+                async for data in iter_sse_data(response):
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if "error" in chunk:
+                        raise RuntimeError(chunk["error"].get("message", str(chunk["error"])))
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    choices = chunk.get("choices") or []
+                    content = choices[0].get("delta", {}).get("content") if choices else None
+                    if content:
+                        if not emitted:
+                            router.record_first_token(model, time.perf_counter() - started)
+                        emitted = True
+                        yield "delta", {"content": content}
+                        if deadlines.expired():
+                            outcome = "deadline"
+                            yield "error", {"detail": deadlines.exceeded("llm").detail}
+                            return
+
+                if not emitted:
+                    print(f"Model {model} returned an empty stream, trying next fallback...")
+                    router.record_failure(model, "error")
+                    finished = True
+                    outcome = "error"
+                    last_error = f"Empty response: {model}"
+                    continue
+
+                router.record_success(model, time.perf_counter() - started)
+                finished = True
+                outcome = "success"
+                metrics.record_usage(model, usage)
+                yield "done", {
+                    "model_used": model,
+                    "usage": usage,
+                    "fallback_used": model != preferred_model,
+                    "hedged": False
+                }
+                return
+
+        except httpx.TimeoutException:
+            if deadlines.expired():
+                outcome = "deadline"
+                if emitted:
+                    yield "error", {"detail": deadlines.exceeded("llm").detail}
+                    return
+                raise deadlines.exceeded("llm")
+            if cut_short and not emitted:
+                # Stopped by a deadline that was extended meanwhile, not the model's fault
+                outcome = "deadline"
+                last_error = f"Timeout: {model}"
+                continue
+            router.record_failure(model, "timeout")
+            finished = True
+            outcome = "timeout"
+            if emitted:
+                yield "error", {"detail": f"Timeout while streaming from {model}"}
+                return
+            print(f"Model {model} timed out, trying next fallback...")
+            last_error = f"Timeout: {model}"
+            continue
+        except HTTPException:
+            raise
+        except Exception as e:
+            router.record_failure(model, "error")
+            finished = True
+            outcome = "error"
+            if emitted:
+                yield "error", {"detail": f"Error while streaming from {model}: {str(e)}"}
+                return
+            print(f"Error with model {model}: {str(e)}, trying next fallback...")
+            last_error = f"Error with {model}: {str(e)}"
+            continue
+        finally:
+            # Client went away or a non-retryable error: free a half-open trial slot
+            if not finished:
+                router.release(model)
+            metrics.gauge_add("openrouter_requests_in_flight", -1, model=model)
+            admission.llm.release(model, granted)
+            _record_attempt(model, outcome, started)
+
+    raise _all_unavailable(preferred_model, fallback_models, last_error)
+
+
+async def _relabel(
+    events: AsyncIterator[Tuple[str, dict]],
+    preferred_model: str,
+    hedged: bool
+) -> AsyncIterator[Tuple[str, dict]]:
+    """Fix up the done event of a stream started on a model other than preferred_model"""
+    async for event, data in events:
+        if event == "done":
+            data = {**data, "fallback_used": data["model_used"] != preferred_model, "hedged": hedged}
+        yield event, data
+
+
+async def stream_with_fallback(
+    openrouter_api_key: str,
+    messages: List[Dict[str, Any]],
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    timeout: Optional[float] = None,
+    hedge: Optional[bool] = None
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Stream a chat completion with router-ordered fallbacks and optional
+    hedging (see _stream_hedged), recording the call in the llm stage
+    metrics once the stream is done.
+    """
+    started = time.perf_counter()
+    events = _stream_hedged(openrouter_api_key, messages, preferred_model, fallback_models, title, timeout, hedge)
+    try:
+        async for event, data in events:
+            if event == "done":
+                deadlines.record("llm", time.perf_counter() - started)
+                metrics.record_llm_call(data)
+            yield event, data
+    finally:
+        await events.aclose()
+
+
+async def _stream_hedged(
+    openrouter_api_key: str,
+    messages: List[Dict[str, Any]],
+    preferred_model: str,
+    fallback_models: List[str],
+    title: str,
+    timeout: Optional[float] = None,
+    hedge: Optional[bool] = None
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Stream a chat completion with router-ordered fallbacks (see _stream_with_fallback).
+
+    With hedging on, the best candidate is raced against the next one once
+    it has gone longer than its observed p90 time-to-first-token without
+    producing output. Whichever model streams first wins and the other
+    stream is closed.
+    """
+    candidates = router.candidates(preferred_model, fallback_models)
+    if not _use_hedging(hedge) or len(candidates) < 2:
+        async for item in _stream_with_fallback(
+            openrouter_api_key, messages, preferred_model, fallback_models, title, timeout
+        ):
+            yield item
+        return
+
+    primary, backup = candidates[0], candidates[1]
+    hedge_budget.deposit()
+
+    streams: Dict[asyncio.Task, Tuple[AsyncIterator, str]] = {}
+
+    def attempt(model: str):
+        stream = _stream_with_fallback(openrouter_api_key, messages, model, [], title, timeout)
+        streams[asyncio.ensure_future(stream.__anext__())] = (stream, model)
+
+    attempt(primary)
+    tried = [primary]
+    hedged = False
+    errors: List[BaseException] = []
+    winner = None
+    try:
+        done, _ = await asyncio.wait(set(streams), timeout=router.hedge_delay(primary, streaming=True))
+        if not done and hedge_budget.try_spend():
+            print(f"Model {primary} is slow to stream, hedging with {backup}...")
+            attempt(backup)
+            tried.append(backup)
+            hedged = True
+
+        pending = set(streams)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                errors.append(task.exception())
+
+        if winner is not None:
+            stream, model = streams.pop(winner)
+            if hedged and model == backup:
+                hedge_budget.won += 1
+            # Close the losing stream before relaying the winner
+            losers = list(streams.items())
+            streams.clear()
+            await _cancel([task for task, _ in losers])
+            for _, (loser, _) in losers:
+                await loser.aclose()
+
+            try:
+                first_event, first_data = winner.result()
+                async for item in _relabel(_prepend(first_event, first_data, stream), preferred_model, hedged):
+                    yield item
+            finally:
+                await stream.aclose()
+            return
+    finally:
+        tasks = list(streams)
+        await _cancel(tasks)
+        for task in tasks:
+            await streams[task][0].aclose()
+
+    for error in errors:
+        if not _exhausted(error):
+            raise error
+
+    # Both raced models failed before streaming - continue down the rest of the chain
+    rest = [m for m in candidates if m not in tried]
+    if not rest:
+        raise errors[-1]
+    async for item in _relabel(
+        _stream_with_fallback(openrouter_api_key, messages, rest[0], rest[1:], title, timeout),
+        preferred_model,
+        hedged
+    ):
+        yield item
+
+
+async def _prepend(event: str, data: dict, events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[Tuple[str, dict]]:
+    yield event, data
+    async for item in events:
+        yield item
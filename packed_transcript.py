@@ -0,0 +1,209 @@
+import base64
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+class Cue:
+    """One caption, built on demand (same attributes as FetchedTranscriptSnippet)"""
+
+    __slots__ = ("text", "start", "duration")
+
+    def __init__(self, text: str, start: float, duration: float):
+        self.text = text
+        self.start = start
+        self.duration = duration
+
+    def __repr__(self) -> str:
+        return f"Cue(start={self.start}, duration={self.duration}, text={self.text!r})"
+
+
+class PackedTranscript:
+    """
+    A transcript stored as packed arrays instead of one object per cue.
+
+    Start times and durations live in array('d') columns and the cue texts
+    in one string, with each cue's text found through an offsets array. A
+    1h video takes a few dozen KB this way instead of thousands of dicts
+    and snippet objects.
+
+    between() returns a view of a time range that shares the arrays with
+    the full transcript, so slicing copies nothing. Iterating yields Cue
+    objects, so code written for FetchedTranscript keeps working; hot paths
+    should use rows() instead.
+    """
+
+    __slots__ = (
+        "video_id", "language", "language_code", "is_generated",
+        "_starts", "_durations", "_offsets", "_text", "_lo", "_hi"
+    )
+
+    def __init__(
+        self,
+        video_id: str,
+        language: str,
+        language_code: str,
+        is_generated: bool,
+        starts: array,
+        durations: array,
+        offsets: array,
+        text: str,
+        lo: int = 0,
+        hi: Optional[int] = None
+    ):
+        self.video_id = video_id
+        self.language = language
+        self.language_code = language_code
+        self.is_generated = is_generated
+        self._starts = starts
+        self._durations = durations
+        self._offsets = offsets
+        self._text = text
+        self._lo = lo
+        self._hi = len(starts) if hi is None else hi
+
+    @classmethod
+    def from_snippets(
+        cls,
+        snippets: Iterable,
+        video_id: str,
+        language: str,
+        language_code: str,
+        is_generated: bool
+    ) -> "PackedTranscript":
+        starts = array("d")
+        durations = array("d")
+        offsets = array("I", [0])
+        texts = []
+        position = 0
+        for snippet in snippets:
+            starts.append(snippet.start)
+            durations.append(snippet.duration)
+            texts.append(snippet.text)
+            position += len(snippet.text)
+            offsets.append(position)
+        return cls(video_id, language, language_code, is_generated, starts, durations, offsets, "".join(texts))
+
+    @classmethod
+    def from_fetched(cls, fetched) -> "PackedTranscript":
+        """Pack a youtube_transcript_api FetchedTranscript"""
+        return cls.from_snippets(
+            fetched.snippets,
+            fetched.video_id,
+            fetched.language,
+            fetched.language_code,
+            fetched.is_generated
+        )
+
+    def __len__(self) -> int:
+        return self._hi - self._lo
+
+    def rows(self) -> Iterator[Tuple[str, float, float]]:
+        """Yield (text, start, duration) per cue without building cue objects"""
+        text = self._text
+        lo, hi = self._lo, self._hi
+        offsets = memoryview(self._offsets)
+        for begin, end, start, duration in zip(
+            offsets[lo:hi],
+            offsets[lo + 1:hi + 1],
+            memoryview(self._starts)[lo:hi],
+            memoryview(self._durations)[lo:hi]
+        ):
+            yield text[begin:end], start, duration
+
+    def __iter__(self) -> Iterator[Cue]:
+        for text, start, duration in self.rows():
+            yield Cue(text, start, duration)
+
+    def __getitem__(self, index: int) -> Cue:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("cue index out of range")
+        i = self._lo + index
+        return Cue(self._text[self._offsets[i]:self._offsets[i + 1]], self._starts[i], self._durations[i])
+
+    def to_raw_data(self) -> List[dict]:
+        """Cues as dicts, in FetchedTranscript.to_raw_data() format"""
+        return [{"text": text, "start": start, "duration": duration} for text, start, duration in self.rows()]
+
+    def between(self, start: Optional[float] = None, end: Optional[float] = None) -> "PackedTranscript":
+        """
+        Cues overlapping [start, end) seconds, found by binary search over the
+        start times. A cue still running at `start` is included.
+        """
+        lo, hi = self._lo, self._hi
+        if start is not None:
+            first = bisect_left(self._starts, start, lo, hi)
+            if first > lo and self._starts[first - 1] + self._durations[first - 1] > start:
+                first -= 1
+            lo = first
+        if end is not None:
+            hi = max(bisect_left(self._starts, end, lo, hi), lo)
+        return PackedTranscript(
+            self.video_id, self.language, self.language_code, self.is_generated,
+            self._starts, self._durations, self._offsets, self._text, lo, hi
+        )
+
+    def cache_key(self) -> str:
+        """Identifies this transcript (and range) for derived caches"""
+        key = f"{self.video_id}:{self.language_code}"
+        if self._lo != 0 or self._hi != len(self._starts):
+            key += f":{self._lo}-{self._hi}"
+        return key
+
+    def to_dict(self) -> dict:
+        """
+        Compact JSON-serializable form for the disk cache: the columns as
+        base64-encoded arrays plus the text buffer.
+        """
+        lo, hi = self._lo, self._hi
+        base = self._offsets[lo]
+        offsets = array("I", (offset - base for offset in self._offsets[lo:hi + 1]))
+        return {
+            "video_id": self.video_id,
+            "language": self.language,
+            "language_code": self.language_code,
+            "is_generated": self.is_generated,
+            "byteorder": sys.byteorder,
+            "starts": _encode(self._starts[lo:hi]),
+            "durations": _encode(self._durations[lo:hi]),
+            "offsets": _encode(offsets),
+            "text": self._text[base:self._offsets[hi]]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PackedTranscript":
+        if "snippets" in data:
+            # Written before transcripts were packed: one dict per cue
+            return cls.from_snippets(
+                (Cue(s["text"], s["start"], s["duration"]) for s in data["snippets"]),
+                data["video_id"],
+                data["language"],
+                data["language_code"],
+                data["is_generated"]
+            )
+        swap = data.get("byteorder", sys.byteorder) != sys.byteorder
+        return cls(
+            data["video_id"],
+            data["language"],
+            data["language_code"],
+            data["is_generated"],
+            _decode("d", data["starts"], swap),
+            _decode("d", data["durations"], swap),
+            _decode("I", data["offsets"], swap),
+            data["text"]
+        )
+
+
+def _encode(values: array) -> str:
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _decode(typecode: str, encoded: str, swap: bool) -> array:
+    values = array(typecode)
+    values.frombytes(base64.b64decode(encoded))
+    if swap:
+        values.byteswap()
+    return values
@@ -0,0 +1,112 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+
+from tokens import estimate_tokens
+
+PATTERNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "patterns")
+
+# How often (seconds) to check patterns/ for changed files; 0 disables hot reload
+PATTERN_RELOAD_INTERVAL = float(os.getenv("PATTERN_RELOAD_INTERVAL", "30"))
+
+
+@dataclass
+class Pattern:
+    name: str
+    system_prompt: str
+    size_bytes: int
+    estimated_tokens: int
+    has_user_md: bool
+    mtime: float
+
+    def metadata(self) -> dict:
+        return {
+            "name": self.name,
+            "size_bytes": self.size_bytes,
+            "estimated_tokens": self.estimated_tokens,
+            "has_user_md": self.has_user_md
+        }
+
+
+class PatternRegistry:
+    """
+    In-memory index of Fabric patterns.
+
+    Each pattern directory with a system.md is read once; refresh() re-stats
+    the directory and only re-reads the system.md files whose mtime changed,
+    so request handlers never touch the filesystem.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._patterns: Dict[str, Pattern] = {}
+        self._names: List[str] = []
+        self.reloads = 0
+
+    def refresh(self) -> int:
+        """Rescan the patterns directory. Returns the number of entries (re)loaded."""
+        patterns = {}
+        loaded = 0
+
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+
+            system_file = os.path.join(entry.path, "system.md")
+            try:
+                stat = os.stat(system_file)
+            except OSError:
+                continue
+            has_user_md = os.path.exists(os.path.join(entry.path, "user.md"))
+
+            existing = self._patterns.get(entry.name)
+            if existing is not None and existing.mtime == stat.st_mtime:
+                existing.has_user_md = has_user_md
+                patterns[entry.name] = existing
+                continue
+
+            with open(system_file, 'r', encoding='utf-8') as f:
+                system_prompt = f.read()
+
+            patterns[entry.name] = Pattern(
+                name=entry.name,
+                system_prompt=system_prompt,
+                size_bytes=stat.st_size,
+                estimated_tokens=estimate_tokens(system_prompt),
+                has_user_md=has_user_md,
+                mtime=stat.st_mtime
+            )
+            loaded += 1
+
+        # Swap in the new index in one step so readers never see a partial scan
+        self._patterns = patterns
+        self._names = sorted(patterns)
+        if loaded:
+            self.reloads += 1
+        return loaded
+
+    def get(self, name: str) -> Optional[Pattern]:
+        return self._patterns.get(name)
+
+    def names(self) -> List[str]:
+        return self._names
+
+    def metadata(self) -> List[dict]:
+        return [self._patterns[name].metadata() for name in self._names]
+
+
+registry = PatternRegistry(PATTERNS_DIR)
+
+
+async def watch_patterns():
+    """Periodically reload changed patterns in the background"""
+    while True:
+        await asyncio.sleep(PATTERN_RELOAD_INTERVAL)
+        try:
+            loaded = await run_in_threadpool(registry.refresh)
+            if loaded:
+                print(f"Reloaded {loaded} changed pattern(s)")
+        except Exception as e:
+            print(f"Pattern reload error: {str(e)}")
@@ -0,0 +1,261 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional, TypeVar
+
+import requests
+from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api._errors import CouldNotRetrieveTranscript, RequestBlocked, YouTubeRequestFailed
+from youtube_transcript_api.proxies import WebshareProxyConfig
+
+import metrics
+
+T = TypeVar("T")
+
+# Webshare usernames user-<start>..user-<start + count - 1> form the pool. A
+# username that already ends in -<n> pins that single slot, as before.
+PROXY_SLOT_START = int(os.getenv("PROXY_SLOT_START", "1"))
+PROXY_SLOT_COUNT = int(os.getenv("PROXY_SLOT_COUNT", "10"))
+# Different slots tried for one fetch before giving up
+PROXY_FETCH_ATTEMPTS = int(os.getenv("PROXY_FETCH_ATTEMPTS", "3"))
+# Retries the transcript library makes on the same slot when YouTube answers 429
+PROXY_RETRIES_WHEN_BLOCKED = int(os.getenv("PROXY_RETRIES_WHEN_BLOCKED", "2"))
+# A slot YouTube blocks is skipped for this long, doubling for each consecutive block
+PROXY_QUARANTINE_SECONDS = float(os.getenv("PROXY_QUARANTINE_SECONDS", "300"))
+PROXY_MAX_QUARANTINE_SECONDS = float(os.getenv("PROXY_MAX_QUARANTINE_SECONDS", "3600"))
+# Consecutive connection/upstream failures that also quarantine a slot
+PROXY_MAX_CONSECUTIVE_FAILURES = int(os.getenv("PROXY_MAX_CONSECUTIVE_FAILURES", "3"))
+# Recent fetches per slot used for its success rate
+PROXY_HEALTH_WINDOW = int(os.getenv("PROXY_HEALTH_WINDOW", "50"))
+# Idle API clients (each with its own HTTP session) kept per slot for reuse
+PROXY_MAX_IDLE_CLIENTS = int(os.getenv("PROXY_MAX_IDLE_CLIENTS", "4"))
+
+LATENCY_ALPHA = 0.3
+SLOT_SUFFIX_RE = re.compile(r"-\d+$")
+
+
+class ProxySlot:
+    """One Webshare username (or the direct connection) and its health"""
+
+    def __init__(self, name: str, proxy_config: Optional[WebshareProxyConfig]):
+        self.name = name
+        self.proxy_config = proxy_config
+        self.idle_clients: List = []
+        self.in_flight = 0
+        self.outcomes = deque(maxlen=PROXY_HEALTH_WINDOW)
+        self.latency: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.blocks = 0
+        self.consecutive_failures = 0
+        self.consecutive_blocks = 0
+        self.quarantined_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def success_rate(self) -> float:
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.quarantined_until
+
+    def score(self) -> float:
+        """Lower is better: failures dominate, then latency scaled by current load"""
+        # Untried slots look fast, so every slot gets explored
+        latency = self.latency if self.latency is not None else 0.0
+        return (1.0 - self.success_rate()) * 10 + latency * (1 + self.in_flight)
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "slot": self.name,
+            "available": self.is_available(now),
+            "quarantine_remaining_seconds": round(max(self.quarantined_until - now, 0.0), 1),
+            "success_rate": round(self.success_rate(), 3),
+            "recent_fetches": len(self.outcomes),
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "in_flight": self.in_flight,
+            "idle_clients": len(self.idle_clients),
+            "successes": self.successes,
+            "failures": self.failures,
+            "blocks": self.blocks,
+            "last_error": self.last_error
+        }
+
+
+def _create_client(slot: ProxySlot):
+    return YouTubeTranscriptApi(proxy_config=slot.proxy_config, http_client=requests.Session())
+
+
+class ProxyPool:
+    """
+    Spreads YouTube requests over Webshare proxy slots and keeps their
+    transcript API clients alive between requests.
+
+    Each slot keeps a few idle YouTubeTranscriptApi clients. The library
+    clients aren't thread-safe, so a client is checked out by one request
+    at a time and returned for reuse afterwards, keeping its HTTP session
+    (connection pool, consent cookies). Slots are picked by "power of two
+    choices" on their success rate, latency and load. A slot YouTube blocks
+    is quarantined with exponential backoff, and the fetch is retried on a
+    different slot.
+
+    Safe to use from threadpool workers.
+    """
+
+    def __init__(self, slots: List[ProxySlot], client_factory: Callable[[ProxySlot], object] = _create_client):
+        self.slots = slots
+        self.client_factory = client_factory
+        self.retried = 0
+        self._lock = threading.Lock()
+
+    def _choose(self, exclude: List[ProxySlot]) -> Optional[ProxySlot]:
+        now = time.time()
+        candidates = [s for s in self.slots if s not in exclude and s.is_available(now)]
+        if not candidates:
+            # Everything is quarantined: rather than fail outright, try the
+            # slot that comes out of quarantine first
+            remaining = [s for s in self.slots if s not in exclude]
+            return min(remaining, key=lambda s: s.quarantined_until) if remaining else None
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if first.score() <= second.score() else second
+
+    def _checkout(self, exclude: List[ProxySlot]):
+        with self._lock:
+            slot = self._choose(exclude)
+            if slot is None:
+                return None, None
+            slot.in_flight += 1
+            client = slot.idle_clients.pop() if slot.idle_clients else None
+        if client is None:
+            client = self.client_factory(slot)
+        return slot, client
+
+    def _checkin(self, slot: ProxySlot, client, outcome: str, elapsed: float, error: Optional[Exception] = None):
+        with self._lock:
+            slot.in_flight -= 1
+            if outcome == "success":
+                slot.successes += 1
+                slot.outcomes.append(True)
+                slot.consecutive_failures = 0
+                slot.consecutive_blocks = 0
+                slot.latency = elapsed if slot.latency is None else (
+                    LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * slot.latency
+                )
+                if len(slot.idle_clients) < PROXY_MAX_IDLE_CLIENTS:
+                    slot.idle_clients.append(client)
+                return
+
+            slot.outcomes.append(False)
+            message = str(error).strip().splitlines()
+            slot.last_error = f"{type(error).__name__}: {message[0][:200] if message else ''}"
+            if outcome == "blocked":
+                slot.blocks += 1
+                slot.consecutive_blocks += 1
+                quarantine = PROXY_QUARANTINE_SECONDS * 2 ** (slot.consecutive_blocks - 1)
+            else:
+                slot.failures += 1
+                slot.consecutive_failures += 1
+                quarantine = PROXY_QUARANTINE_SECONDS if slot.consecutive_failures >= PROXY_MAX_CONSECUTIVE_FAILURES else 0
+            if quarantine:
+                slot.quarantined_until = time.time() + min(quarantine, PROXY_MAX_QUARANTINE_SECONDS)
+                # Sessions of a blocked slot may carry cookies YouTube has flagged
+                slot.idle_clients.clear()
+                print(f"Proxy slot {slot.name} quarantined for {min(quarantine, PROXY_MAX_QUARANTINE_SECONDS):.0f}s ({type(error).__name__})")
+            elif len(slot.idle_clients) < PROXY_MAX_IDLE_CLIENTS:
+                slot.idle_clients.append(client)
+
+    def run(self, call: Callable[[object], T]) -> T:
+        """
+        Run call(client) on a pooled client (blocking - call from the threadpool).
+
+        Blocks and connection failures are retried on up to
+        PROXY_FETCH_ATTEMPTS different slots. Errors about the video itself
+        (transcripts disabled, unavailable, ...) are raised immediately and
+        count as a healthy slot.
+        """
+        tried: List[ProxySlot] = []
+        last_error: Optional[Exception] = None
+        for _ in range(max(PROXY_FETCH_ATTEMPTS, 1)):
+            slot, client = self._checkout(tried)
+            if slot is None:
+                break
+            tried.append(slot)
+            if len(tried) > 1:
+                self.retried += 1
+            started = time.perf_counter()
+            try:
+                result = call(client)
+            except RequestBlocked as e:
+                self._checkin(slot, client, "blocked", time.perf_counter() - started, e)
+                print(f"Proxy slot {slot.name} was blocked by YouTube, retrying on another slot...")
+                last_error = e
+                continue
+            except (YouTubeRequestFailed, requests.RequestException) as e:
+                self._checkin(slot, client, "failure", time.perf_counter() - started, e)
+                print(f"Proxy slot {slot.name} failed ({type(e).__name__}), retrying on another slot...")
+                last_error = e
+                continue
+            except CouldNotRetrieveTranscript:
+                self._checkin(slot, client, "success", time.perf_counter() - started)
+                raise
+            except BaseException as e:
+                self._checkin(slot, client, "failure", time.perf_counter() - started, e)
+                raise
+            self._checkin(slot, client, "success", time.perf_counter() - started)
+            return result
+        raise last_error
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self._lock:
+            slots = [slot.snapshot(now) for slot in self.slots]
+        return {
+            "proxied": any(slot.proxy_config is not None for slot in self.slots),
+            "slots": len(slots),
+            "available_slots": sum(slot["available"] for slot in slots),
+            "retried_fetches": self.retried,
+            "fetch_attempts": PROXY_FETCH_ATTEMPTS,
+            "per_slot": slots
+        }
+
+    def metrics(self):
+        """Per-slot counters as metrics samples (see metrics.register_collector)"""
+        with self._lock:
+            counts = [(slot.name, slot.successes, slot.failures, slot.blocks) for slot in self.slots]
+        for name, successes, failures, blocks in counts:
+            yield "youtube_proxy_requests_total", {"slot": name, "outcome": "success"}, successes
+            yield "youtube_proxy_requests_total", {"slot": name, "outcome": "failure"}, failures
+            yield "youtube_proxy_requests_total", {"slot": name, "outcome": "blocked"}, blocks
+
+
+def build_slots() -> List[ProxySlot]:
+    """Slots from the Webshare credentials in the environment, or one direct slot"""
+    # Support multiple environment variable naming conventions
+    proxy_username = os.getenv("webshare_user") or os.getenv("WEBSHARE_PROXY_USERNAME")
+    proxy_password = os.getenv("webshare_pass") or os.getenv("WEBSHARE_PROXY_PASSWORD")
+
+    # No proxy for local development
+    if not (proxy_username and proxy_password):
+        return [ProxySlot("direct", None)]
+
+    def slot(username: str) -> ProxySlot:
+        return ProxySlot(username, WebshareProxyConfig(
+            proxy_username=username,
+            proxy_password=proxy_password,
+            retries_when_blocked=PROXY_RETRIES_WHEN_BLOCKED
+        ))
+
+    # Webshare requires username-X format (e.g., opgdacdt-1)
+    if SLOT_SUFFIX_RE.search(proxy_username):
+        return [slot(proxy_username)]
+    return [slot(f"{proxy_username}-{i}") for i in range(PROXY_SLOT_START, PROXY_SLOT_START + PROXY_SLOT_COUNT)]
+
+
+pool = ProxyPool(build_slots())
+metrics.register_collector(pool.metrics)
@@ -0,0 +1,173 @@
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache import LRUCache, MISSING
+from tokens import estimate_tokens
+
+# Transcript segments are grouped into windows of this many seconds...
+RETRIEVAL_WINDOW_SECONDS = float(os.getenv("RETRIEVAL_WINDOW_SECONDS", "60"))
+# ...each overlapping the previous one by this many seconds
+RETRIEVAL_WINDOW_OVERLAP = float(os.getenv("RETRIEVAL_WINDOW_OVERLAP", "15"))
+# Windows sent with each question
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+# retrieval=auto switches retrieval on for transcripts above this many tokens
+RETRIEVAL_AUTO_MIN_TOKENS = int(os.getenv("RETRIEVAL_AUTO_MIN_TOKENS", "8000"))
+# Per-video indexes kept in memory
+RETRIEVAL_INDEX_CACHE_ENTRIES = int(os.getenv("RETRIEVAL_INDEX_CACHE_ENTRIES", "128"))
+
+# Accepted values for the `retrieval` query parameter
+#   auto - retrieve when the transcript is long (RETRIEVAL_AUTO_MIN_TOKENS) or doesn't fit the model
+#   on   - always send only the top-k windows
+#   off  - always send the full transcript
+RETRIEVAL_MODE_PATTERN = "^(auto|on|off)$"
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    "a about an and are as at be but by did do does for from had has have he her his how i if in "
+    "is it its me my of on or our she so than that the their them then there they this to was "
+    "we were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+@dataclass
+class Window:
+    start: float
+    end: float
+    text: str
+
+
+class SegmentIndex:
+    """BM25 inverted index over time-windowed transcript chunks"""
+
+    def __init__(self, windows: List[Window]):
+        self.windows = windows
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+        for i, window in enumerate(windows):
+            terms = Counter(tokenize(window.text))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((i, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        count = len(windows)
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[Tuple[Window, float]]:
+        """Return up to k (window, score) pairs with a positive score, best first"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = 1 - BM25_B + BM25_B * self.lengths[i] / (self.avg_length or 1)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.windows[i], score) for i, score in best]
+
+
+def build_windows(snippets, seconds: float = RETRIEVAL_WINDOW_SECONDS, overlap: float = RETRIEVAL_WINDOW_OVERLAP) -> List[Window]:
+    """Group transcript snippets into overlapping windows of roughly `seconds` each"""
+    snippets = list(snippets)
+    step = max(seconds - overlap, 1.0)
+    windows = []
+    first = 0
+    window_start = snippets[0].start if snippets else 0.0
+    while first < len(snippets):
+        window_end = window_start + seconds
+        lines = []
+        last = first
+        while last < len(snippets) and (snippets[last].start < window_end or not lines):
+            snippet = snippets[last]
+            lines.append(f"[{snippet.start:.2f}s] {snippet.text}")
+            last += 1
+        end = snippets[last - 1].start + snippets[last - 1].duration
+        windows.append(Window(start=snippets[first].start, end=end, text="\n".join(lines)))
+        if last >= len(snippets):
+            break
+        # Next window starts `step` seconds later (always advancing at least one snippet)
+        window_start += step
+        while first < len(snippets) - 1 and snippets[first].start < window_start:
+            first += 1
+        window_start = max(window_start, snippets[first].start)
+    return windows
+
+
+index_cache = LRUCache(RETRIEVAL_INDEX_CACHE_ENTRIES, float("inf"))
+
+
+async def get_index(transcript) -> Tuple[SegmentIndex, bool, float]:
+    """
+    Return (index, cached, build_ms) for a PackedTranscript, building it
+    in the threadpool on first use.
+    """
+    key = transcript.cache_key()
+    index = index_cache.get(key)
+    if index is not MISSING:
+        return index, True, 0.0
+
+    started = time.perf_counter()
+    index = await run_in_threadpool(lambda: SegmentIndex(build_windows(transcript)))
+    index_cache.set(key, index)
+    return index, False, round((time.perf_counter() - started) * 1000, 1)
+
+
+def should_retrieve(mode: str, transcript_tokens: int, fits_model: bool) -> bool:
+    if mode == "on":
+        return True
+    if mode == "off":
+        return False
+    return transcript_tokens > RETRIEVAL_AUTO_MIN_TOKENS or not fits_model
+
+
+def build_retrieval_system_prompt(windows: List[Window]) -> str:
+    """System prompt carrying only the retrieved transcript excerpts, in time order"""
+    excerpts = "\n\n".join(
+        f"--- {window.start:.0f}s-{window.end:.0f}s ---\n{window.text}"
+        for window in sorted(windows, key=lambda window: window.start)
+    )
+    return (
+        "You are a helpful AI assistant that answers questions about a YouTube video. "
+        "You have access to the transcript excerpts most relevant to the question, with timestamps. "
+        "Be concise, accurate, and reference specific timestamps when relevant. "
+        "If the excerpts don't contain the answer, say so.\n\n"
+        f"TRANSCRIPT EXCERPTS:\n{excerpts}\n\n"
+        "Answer the user's questions based solely on this transcript content."
+    )
+
+
+def retrieval_report(index: SegmentIndex, hits, full_prompt: str, prompt: str, cached: bool, build_ms: float) -> dict:
+    full_tokens = estimate_tokens(full_prompt)
+    prompt_tokens = estimate_tokens(prompt)
+    return {
+        "windows": len(hits),
+        "indexed_windows": len(index.windows),
+        "ranges": [[round(window.start, 2), round(window.end, 2)] for window, _ in hits],
+        "prompt_tokens": prompt_tokens,
+        "full_transcript_prompt_tokens": full_tokens,
+        "tokens_saved": full_tokens - prompt_tokens,
+        "index_cached": cached,
+        "index_build_ms": build_ms
+    }
+
+
+def stats() -> dict:
+    return index_cache.stats()
@@ -0,0 +1,268 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Persistent full-text index of every transcript fetched through the API
+TRANSCRIPT_INDEX_ENABLED = os.getenv("TRANSCRIPT_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+TRANSCRIPT_INDEX_PATH = os.getenv(
+    "TRANSCRIPT_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "transcript_index.sqlite3")
+)
+# Consecutive segments stored per index row, so phrases split across caption
+# lines still match. Hits are reported at the row's first timestamp.
+SEARCH_SEGMENTS_PER_ROW = int(os.getenv("SEARCH_SEGMENTS_PER_ROW", "3"))
+# Best-ranked matching rows considered per query, bounding the work for very common terms
+SEARCH_MAX_MATCHES = int(os.getenv("SEARCH_MAX_MATCHES", "20000"))
+# Timestamped hits returned per video
+SEARCH_HITS_PER_VIDEO = int(os.getenv("SEARCH_HITS_PER_VIDEO", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT NOT NULL,
+    language_code TEXT NOT NULL,
+    language TEXT,
+    is_generated INTEGER,
+    segments INTEGER,
+    duration REAL,
+    indexed_at REAL,
+    PRIMARY KEY (video_id, language_code)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5(
+    text,
+    video_id UNINDEXED,
+    language_code UNINDEXED,
+    start UNINDEXED,
+    duration UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_local = threading.local()
+# SQLite allows one writer at a time; serialize writers in-process instead of hitting busy timeouts
+_write_lock = threading.Lock()
+
+stats = {"indexed": 0, "already_indexed": 0, "errors": 0, "queries": 0}
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection, creating the database on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(TRANSCRIPT_INDEX_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(TRANSCRIPT_INDEX_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def is_indexed(video_id: str, language_code: str) -> bool:
+    row = _connect().execute(
+        "SELECT 1 FROM videos WHERE video_id = ? AND language_code = ?",
+        (video_id, language_code)
+    ).fetchone()
+    return row is not None
+
+
+def index_transcript(transcript) -> bool:
+    """
+    Add a PackedTranscript to the index (blocking - call from the threadpool).
+
+    Idempotent: returns False without writing if the transcript is already
+    indexed. Never raises - indexing must not fail the request that fetched
+    the transcript.
+    """
+    if not TRANSCRIPT_INDEX_ENABLED:
+        return False
+    try:
+        if is_indexed(transcript.video_id, transcript.language_code):
+            stats["already_indexed"] += 1
+            return False
+
+        cues = list(transcript.rows())
+        rows = []
+        for i in range(0, len(cues), SEARCH_SEGMENTS_PER_ROW):
+            group = cues[i:i + SEARCH_SEGMENTS_PER_ROW]
+            _, first_start, _ = group[0]
+            _, last_start, last_duration = group[-1]
+            rows.append((
+                " ".join(text for text, _, _ in group),
+                transcript.video_id,
+                transcript.language_code,
+                first_start,
+                round(last_start + last_duration - first_start, 3)
+            ))
+        duration = cues[-1][1] + cues[-1][2] if cues else 0.0
+
+        conn = _connect()
+        with _write_lock, conn:
+            # Re-check under the lock: a concurrent request may have indexed it meanwhile
+            if is_indexed(transcript.video_id, transcript.language_code):
+                stats["already_indexed"] += 1
+                return False
+            conn.executemany(
+                "INSERT INTO segments (text, video_id, language_code, start, duration) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute(
+                "INSERT INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    transcript.video_id,
+                    transcript.language_code,
+                    transcript.language,
+                    int(transcript.is_generated),
+                    len(cues),
+                    duration,
+                    time.time()
+                )
+            )
+        stats["indexed"] += 1
+        return True
+    except Exception as e:
+        stats["errors"] += 1
+        print(f"Could not index transcript {transcript.video_id}: {str(e)}")
+        return False
+
+
+PHRASE_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """
+    Translate a user query into an FTS5 MATCH expression.
+
+    "double quoted" parts are phrase queries; every other word must appear
+    too (implicit AND). All terms are quoted, so FTS5 operators and
+    punctuation in the input can't produce syntax errors.
+    """
+    terms = []
+    for phrase, word in PHRASE_RE.findall(q):
+        text = (phrase or word).replace('"', " ").strip()
+        if text:
+            terms.append('"' + text.replace('"', '""') + '"')
+    return " ".join(terms) or None
+
+
+def search(q: str, page: int = 1, page_size: int = 10, language: Optional[str] = None) -> dict:
+    """
+    Rank indexed videos for q and return one page of them with their
+    best-matching timestamped snippets (blocking - call from the threadpool).
+
+    The full-text match runs once: its best SEARCH_MAX_MATCHES rows go into
+    a temporary table that the count, the page and the snippet lookup all
+    read from. Raises ValueError for a query without searchable terms.
+    """
+    match = build_match_query(q)
+    if match is None:
+        raise ValueError("Query must contain at least one search term")
+    stats["queries"] += 1
+
+    conn = _connect()
+    # Filter inside the capped match, so other languages can't crowd out the requested one
+    language_filter = "AND language_code = ?" if language else ""
+    with conn:
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS search_matches "
+            "(row INTEGER PRIMARY KEY, video_id TEXT, language_code TEXT, rank REAL)"
+        )
+        conn.execute("DELETE FROM temp.search_matches")
+        # rank is FTS5's BM25 score (lower is better), summed over each video's matching rows
+        conn.execute(
+            f"""
+            INSERT INTO temp.search_matches
+            SELECT rowid, video_id, language_code, rank FROM segments
+            WHERE segments MATCH ? {language_filter} ORDER BY rank LIMIT ?
+            """,
+            [match] + ([language] if language else []) + [SEARCH_MAX_MATCHES]
+        )
+        matched, total = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT video_id || ' ' || language_code) FROM temp.search_matches"
+        ).fetchone()
+        videos = conn.execute(
+            """
+            SELECT m.video_id, m.language_code, SUM(m.rank) AS score, COUNT(*) AS hits,
+                   v.language, v.is_generated, v.duration
+            FROM temp.search_matches AS m
+            LEFT JOIN videos AS v ON v.video_id = m.video_id AND v.language_code = m.language_code
+            GROUP BY m.video_id, m.language_code
+            ORDER BY score, m.video_id, m.language_code
+            LIMIT ? OFFSET ?
+            """,
+            (page_size, (page - 1) * page_size)
+        ).fetchall()
+        snippets = _page_snippets(conn, match, [(video_id, language_code) for video_id, language_code, *_ in videos])
+        conn.execute("DELETE FROM temp.search_matches")
+
+    results = []
+    for video_id, language_code, score, hits, language_name, is_generated, duration in videos:
+        results.append({
+            "video_id": video_id,
+            "language_code": language_code,
+            "language": language_name,
+            "is_generated": bool(is_generated) if is_generated is not None else None,
+            "duration": duration,
+            "score": round(-score, 4),
+            "matches": hits,
+            "hits": [
+                {"start": start, "duration": hit_duration, "snippet": text}
+                for start, hit_duration, text in sorted(snippets.get((video_id, language_code), []))
+            ]
+        })
+
+    return {
+        "query": q,
+        "match": match,
+        "page": page,
+        "page_size": page_size,
+        "total_videos": total,
+        "total_pages": (total + page_size - 1) // page_size,
+        "truncated": matched >= SEARCH_MAX_MATCHES,
+        "results": results
+    }
+
+
+def _page_snippets(conn: sqlite3.Connection, match: str, videos: List[Tuple[str, str]]) -> Dict[Tuple[str, str], list]:
+    """
+    Snippets for the best SEARCH_HITS_PER_VIDEO matches of each page video,
+    in one query. The rows are picked from temp.search_matches, so snippet()
+    only runs on the rows that are returned.
+    """
+    if not videos:
+        return {}
+    pairs = ", ".join("(?, ?)" for _ in videos)
+    rows = conn.execute(
+        f"""
+        SELECT video_id, language_code, start, duration, snippet(segments, 0, '<mark>', '</mark>', '…', 24)
+        FROM segments
+        WHERE segments MATCH ? AND rowid IN (
+            SELECT row FROM (
+                SELECT row, ROW_NUMBER() OVER (PARTITION BY video_id, language_code ORDER BY rank) AS n
+                FROM temp.search_matches
+                WHERE (video_id, language_code) IN (VALUES {pairs})
+            )
+            WHERE n <= ?
+        )
+        """,
+        [match] + [value for video in videos for value in video] + [SEARCH_HITS_PER_VIDEO]
+    ).fetchall()
+    snippets: Dict[Tuple[str, str], list] = {}
+    for video_id, language_code, start, duration, text in rows:
+        snippets.setdefault((video_id, language_code), []).append((start, duration, text))
+    return snippets
+
+
+def index_stats() -> dict:
+    """Index size and counters (blocking)"""
+    if not TRANSCRIPT_INDEX_ENABLED:
+        return {"enabled": False}
+    conn = _connect()
+    videos = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+    try:
+        size = os.path.getsize(TRANSCRIPT_INDEX_PATH)
+    except OSError:
+        size = 0
+    return {"enabled": True, "videos": videos, "size_bytes": size, **stats}
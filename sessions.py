@@ -0,0 +1,309 @@
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+import openrouter
+import shared_cache
+from cache import LRUCache, MISSING
+from tokens import estimate_tokens
+
+# Idle time after which a chat session is dropped (refreshed on every turn)
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "3600"))
+# Sessions kept in memory; the least recently used are evicted first
+CHAT_SESSION_MAX_ENTRIES = int(os.getenv("CHAT_SESSION_MAX_ENTRIES", "1000"))
+# Token budget for the conversation history sent with each turn (the transcript is not counted)
+CHAT_SESSION_HISTORY_TOKENS = int(os.getenv("CHAT_SESSION_HISTORY_TOKENS", "4000"))
+# What happens to turns that no longer fit the budget:
+#   drop      - forget them
+#   summarize - fold them into a running summary with one extra LLM call
+CHAT_SESSION_TRIM_MODE = os.getenv("CHAT_SESSION_TRIM_MODE", "summarize")
+# Keep sessions in the shared cache tier too, so any worker process can serve
+# the next turn (and sessions survive restarts). With a single worker this
+# can be turned off to keep sessions in memory only.
+CHAT_SESSION_SHARED = os.getenv("CHAT_SESSION_SHARED", "true").lower() in ("1", "true", "yes")
+CHAT_SESSION_DIR = os.getenv(
+    "CHAT_SESSION_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sessions")
+)
+
+SUMMARY_PROMPT = (
+    "You condense the earlier part of a conversation about a YouTube video. "
+    "Write a brief summary (under 150 words) of what the user asked and what was answered, "
+    "keeping any [timestamps] that were referenced. Output only the summary."
+)
+
+
+def build_chat_system_prompt(transcript_text: str) -> str:
+    """System prompt that gives the model the full transcript as context"""
+    return (
+        "You are a helpful AI assistant that answers questions about a YouTube video. "
+        "You have access to the full transcript with timestamps. "
+        "Be concise, accurate, and reference specific timestamps when relevant.\n\n"
+        f"TRANSCRIPT:\n{transcript_text}\n\n"
+        "Answer the user's questions based solely on this transcript content."
+    )
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    video_id: str
+    language: str
+    model: str
+    # Built once at creation and never modified, so every turn starts with
+    # byte-identical prompt bytes and provider-side prompt caching can apply
+    system_prompt: str
+    history: List[Dict[str, str]] = field(default_factory=list)
+    summary: Optional[str] = None
+    trimmed_turns: int = 0
+    turns: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    # Bumped on every save to the shared tier; a save based on an older
+    # version is rejected instead of overwriting a newer turn
+    version: int = 0
+    # When the fixed fields were last written to the shared tier (see _save)
+    prompt_saved_at: float = field(default_factory=time.time)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    # Written once to the shared tier when the session is created
+    FIXED_FIELDS = ("session_id", "video_id", "language", "model", "system_prompt", "created_at")
+    # Rewritten (and versioned) on every turn
+    STATE_FIELDS = ("history", "summary", "trimmed_turns", "turns", "last_used", "version", "prompt_saved_at")
+
+    def fixed(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIXED_FIELDS}
+
+    def state(self) -> dict:
+        return {name: getattr(self, name) for name in self.STATE_FIELDS}
+
+    def to_dict(self) -> dict:
+        return {**self.fixed(), **self.state()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatSession":
+        return cls(**data)
+
+    def load_state(self, data: dict):
+        """Take over history and counters saved by another worker"""
+        for name in self.STATE_FIELDS:
+            # Rows saved before version/prompt_saved_at existed count as 0
+            setattr(self, name, data.get(name, 0) if name in ("version", "prompt_saved_at") else data[name])
+
+    def history_tokens(self) -> int:
+        tokens = sum(estimate_tokens(message["content"]) for message in self.history)
+        return tokens + (estimate_tokens(self.summary) if self.summary else 0)
+
+    def build_messages(self, user_message: str) -> List[Dict[str, str]]:
+        """Stable system prompt first, then the running summary, history and the new message"""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}"
+            })
+        messages.extend(self.history)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def info(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "video_id": self.video_id,
+            "language": self.language,
+            "model": self.model,
+            "turns": self.turns,
+            "history_turns": len(self.history) // 2,
+            "history_tokens": self.history_tokens(),
+            "trimmed_turns": self.trimmed_turns,
+            "summary": self.summary,
+            "transcript_tokens": estimate_tokens(self.system_prompt),
+            "created_at": self.created_at,
+            "expires_in_seconds": round(max(self.last_used + CHAT_SESSION_TTL - time.time(), 0.0), 1)
+        }
+
+
+# This worker's session objects (with their locks); the shared tier holds the
+# authoritative copy when CHAT_SESSION_SHARED is on
+store = LRUCache(CHAT_SESSION_MAX_ENTRIES, CHAT_SESSION_TTL)
+shared = shared_cache.open_cache(
+    "chat_sessions",
+    CHAT_SESSION_DIR,
+    CHAT_SESSION_MAX_ENTRIES,
+    CHAT_SESSION_TTL
+) if CHAT_SESSION_SHARED else None
+# The fixed fields, above all the system prompt with the whole transcript,
+# kept apart so a turn only reads and writes the history. They live for two
+# TTLs and are rewritten about once per TTL while the session is in use.
+prompts = shared_cache.open_cache(
+    "chat_session_prompts",
+    os.path.join(CHAT_SESSION_DIR, "prompts"),
+    CHAT_SESSION_MAX_ENTRIES,
+    2 * CHAT_SESSION_TTL
+) if CHAT_SESSION_SHARED else None
+
+
+async def _save(session: ChatSession):
+    """
+    Write the session to the shared tier. With the sqlite backend the write
+    only succeeds if nobody saved the session since this worker loaded it;
+    otherwise the turn fails with 409 rather than overwriting the other one.
+    """
+    if shared is None:
+        return
+    if time.time() - session.prompt_saved_at > CHAT_SESSION_TTL:
+        await run_in_threadpool(prompts.set, session.session_id, session.fixed())
+        session.prompt_saved_at = time.time()
+    if not isinstance(shared, shared_cache.SQLiteCache):
+        await run_in_threadpool(shared.set, session.session_id, session.state())
+        return
+
+    session.version += 1
+    saved = await run_in_threadpool(
+        shared.compare_and_set, session.session_id, session.state(), session.version - 1
+    )
+    if not saved:
+        session.version -= 1
+        raise HTTPException(
+            status_code=409,
+            detail=f"Chat session '{session.session_id}' was updated by another request; send the message again"
+        )
+
+
+async def create_session(video_id: str, language: str, model: str, transcript_text: str) -> ChatSession:
+    session = ChatSession(
+        session_id=uuid.uuid4().hex,
+        video_id=video_id,
+        language=language,
+        model=model,
+        system_prompt=build_chat_system_prompt(transcript_text)
+    )
+    store.set(session.session_id, session)
+    if shared is not None:
+        await run_in_threadpool(prompts.set, session.session_id, session.fixed())
+        await run_in_threadpool(shared.set, session.session_id, session.state())
+    return session
+
+
+async def get_session(session_id: str) -> Optional[ChatSession]:
+    """
+    Return the session, reloading its history from the shared tier in case
+    the previous turn was handled by another worker. The system prompt is
+    only read when this worker doesn't have the session yet.
+    """
+    session = store.get(session_id)
+    if shared is None:
+        return None if session is MISSING else session
+
+    data = await run_in_threadpool(shared.get, session_id)
+    if data is MISSING:
+        store.delete(session_id)
+        return None
+    if session is MISSING:
+        fixed = await run_in_threadpool(prompts.get, session_id)
+        if fixed is MISSING:
+            return None
+        session = ChatSession.from_dict({**fixed, **data})
+        store.set(session_id, session)
+    else:
+        session.load_state(data)
+    return session
+
+
+@asynccontextmanager
+async def turn(session: ChatSession):
+    """
+    Run one turn of session at a time: session.lock orders turns within this
+    worker and a lock row in the shared tier orders them across workers.
+    The state is reloaded once both are held, so each turn starts from the
+    history the previous one saved, whichever worker handled it.
+    """
+    async with session.lock:
+        if shared is None:
+            yield session
+            return
+        async with shared_cache.locked(f"chat_session:{session.session_id}"):
+            data = await run_in_threadpool(shared.get, session.session_id)
+            if data is MISSING:
+                store.delete(session.session_id)
+                raise HTTPException(status_code=404, detail=f"Chat session '{session.session_id}' not found or expired")
+            session.load_state(data)
+            yield session
+
+
+async def touch(session: ChatSession):
+    """Record activity and restart the session's TTL"""
+    session.last_used = time.time()
+    store.set(session.session_id, session)
+    await _save(session)
+
+
+async def delete_session(session_id: str):
+    store.delete(session_id)
+    if shared is not None:
+        await run_in_threadpool(shared.delete, session_id)
+        await run_in_threadpool(prompts.delete, session_id)
+
+
+async def _summarize_turns(
+    session: ChatSession,
+    dropped: List[Dict[str, str]],
+    openrouter_api_key: str,
+    fallback_models: List[str]
+) -> Optional[str]:
+    previous = f"Earlier summary:\n{session.summary}\n\n" if session.summary else ""
+    conversation = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in dropped)
+    try:
+        result = await openrouter.complete_with_fallback(
+            openrouter_api_key=openrouter_api_key,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"{previous}Conversation:\n\n{conversation}"}
+            ],
+            preferred_model=session.model,
+            fallback_models=fallback_models,
+            title="Automatehub Video Chat"
+        )
+        return result["content"]
+    except Exception as e:
+        # Trimming must never fail the turn - fall back to dropping the turns
+        print(f"Chat session summary failed, dropping old turns: {str(e)}")
+        return session.summary
+
+
+async def trim_history(session: ChatSession, openrouter_api_key: str, fallback_models: List[str]):
+    """Remove the oldest turns until the history fits CHAT_SESSION_HISTORY_TOKENS"""
+    dropped: List[Dict[str, str]] = []
+    while session.history and session.history_tokens() > CHAT_SESSION_HISTORY_TOKENS:
+        # History is stored as (user, assistant) pairs
+        dropped.extend(session.history[:2])
+        del session.history[:2]
+        session.trimmed_turns += 1
+
+    if dropped and CHAT_SESSION_TRIM_MODE == "summarize":
+        session.summary = await _summarize_turns(session, dropped, openrouter_api_key, fallback_models)
+
+
+async def record_turn(session: ChatSession, user_message: str, assistant_message: str):
+    session.history.append({"role": "user", "content": user_message})
+    session.history.append({"role": "assistant", "content": assistant_message})
+    session.turns += 1
+    await touch(session)
+
+
+def stats() -> dict:
+    return {
+        **store.stats(),
+        "shared": shared.stats() if shared is not None else None,
+        "shared_prompts": prompts.stats() if prompts is not None else None,
+        "ttl": CHAT_SESSION_TTL,
+        "history_token_budget": CHAT_SESSION_HISTORY_TOKENS,
+        "trim_mode": CHAT_SESSION_TRIM_MODE
+    }
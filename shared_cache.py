@@ -0,0 +1,400 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+import metrics
+from cache import DiskCache, MISSING
+from model_router import router as model_router
+
+T = TypeVar("T")
+
+# Second cache tier (behind each worker's in-memory LRU), shared by every worker process:
+#   sqlite - one SQLite database in WAL mode (default)
+#   files  - one JSON file per entry under each cache's *_DISK_CACHE_DIR
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "shared.sqlite3")
+)
+# A worker fetching a transcript or computing an LLM result holds a lock for
+# the key; other workers wait for its result instead of repeating the work.
+# The lock is a lease of this many seconds that the owner renews while it is
+# still working, so it only lapses (and another worker takes over) when the
+# owner crashes or hangs
+SHARED_LOCK_SECONDS = float(os.getenv("SHARED_LOCK_SECONDS", "60"))
+# How often waiting workers check for the result; the interval doubles on
+# every check up to SHARED_POLL_MAX_INTERVAL, so long waits poll less often
+SHARED_POLL_INTERVAL = float(os.getenv("SHARED_POLL_INTERVAL", "0.05"))
+SHARED_POLL_MAX_INTERVAL = float(os.getenv("SHARED_POLL_MAX_INTERVAL", "1"))
+# Seconds between exchanges of model cooldowns (429 Retry-After) between workers
+SHARED_ROUTER_SYNC_INTERVAL = float(os.getenv("SHARED_ROUTER_SYNC_INTERVAL", "2"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_age ON entries (namespace, stored_at);
+CREATE TABLE IF NOT EXISTS locks (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    model TEXT PRIMARY KEY,
+    until REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+# SQLite allows one writer at a time; serialize writers in-process instead of hitting busy timeouts
+_write_lock = threading.Lock()
+
+stats = {"lock_waits": 0, "served_by_other_worker": 0, "lock_takeovers": 0, "router_syncs": 0, "router_sync_errors": 0}
+# kind -> requests answered by another worker's fetch or LLM call
+_coalesced: Dict[str, int] = {}
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection, creating the database on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(SHARED_CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(SHARED_CACHE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+class SQLiteCache:
+    """
+    DiskCache counterpart stored as rows of one SQLite database.
+
+    Every worker process opens the same file. WAL mode lets readers proceed
+    while another worker writes, and each set() replaces its row in a single
+    statement, so readers see either the old or the new entry, never a torn
+    one. Each cache is a namespace of the shared database, with its own
+    entry limit and TTL.
+    """
+
+    # Check the entry count every N writes instead of on every write
+    PRUNE_EVERY = 64
+
+    def __init__(self, namespace: str, max_entries: int, ttl: float):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+
+    def get(self, key: str) -> Any:
+        """Return the cached value, or MISSING if absent or expired"""
+        entry = self.get_entry(key)
+        return entry if entry is MISSING else entry[0]
+
+    def get_entry(self, key: str) -> Any:
+        """Return (value, expires_at), or MISSING if absent or expired"""
+        row = _connect().execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND expires_at >= ?",
+            (self.namespace, key, time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a JSON-serializable value"""
+        now = time.time()
+        item = json.dumps(value, separators=(",", ":"))
+        with _write_lock:
+            _connect().execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at, stored_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, item, now + (self.ttl if ttl is None else ttl), now)
+            )
+
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def compare_and_set(self, key: str, value: Any, expected_version: int) -> bool:
+        """
+        Replace an unexpired entry only if its "version" field still equals
+        expected_version, so two workers can't both update it from the same
+        state. Returns False if someone else got there first.
+        """
+        now = time.time()
+        item = json.dumps(value, separators=(",", ":"))
+        with _write_lock:
+            cursor = _connect().execute(
+                "UPDATE entries SET value = ?, expires_at = ?, stored_at = ? "
+                "WHERE namespace = ? AND key = ? AND expires_at >= ? AND IFNULL(json_extract(value, '$.version'), 0) = ?",
+                (item, now + self.ttl, now, self.namespace, key, now, expected_version)
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        with _write_lock:
+            _connect().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def _count(self) -> int:
+        return _connect().execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def prune(self):
+        """Remove expired entries, then the oldest ones beyond max_entries"""
+        conn = _connect()
+        with _write_lock:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND expires_at < ?", (self.namespace, time.time()))
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND key IN "
+                    "(SELECT key FROM entries WHERE namespace = ? ORDER BY stored_at LIMIT ?)",
+                    (self.namespace, self.namespace, overflow)
+                )
+                self.evictions += overflow
+            conn.execute("DELETE FROM locks WHERE expires_at < ?", (time.time(),))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": SHARED_CACHE_PATH,
+            "namespace": self.namespace,
+            "entries": self._count(),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def open_cache(namespace: str, directory: str, max_entries: int, ttl: float):
+    """The shared tier for one cache: a SQLiteCache namespace, or a DiskCache directory"""
+    if CACHE_BACKEND == "files":
+        return DiskCache(directory, max_entries, ttl)
+    if CACHE_BACKEND != "sqlite":
+        raise ValueError(f"Unknown CACHE_BACKEND '{CACHE_BACKEND}' (use sqlite or files)")
+    return SQLiteCache(namespace, max_entries, ttl)
+
+
+def _try_lock(key: str, owner: str, seconds: float) -> bool:
+    """Take the lock for key unless another owner holds an unexpired one"""
+    now = time.time()
+    with _write_lock:
+        cursor = _connect().execute(
+            "INSERT INTO locks (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE locks.expires_at < ?",
+            (key, owner, now + seconds, now)
+        )
+        return cursor.rowcount == 1
+
+
+def _lock_free(key: str) -> bool:
+    """Whether key's lock is released or its lease has run out (a read, so waiters don't queue on writes)"""
+    row = _connect().execute("SELECT expires_at FROM locks WHERE key = ?", (key,)).fetchone()
+    return row is None or row[0] < time.time()
+
+
+def _poll_intervals():
+    """Sleeps between a waiter's checks: SHARED_POLL_INTERVAL, doubling up to SHARED_POLL_MAX_INTERVAL"""
+    interval = SHARED_POLL_INTERVAL
+    while True:
+        yield interval
+        interval = min(interval * 2, max(SHARED_POLL_MAX_INTERVAL, SHARED_POLL_INTERVAL))
+
+
+def _renew_lock(key: str, owner: str, seconds: float) -> bool:
+    """Extend owner's lease on key; False if the lock was lost meanwhile"""
+    with _write_lock:
+        cursor = _connect().execute(
+            "UPDATE locks SET expires_at = ? WHERE key = ? AND owner = ?",
+            (time.time() + seconds, key, owner)
+        )
+        return cursor.rowcount == 1
+
+
+async def _heartbeat(key: str, owner: str):
+    """Renew the lease on key every third of SHARED_LOCK_SECONDS until cancelled"""
+    while True:
+        await asyncio.sleep(SHARED_LOCK_SECONDS / 3)
+        try:
+            if not await run_in_threadpool(_renew_lock, key, owner, SHARED_LOCK_SECONDS):
+                print(f"Lost the shared lock for {key}")
+                return
+        except Exception as e:
+            print(f"Could not renew the shared lock for {key}: {str(e)}")
+
+
+@asynccontextmanager
+async def _holding(key: str, owner: str):
+    """Keep owner's lock on key alive while the block runs, then release it"""
+    heartbeat = asyncio.ensure_future(_heartbeat(key, owner))
+    try:
+        yield
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        await run_in_threadpool(_unlock, key, owner)
+
+
+def _unlock(key: str, owner: str):
+    with _write_lock:
+        _connect().execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+
+
+@asynccontextmanager
+async def locked(key: str):
+    """
+    Hold the cross-worker lock for key while the block runs, waiting while
+    another worker holds it. Only the sqlite backend can lock; with the
+    files backend this only runs the block.
+    """
+    if CACHE_BACKEND != "sqlite":
+        yield
+        return
+
+    owner = uuid.uuid4().hex
+    if not await run_in_threadpool(_try_lock, key, owner, SHARED_LOCK_SECONDS):
+        stats["lock_waits"] += 1
+        for interval in _poll_intervals():
+            await asyncio.sleep(interval)
+            if not await run_in_threadpool(_lock_free, key):
+                continue
+            if await run_in_threadpool(_try_lock, key, owner, SHARED_LOCK_SECONDS):
+                break
+    async with _holding(key, owner):
+        yield
+
+
+async def coalesce(
+    key: str,
+    lookup: Callable[[], Awaitable[Any]],
+    compute: Callable[[], Awaitable[T]],
+    kind: str
+) -> T:
+    """
+    Run compute() in only one worker process at a time per key.
+
+    SingleFlight coalesces requests within a worker; this does the same
+    across workers through a lock row in the shared database. The worker
+    that takes the lock checks lookup() once more (another worker may have
+    just finished) and otherwise computes. The others poll lookup() until
+    the result shows up in the shared cache, or take the lock over when it
+    is released or expires. lookup() returns MISSING until then. Waiting
+    only reads the database; a waiter writes (tries to take the lock) only
+    once it sees the lock released or expired.
+
+    Only the sqlite backend can lock; with the files backend every worker
+    computes for itself.
+    """
+    if CACHE_BACKEND != "sqlite":
+        return await compute()
+
+    owner = uuid.uuid4().hex
+    waited = False
+    intervals = _poll_intervals()
+    free = True
+    while True:
+        if free and await run_in_threadpool(_try_lock, key, owner, SHARED_LOCK_SECONDS):
+            if waited:
+                stats["lock_takeovers"] += 1
+            async with _holding(key, owner):
+                result = await lookup()
+                if result is not MISSING:
+                    return result
+                return await compute()
+
+        if not waited:
+            waited = True
+            stats["lock_waits"] += 1
+        await asyncio.sleep(next(intervals))
+        result = await lookup()
+        if result is not MISSING:
+            stats["served_by_other_worker"] += 1
+            _coalesced[kind] = _coalesced.get(kind, 0) + 1
+            return result
+        free = await run_in_threadpool(_lock_free, key)
+
+
+def _exchange_cooldowns(local: Dict[str, float]) -> Dict[str, float]:
+    """Publish this worker's model cooldowns and return every unexpired one"""
+    conn = _connect()
+    now = time.time()
+    with _write_lock:
+        conn.executemany(
+            "INSERT INTO cooldowns (model, until) VALUES (?, ?) "
+            "ON CONFLICT (model) DO UPDATE SET until = max(until, excluded.until)",
+            local.items()
+        )
+        conn.execute("DELETE FROM cooldowns WHERE until < ?", (now,))
+    return dict(conn.execute("SELECT model, until FROM cooldowns").fetchall())
+
+
+async def sync_router():
+    """
+    Share 429 cooldowns between workers.
+
+    OpenRouter rate limits apply to the API key, not the process, so a
+    model one worker was told to back off from is skipped by all of them.
+    Latency and circuit state stay per worker.
+    """
+    while True:
+        await asyncio.sleep(SHARED_ROUTER_SYNC_INTERVAL)
+        try:
+            cooldowns = await run_in_threadpool(_exchange_cooldowns, model_router.cooldowns())
+            model_router.apply_cooldowns(cooldowns)
+            stats["router_syncs"] += 1
+        except Exception as e:
+            stats["router_sync_errors"] += 1
+            print(f"Could not sync model cooldowns: {str(e)}")
+
+
+def start():
+    """Start the cooldown sync task (call from the app lifespan)"""
+    if CACHE_BACKEND != "sqlite" or SHARED_ROUTER_SYNC_INTERVAL <= 0:
+        return None
+    return asyncio.create_task(sync_router())
+
+
+def cache_metrics():
+    """Cross-worker coalescing as metrics samples (see metrics.register_collector)"""
+    for kind, count in _coalesced.items():
+        yield "coalesced_requests_total", {"kind": f"{kind}_other_worker"}, count
+
+
+metrics.register_collector(cache_metrics)
+
+
+def shared_stats() -> dict:
+    """Backend, database size and cross-worker coalescing counters"""
+    result = {"backend": CACHE_BACKEND, **stats, "coalesced_by_kind": dict(_coalesced)}
+    if CACHE_BACKEND == "sqlite":
+        result["path"] = SHARED_CACHE_PATH
+        result["size_bytes"] = sum(
+            os.path.getsize(path) for path in (SHARED_CACHE_PATH, f"{SHARED_CACHE_PATH}-wal")
+            if os.path.exists(path)
+        )
+        result["locks_held"] = _connect().execute(
+            "SELECT COUNT(*) FROM locks WHERE expires_at >= ?", (time.time(),)
+        ).fetchone()[0]
+    return result
@@ -0,0 +1,134 @@
+import asyncio
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import deadlines
+
+T = TypeVar("T")
+
+
+def _detached(coro: Awaitable[T], deadline: Optional[deadlines.Deadline]) -> "asyncio.Task[T]":
+    """
+    Run coro as a task in a fresh context. Shared work belongs to no single
+    caller, so it must not inherit the context of the caller that happened
+    to start it; its only context variable is its shared deadline (see
+    deadlines.shared), which lasts as long as its longest-waiting caller.
+    """
+    return asyncio.get_running_loop().create_task(coro, context=deadlines.context(deadline))
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key onto one shared task.
+
+    The first caller for a key starts the work; callers arriving while it
+    is still running await the same task. Waiters are shielded, so a client
+    disconnecting (cancelling its request) never cancels the shared work -
+    it runs to completion and populates the caches for everyone else, within
+    the latest deadline among its callers (see _detached).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, Tuple[asyncio.Task, Optional[deadlines.Deadline]]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        flight = self._inflight.get(key)
+        if flight is None:
+            deadline = deadlines.shared()
+            task = _detached(factory(), deadline)
+            self._inflight[key] = (task, deadline)
+            task.add_done_callback(partial(self._finished, key))
+            self.leaders += 1
+        else:
+            task, deadline = flight
+            deadlines.join(deadline)
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if key in self._inflight and self._inflight[key][0] is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+
+class _Broadcast:
+    """Pumps one async iterator into a buffer that any number of subscribers replay"""
+
+    def __init__(self, source: AsyncIterator):
+        self.events: List = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self._wakeup = asyncio.Event()
+        self.deadline = deadlines.shared()
+        self.task = _detached(self._pump(source), self.deadline)
+
+    async def _pump(self, source: AsyncIterator):
+        try:
+            async for item in source:
+                # Like a response, the stream is held to the deadline until it starts
+                if self.deadline is not None:
+                    self.deadline.lifted = True
+                self.events.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    def _notify(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator:
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._wakeup.wait()
+
+
+class SingleFlightStream:
+    """
+    Streaming counterpart of SingleFlight.
+
+    Concurrent subscribers for the same key share one upstream stream: late
+    joiners first replay what was already produced, then follow live. The
+    upstream is consumed by its own task, so it keeps going (and completes
+    its side effects, like caching) when subscribers disconnect.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def subscribe(self, key: str, factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+        broadcast = self._inflight.get(key)
+        if broadcast is None:
+            broadcast = self._inflight[key] = _Broadcast(factory())
+            broadcast.task.add_done_callback(partial(self._finished, key, broadcast))
+            self.leaders += 1
+        else:
+            deadlines.join(broadcast.deadline)
+            self.coalesced += 1
+        return broadcast.subscribe()
+
+    def _finished(self, key: str, broadcast: _Broadcast, task: asyncio.Task):
+        if self._inflight.get(key) is broadcast:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
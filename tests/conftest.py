@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# Every module reads its settings at import time; point the on-disk state
+# (shared cache, search index, job queue, metrics) at a throwaway directory
+# before anything from the app is imported
+_data_dir = tempfile.mkdtemp(prefix="fastapi-tests-")
+os.environ.setdefault("SHARED_CACHE_PATH", os.path.join(_data_dir, "shared.sqlite3"))
+os.environ.setdefault("TRANSCRIPT_INDEX_PATH", os.path.join(_data_dir, "transcript_index.sqlite3"))
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_data_dir, "jobs.sqlite3"))
+os.environ.setdefault("METRICS_DIR", os.path.join(_data_dir, "metrics"))
+os.environ.setdefault("TRANSCRIPT_DISK_CACHE_DIR", os.path.join(_data_dir, "transcripts"))
+os.environ.setdefault("LLM_DISK_CACHE_DIR", os.path.join(_data_dir, "llm"))
+os.environ.setdefault("CHAT_SESSION_DIR", os.path.join(_data_dir, "sessions"))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
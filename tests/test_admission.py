@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+import openrouter
+
+
+def scope(client="203.0.113.7", headers=()):
+    return {"type": "http", "client": (client, 51234), "headers": [(k.encode(), v.encode()) for k, v in headers]}
+
+
+def test_forwarded_for_is_ignored_by_default():
+    assert admission.RATE_LIMIT_PROXY_HOPS == 0
+    spoofed = scope(headers=[("x-forwarded-for", "198.51.100.1")])
+    assert admission.client_id(spoofed) == "ip:203.0.113.7"
+
+
+def test_forwarded_for_is_read_behind_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_PROXY_HOPS", 1)
+    # The client can prepend anything; only the entry the proxy appended counts
+    request = scope(client="10.0.0.2", headers=[("x-forwarded-for", "1.1.1.1, 198.51.100.1")])
+    assert admission.client_id(request) == "ip:198.51.100.1"
+    monkeypatch.setattr(admission, "RATE_LIMIT_PROXY_HOPS", 2)
+    assert admission.client_id(request) == "ip:1.1.1.1"
+    assert admission.client_id(scope(client="10.0.0.2")) == "ip:10.0.0.2"
+
+
+def test_key_header_takes_precedence(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_KEY_HEADER", "X-API-Key")
+    assert admission.client_id(scope(headers=[("x-api-key", "abc")])) == "key:abc"
+    assert admission.client_id(scope()) == "ip:203.0.113.7"
+
+
+def test_token_bucket_limits_each_client_separately(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = admission.RateLimiter(per_minute=60, burst=3)
+    assert [limiter.take("a")[0] for _ in range(4)] == [True, True, True, False]
+    allowed, wait = limiter.take("a")
+    assert not allowed and wait == pytest.approx(1.0)
+    assert limiter.take("b")[0]
+    now[0] += 1.0
+    assert limiter.take("a")[0]
+    assert not limiter.take("a")[0]
+    # Refills stop at the burst size
+    now[0] += 3600
+    assert [limiter.take("a")[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_least_recently_seen_clients_are_dropped():
+    limiter = admission.RateLimiter(per_minute=60, burst=1, max_clients=2)
+    limiter.take("a")
+    limiter.take("b")
+    limiter.take("c")
+    assert limiter.stats()["clients"] == 2
+    # "a" was dropped, so it starts over with a full bucket
+    assert limiter.take("a")[0]
+
+
+def test_full_queue_is_rejected_and_slots_go_to_the_oldest_waiter():
+    async def main():
+        limiter = admission.ConcurrencyLimiter("test", limit=1, queue_size=1, queue_timeout=5)
+        granted = await limiter.acquire("m")
+        waiter = asyncio.ensure_future(limiter.acquire("m"))
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Overloaded) as error:
+            await limiter.acquire("m")
+        limiter.release("m", granted)
+        limiter.release("m", await waiter)
+        return error.value, limiter.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.status_code == 503 and "Retry-After" in error.headers
+    assert stats["in_flight"] == 0 and stats["rejected"]["queue_full"] == 1 and stats["admitted"] == 2
+
+
+def test_overloaded_is_not_treated_as_model_exhaustion(monkeypatch):
+    assert openrouter._exhausted(HTTPException(status_code=503, detail="All models are currently unavailable"))
+    assert not openrouter._exhausted(admission.Overloaded("llm", "queue_full", 3))
+
+    calls = []
+
+    async def complete(api_key, messages, preferred_model, fallback_models, title, timeout):
+        calls.append(preferred_model)
+        raise admission.Overloaded("llm", "queue_full", 3)
+
+    monkeypatch.setattr(openrouter, "_complete_with_fallback", complete)
+    monkeypatch.setattr(openrouter.router, "candidates", lambda preferred, fallbacks: [preferred] + fallbacks)
+
+    with pytest.raises(admission.Overloaded):
+        asyncio.run(openrouter._complete_hedged("key", [], "a", ["b", "c", "d"], "title", hedge=True))
+    # Load shedding ends the request; it doesn't go on down the fallback chain
+    assert calls == ["a"]
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import chunking
+
+
+def test_map_cancels_sibling_chunks_after_a_failure(monkeypatch):
+    monkeypatch.setattr(chunking, "CHUNK_CONCURRENCY", 3)
+    started, cancelled = [], []
+
+    async def complete_with_fallback(messages, **kwargs):
+        index = len(started)
+        started.append(index)
+        if index == 1:
+            await asyncio.sleep(0.01)
+            raise HTTPException(status_code=503, detail="all models failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        return {"content": "partial", "usage": {}}
+
+    monkeypatch.setattr(chunking.openrouter, "complete_with_fallback", complete_with_fallback)
+
+    async def run():
+        with pytest.raises(HTTPException) as error:
+            await chunking._map("key", ["a", "b", "c", "d", "e"], "prompt", "model", [], "title", {})
+        return error.value
+
+    error = asyncio.run(asyncio.wait_for(run(), 2))
+    assert error.status_code == 503
+    # Every chunk that got a slot, apart from the failed one, was cancelled,
+    # and the rest of the queue never reached the model
+    assert sorted(cancelled) == [index for index in started if index != 1]
+    assert len(started) < 5
+
+
+def test_map_keeps_chunk_order(monkeypatch):
+    async def complete_with_fallback(messages, **kwargs):
+        text = messages[-1]["content"]
+        await asyncio.sleep(0.01 if "first" in text else 0)
+        return {"content": text, "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+
+    monkeypatch.setattr(chunking.openrouter, "complete_with_fallback", complete_with_fallback)
+    usage = {}
+    partials, _ = asyncio.run(chunking._map("key", ["first", "second"], "prompt", "model", [], "title", usage))
+    assert "first" in partials[0] and "second" in partials[1]
+
+
+def test_chat_fallbacks_skip_models_too_small_for_the_conversation(monkeypatch):
+    monkeypatch.setattr(chunking, "CONTEXT_LENGTHS", {"small": 8000, "large": 200000})
+    messages = [
+        {"role": "system", "content": "transcript " * 20000},
+        {"role": "user", "content": "What is this video about?"}
+    ]
+    assert chunking.usable_chat_fallbacks(["small", "large"], messages) == ["large"]
+    short = [{"role": "user", "content": "hello"}]
+    assert chunking.usable_chat_fallbacks(["small", "large"], short) == ["small", "large"]
@@ -0,0 +1,89 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import deadlines
+
+
+def deadline_app():
+    app = FastAPI()
+    app.add_middleware(deadlines.DeadlineMiddleware)
+
+    @app.get("/slow")
+    async def slow():
+        await deadlines.wait(asyncio.sleep(1), stage="work")
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            # Outlasts the request budget several times over
+            for i in range(4):
+                await deadlines.wait(asyncio.sleep(0.15), stage="llm")
+                yield f"{i}\n"
+
+        return StreamingResponse(body())
+
+    @app.get("/items")
+    async def items():
+        async def run_item(i):
+            with deadlines.item():
+                await deadlines.wait(asyncio.sleep(0.15), stage="work")
+                return deadlines.remaining()
+
+        async def body():
+            for next_done in asyncio.as_completed([run_item(i) for i in range(4)]):
+                left = await next_done
+                yield f"{left:.2f}\n"
+
+        return StreamingResponse(body())
+
+    return app
+
+
+def test_request_is_cut_off_at_its_budget():
+    with TestClient(deadline_app()) as client:
+        response = client.get("/slow", headers={"X-Request-Timeout": "0.2"})
+    assert response.status_code == 504
+    assert response.json()["detail"]["stage"] == "work"
+
+
+def test_streamed_body_is_not_cut_off_by_the_request_budget():
+    with TestClient(deadline_app()) as client:
+        response = client.get("/stream", headers={"X-Request-Timeout": "0.2"})
+    assert response.status_code == 200
+    assert response.text == "0\n1\n2\n3\n"
+    assert response.headers["x-request-timeout"] == "0.2"
+
+
+def test_each_item_gets_its_own_budget():
+    with TestClient(deadline_app()) as client:
+        response = client.get("/items", headers={"X-Request-Timeout": "0.3"})
+    lines = response.text.split()
+    assert len(lines) == 4
+    # Each item started with the full 0.3s and spent about 0.15s of it
+    assert all(0.05 < float(left) < 0.2 for left in lines)
+
+
+def test_attempt_timeout_is_cut_to_the_remaining_budget():
+    async def main():
+        token = deadlines._current.set(deadlines.Deadline(5))
+        try:
+            assert deadlines.attempt_timeout(60) <= 5
+            assert deadlines.attempt_timeout(2) == 2
+        finally:
+            deadlines._current.reset(token)
+        assert deadlines.attempt_timeout(60) == 60
+
+    asyncio.run(main())
+
+
+def test_nothing_is_enforced_without_a_deadline():
+    async def main():
+        assert await deadlines.wait(asyncio.sleep(0, result="done"), stage="work") == "done"
+        with deadlines.item():
+            assert deadlines.current() is None
+
+    asyncio.run(main())
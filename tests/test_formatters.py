@@ -0,0 +1,94 @@
+import random
+from datetime import timedelta
+from types import SimpleNamespace
+
+from formatters import format_srt_timestamp, format_timestamp, format_vtt_timestamp, iter_srt, iter_text, iter_vtt
+from packed_transcript import PackedTranscript
+
+
+# The formatters as they were before they moved to formatters.py; output must not change
+def baseline_timestamp(seconds):
+    total_seconds = int(timedelta(seconds=seconds).total_seconds())
+    hours, minutes, secs = total_seconds // 3600, (total_seconds % 3600) // 60, total_seconds % 60
+    if hours > 0:
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def baseline_subtitle_timestamp(seconds, separator):
+    total_seconds = int(timedelta(seconds=seconds).total_seconds())
+    hours, minutes, secs = total_seconds // 3600, (total_seconds % 3600) // 60, total_seconds % 60
+    millis = int((seconds - int(seconds)) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def baseline_srt(entries):
+    lines = []
+    for i, entry in enumerate(entries, start=1):
+        lines.append(f"{i}")
+        lines.append(
+            f"{baseline_subtitle_timestamp(entry['start'], ',')} --> "
+            f"{baseline_subtitle_timestamp(entry['start'] + entry['duration'], ',')}"
+        )
+        lines.append(entry["text"])
+        lines.append("")
+    return "\n".join(lines)
+
+
+def baseline_vtt(entries):
+    lines = ["WEBVTT", ""]
+    for entry in entries:
+        lines.append(
+            f"{baseline_subtitle_timestamp(entry['start'], '.')} --> "
+            f"{baseline_subtitle_timestamp(entry['start'] + entry['duration'], '.')}"
+        )
+        lines.append(entry["text"])
+        lines.append("")
+    return "\n".join(lines)
+
+
+def baseline_text(entries):
+    return "\n".join(f"[{baseline_timestamp(entry['start'])}] {entry['text']}" for entry in entries)
+
+
+def random_transcript(count=2000, seed=7):
+    rng = random.Random(seed)
+    snippets, start = [], 0.0
+    for i in range(count):
+        start += rng.uniform(0.0, 6.0)
+        snippets.append(SimpleNamespace(text=f"cue {i}", start=round(start, rng.choice((2, 3))), duration=round(rng.uniform(0.5, 5), 3)))
+    return PackedTranscript.from_snippets(snippets, "video", "English", "en", True)
+
+
+def test_milliseconds_are_truncated_like_the_baseline():
+    assert format_srt_timestamp(15275.49) == "04:14:35,489"
+    assert format_vtt_timestamp(15275.49) == "04:14:35.489"
+    assert format_srt_timestamp(0.0) == "00:00:00,000"
+    assert format_srt_timestamp(3661.9999) == "01:01:01,999"
+
+
+def test_values_rounding_up_to_the_next_second_match_the_baseline():
+    for seconds in (59.9999996, 3599.9999997, 0.9999995, 12.0000004):
+        assert format_timestamp(seconds) == baseline_timestamp(seconds)
+        assert format_srt_timestamp(seconds) == baseline_subtitle_timestamp(seconds, ",")
+    assert format_timestamp(59.9999996) == "01:00"
+    assert format_timestamp(3599.9999997) == "01:00:00"
+
+
+def test_timestamps_match_the_baseline():
+    rng = random.Random(1)
+    values = [rng.uniform(0, 20000) for _ in range(5000)] + [round(rng.uniform(0, 20000), 2) for _ in range(5000)]
+    # Just below a whole second, where microsecond rounding carries over
+    values += [i + 1 - rng.uniform(0, 1e-6) for i in range(5000)]
+    for seconds in values:
+        assert format_srt_timestamp(seconds) == baseline_subtitle_timestamp(seconds, ",")
+        assert format_vtt_timestamp(seconds) == baseline_subtitle_timestamp(seconds, ".")
+        assert format_timestamp(seconds) == baseline_timestamp(seconds)
+
+
+def test_streamed_formats_match_the_baseline_bytes():
+    transcript = random_transcript()
+    entries = transcript.to_raw_data()
+    assert "".join(iter_srt(transcript)) == baseline_srt(entries)
+    assert "".join(iter_vtt(transcript)) == baseline_vtt(entries)
+    assert "".join(iter_text(transcript)) == baseline_text(entries)
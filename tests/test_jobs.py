@@ -0,0 +1,171 @@
+import asyncio
+import socket
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import jobs
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(monkeypatch):
+    jobs._connect().execute("DELETE FROM jobs")
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 10)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    yield
+    jobs.handlers.pop("test", None)
+
+
+def submit(handler, priority=0):
+    jobs.register("test", handler)
+    return asyncio.run(jobs.submit("test", {"n": priority}, priority=priority))
+
+
+def claim_and_run():
+    row = jobs._claim()
+    assert row is not None
+    asyncio.run(jobs._run(row))
+    return jobs._get(row["id"])
+
+
+def failing(status_code):
+    async def handler(params):
+        raise HTTPException(status_code=status_code, detail="upstream said no")
+    return handler
+
+
+async def succeed(params):
+    return {"n": params["n"]}
+
+
+def test_jobs_are_claimed_by_priority_then_age():
+    low = submit(succeed, priority=0)
+    high = submit(succeed, priority=5)
+    assert jobs._claim()["id"] == high["job_id"]
+    assert jobs._claim()["id"] == low["job_id"]
+    assert jobs._claim() is None
+
+
+def test_success_stores_the_result():
+    job = submit(succeed, priority=3)
+    finished = claim_and_run()
+    assert finished["job_id"] == job["job_id"]
+    assert finished["status"] == "succeeded"
+    assert finished["result"] == {"n": 3}
+    assert finished["attempts"] == 1
+
+
+def test_transient_failure_is_requeued_with_backoff_then_fails():
+    submit(failing(503))
+    retried = claim_and_run()
+    assert retried["status"] == "queued"
+    assert retried["error"].startswith("HTTP 503")
+    # Not available again until the backoff has passed
+    assert jobs._claim() is None
+    jobs._connect().execute("UPDATE jobs SET available_at = ?", (time.time() - 1,))
+    failed = claim_and_run()
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 2
+
+
+def test_client_error_fails_without_retry():
+    submit(failing(404))
+    failed = claim_and_run()
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 1
+
+
+def test_expired_lease_is_taken_over_until_attempts_run_out():
+    job = submit(succeed)
+    first = jobs._claim()
+    assert jobs._claim() is None
+    # The worker died: its lease runs out without being renewed
+    jobs._connect().execute("UPDATE jobs SET lease_until = ?", (time.time() - 1,))
+    second = jobs._claim()
+    assert second["id"] == job["job_id"] and second["recovered"] and second["attempts"] == 2
+    jobs._connect().execute("UPDATE jobs SET lease_until = ?", (time.time() - 1,))
+    assert jobs._claim() is None
+    assert jobs._get(job["job_id"])["status"] == "failed"
+    assert first["attempts"] == 1
+
+
+def test_only_queued_jobs_can_be_cancelled():
+    job = submit(succeed)
+    assert jobs._cancel(job["job_id"])["status"] == "cancelled"
+    assert jobs._claim() is None
+    running = submit(succeed)
+    jobs._claim()
+    assert jobs._cancel(running["job_id"])["status"] == "running"
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8000/admin",
+    "http://localhost/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.1.2.3/hook",
+    "http://192.168.0.10/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+    "ftp://example.com/hook",
+    "https:///hook",
+])
+def test_webhooks_to_internal_addresses_are_rejected(url):
+    jobs.register("test", succeed)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(jobs.submit("test", {}, webhook_url=url))
+    assert error.value.status_code == 400
+
+
+def test_webhook_host_is_checked_against_every_resolved_address(monkeypatch):
+    def getaddrinfo(host, port, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port)) for address in ("93.184.216.34", "10.0.0.5")]
+
+    monkeypatch.setattr(jobs.socket, "getaddrinfo", getaddrinfo)
+    assert "10.0.0.5" in jobs._check_webhook_url("https://rebinding.example/hook")
+
+
+def test_public_webhook_and_allowlist(monkeypatch):
+    monkeypatch.setattr(
+        jobs.socket, "getaddrinfo",
+        lambda host, port, **kwargs: [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.216.34", port))]
+    )
+    assert jobs._check_webhook_url("https://hooks.example.com/job") is None
+    monkeypatch.setattr(jobs, "JOB_WEBHOOK_ALLOWED_HOSTS", {"hooks.example.com"})
+    assert jobs._check_webhook_url("https://hooks.example.com/job") is None
+    assert "JOB_WEBHOOK_ALLOWED_HOSTS" in jobs._check_webhook_url("https://other.example.com/job")
+
+
+def test_delivery_rechecks_the_address(monkeypatch):
+    job = submit(succeed)
+    jobs._connect().execute("UPDATE jobs SET webhook_url = 'http://127.0.0.1/hook'")
+    posted = []
+    monkeypatch.setattr(jobs.httpx.AsyncClient, "post", lambda *args, **kwargs: posted.append(args))
+    asyncio.run(jobs._deliver_webhook(job["job_id"], "http://127.0.0.1/hook"))
+    assert posted == []
+    assert jobs._get(job["job_id"])["webhook_status"].startswith("blocked")
+
+
+def test_delivery_connects_to_the_checked_address(monkeypatch):
+    job = submit(succeed)
+    answers = iter(["93.184.216.34", "10.0.0.5"])
+    monkeypatch.setattr(
+        jobs.socket, "getaddrinfo",
+        lambda host, port, **kwargs: [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(answers), port))]
+    )
+    sent = []
+
+    async def send(client, request, **kwargs):
+        sent.append(request)
+        return jobs.httpx.Response(200, request=request)
+
+    monkeypatch.setattr(jobs.httpx.AsyncClient, "send", send)
+    asyncio.run(jobs._deliver_webhook(job["job_id"], "https://hooks.example.com:8443/job"))
+    request, = sent
+    # Sent to the address that passed the check, under the original host name
+    assert request.url.host == "93.184.216.34"
+    assert request.url.port == 8443
+    assert request.headers["host"] == "hooks.example.com:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+    assert jobs._get(job["job_id"])["webhook_status"] == "delivered (200)"
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+import search_index
+from packed_transcript import PackedTranscript
+
+
+def transcript(video_id, language_code, lines):
+    snippets = [SimpleNamespace(text=text, start=i * 5.0, duration=5.0) for i, text in enumerate(lines)]
+    return PackedTranscript.from_snippets(snippets, video_id, language_code, language_code, False)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def corpus():
+    # Many English matches that rank above the single German one
+    for i in range(30):
+        search_index.index_transcript(transcript(f"en{i:02d}", "en", ["kubernetes kubernetes kubernetes"] * (6 + i % 3) + ["other words here"] * 3))
+    search_index.index_transcript(transcript("de00", "de", ["über kubernetes heute"] + ["andere wörter"] * 40))
+
+
+def test_language_filter_is_applied_before_the_match_cap(monkeypatch):
+    # The cap is smaller than the English matches; the German video must still be found
+    monkeypatch.setattr(search_index, "SEARCH_MAX_MATCHES", 20)
+    result = search_index.search("kubernetes", language="de")
+    assert result["total_videos"] == 1
+    assert [r["video_id"] for r in result["results"]] == ["de00"]
+    assert result["results"][0]["hits"][0]["snippet"].startswith("über <mark>kubernetes</mark> heute")
+    assert result["truncated"] is False
+
+
+def test_pages_cover_every_video_once():
+    seen = []
+    first = search_index.search("kubernetes", page=1, page_size=7, language="en")
+    assert first["total_videos"] == 30
+    assert first["total_pages"] == 5
+    for page in range(1, first["total_pages"] + 1):
+        result = search_index.search("kubernetes", page=page, page_size=7, language="en")
+        scores = [r["score"] for r in result["results"]]
+        assert scores == sorted(scores, reverse=True)
+        seen.extend(r["video_id"] for r in result["results"])
+    assert sorted(seen) == [f"en{i:02d}" for i in range(30)]
+    assert search_index.search("kubernetes", page=6, page_size=7, language="en")["results"] == []
+
+
+def test_hits_are_the_best_matches_in_time_order(monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_HITS_PER_VIDEO", 2)
+    result = search_index.search("kubernetes", page_size=50)
+    assert result["total_videos"] == 31
+    for video in result["results"]:
+        assert len(video["hits"]) == min(video["matches"], 2)
+        starts = [hit["start"] for hit in video["hits"]]
+        assert starts == sorted(starts)
+        assert all("<mark>kubernetes</mark>" in hit["snippet"] for hit in video["hits"])
+
+
+def test_truncated_when_the_cap_is_reached(monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_MAX_MATCHES", 10)
+    result = search_index.search("kubernetes")
+    assert result["truncated"] is True
+    assert sum(video["matches"] for video in result["results"]) == 10
+
+
+def test_query_without_terms_is_rejected():
+    with pytest.raises(ValueError):
+        search_index.search('  ""  ')
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import sessions
+
+
+def run_turn(session, message, delay=0.0):
+    async def turn():
+        async with sessions.turn(session):
+            history = list(session.history)
+            await asyncio.sleep(delay)
+            await sessions.record_turn(session, message, f"answer to {message} after {len(history)} messages")
+    return turn()
+
+
+def test_concurrent_turns_in_one_worker_keep_both_turns():
+    async def main():
+        session = await sessions.create_session("video", "en", "model", "transcript")
+        await asyncio.gather(run_turn(session, "first", 0.05), run_turn(session, "second"))
+        return await sessions.get_session(session.session_id)
+
+    session = asyncio.run(main())
+    assert session.turns == 2
+    assert [m["content"] for m in session.history if m["role"] == "user"] == ["first", "second"]
+    # The second turn saw the first one's messages
+    assert session.history[-1]["content"].endswith("after 2 messages")
+
+
+def test_turns_on_two_workers_are_serialized():
+    async def main():
+        created = await sessions.create_session("video", "en", "model", "transcript")
+        # Each worker holds its own copy of the session, with its own asyncio.Lock
+        worker_a = sessions.ChatSession.from_dict(created.to_dict())
+        worker_b = sessions.ChatSession.from_dict(created.to_dict())
+        await asyncio.gather(run_turn(worker_a, "from a", 0.05), run_turn(worker_b, "from b"))
+        sessions.store.delete(created.session_id)
+        return await sessions.get_session(created.session_id)
+
+    session = asyncio.run(main())
+    assert session.turns == 2
+    assert len(session.history) == 4
+
+
+def test_stale_save_is_rejected_with_409():
+    async def main():
+        created = await sessions.create_session("video", "en", "model", "transcript")
+        stale = sessions.ChatSession.from_dict(created.to_dict())
+        await sessions.record_turn(created, "first", "answer")
+        with pytest.raises(HTTPException) as error:
+            await sessions.record_turn(stale, "second", "answer")
+        return error.value, await sessions.get_session(created.session_id)
+
+    error, session = asyncio.run(main())
+    assert error.status_code == 409
+    assert session.turns == 1
+    assert session.history[0]["content"] == "first"
+
+
+def test_turn_on_deleted_session_is_404():
+    async def main():
+        session = await sessions.create_session("video", "en", "model", "transcript")
+        await sessions.delete_session(session.session_id)
+        with pytest.raises(HTTPException) as error:
+            async with sessions.turn(session):
+                pass
+        return error.value
+
+    assert asyncio.run(main()).status_code == 404
+
+
+def test_turns_only_rewrite_the_history():
+    async def main():
+        created = await sessions.create_session("video", "en", "model", "transcript")
+        await sessions.record_turn(created, "first", "answer")
+        state = sessions.shared.get(created.session_id)
+        # Another worker, without the session in memory, reads the prompt once
+        sessions.store.delete(created.session_id)
+        loaded = await sessions.get_session(created.session_id)
+        return created, state, loaded
+
+    created, state, loaded = asyncio.run(main())
+    assert "system_prompt" not in state
+    assert "transcript" not in str(state)
+    assert loaded.system_prompt == created.system_prompt
+    assert loaded.turns == 1
+
+
+def test_prompt_is_rewritten_before_it_can_expire():
+    async def main():
+        session = await sessions.create_session("video", "en", "model", "transcript")
+        sessions.prompts.delete(session.session_id)
+        session.prompt_saved_at -= sessions.CHAT_SESSION_TTL + 1
+        await sessions.record_turn(session, "first", "answer")
+        return session, sessions.prompts.get(session.session_id)
+
+    session, fixed = asyncio.run(main())
+    assert fixed["system_prompt"] == session.system_prompt
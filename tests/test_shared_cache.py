@@ -0,0 +1,93 @@
+import asyncio
+
+import shared_cache
+from cache import MISSING
+
+
+def test_lock_is_renewed_while_the_owner_is_still_computing(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_LOCK_SECONDS", 0.3)
+    monkeypatch.setattr(shared_cache, "SHARED_POLL_INTERVAL", 0.02)
+    store, computed = {}, []
+
+    async def lookup():
+        return store.get("key", MISSING)
+
+    async def compute():
+        computed.append(1)
+        # Runs for several lease lengths
+        await asyncio.sleep(1.0)
+        store["key"] = "result"
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(shared_cache.coalesce("heartbeat-test", lookup, compute, "test"))
+        await asyncio.sleep(0.05)
+        second = await shared_cache.coalesce("heartbeat-test", lookup, compute, "test")
+        return await first, second
+
+    assert asyncio.run(main()) == ("result", "result")
+    assert len(computed) == 1
+
+
+def test_lock_is_released_after_compute_fails():
+    async def lookup():
+        return MISSING
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def compute():
+        return "second"
+
+    async def main():
+        try:
+            await shared_cache.coalesce("release-test", lookup, fail, "test")
+        except RuntimeError:
+            pass
+        return await asyncio.wait_for(shared_cache.coalesce("release-test", lookup, compute, "test"), 1)
+
+    assert asyncio.run(main()) == "second"
+
+
+def test_waiters_only_read_while_the_lock_is_held(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(shared_cache, "SHARED_POLL_MAX_INTERVAL", 0.08)
+    store, attempts, checks = {}, [], []
+    try_lock, lock_free = shared_cache._try_lock, shared_cache._lock_free
+
+    def counting_try_lock(key, owner, seconds):
+        attempts.append(key)
+        return try_lock(key, owner, seconds)
+
+    def counting_lock_free(key):
+        checks.append(key)
+        return lock_free(key)
+
+    monkeypatch.setattr(shared_cache, "_try_lock", counting_try_lock)
+    monkeypatch.setattr(shared_cache, "_lock_free", counting_lock_free)
+
+    async def lookup():
+        return store.get("key", MISSING)
+
+    async def compute():
+        await asyncio.sleep(0.5)
+        store["key"] = "result"
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(shared_cache.coalesce("poll-test", lookup, compute, "test"))
+        await asyncio.sleep(0.02)
+        second = await shared_cache.coalesce("poll-test", lookup, compute, "test")
+        return await first, second
+
+    assert asyncio.run(main()) == ("result", "result")
+    # One lock attempt each; the waiter then only checked the lease, backing off
+    assert len(attempts) == 2
+    assert 3 <= len(checks) <= 10
+
+
+def test_poll_interval_backs_off_to_the_cap(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(shared_cache, "SHARED_POLL_MAX_INTERVAL", 1)
+    intervals = shared_cache._poll_intervals()
+    assert [next(intervals) for _ in range(7)] == [0.05, 0.1, 0.2, 0.4, 0.8, 1, 1]
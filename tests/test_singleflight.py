@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+import deadlines
+from singleflight import SingleFlight, SingleFlightStream
+
+
+def with_deadline(budget, coro):
+    async def run():
+        deadlines._current.set(deadlines.Deadline(budget))
+        return await coro
+    return asyncio.ensure_future(run())
+
+
+def test_concurrent_callers_share_one_call():
+    flights, calls = SingleFlight(), []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_cancelled_leader_does_not_cancel_the_shared_call():
+    flights, finished = SingleFlight(), []
+
+    async def work():
+        await asyncio.sleep(0.1)
+        finished.append(1)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "result"
+    assert finished == [1]
+
+
+def test_shared_call_runs_until_the_latest_waiters_deadline():
+    flights, left = SingleFlight(), []
+
+    async def work():
+        await asyncio.sleep(0.3)
+        left.append(deadlines.remaining())
+        return "result"
+
+    async def main():
+        def call():
+            return deadlines.wait(flights.do("key", work), stage="llm")
+
+        leader = with_deadline(0.1, call())
+        await asyncio.sleep(0.01)
+        follower = with_deadline(5, call())
+        with pytest.raises(deadlines.DeadlineExceeded):
+            await leader
+        return await follower
+
+    # The leader's short deadline doesn't cut the call short for the follower
+    assert asyncio.run(main()) == "result"
+    assert 4 < left[0] < 5
+
+
+def test_shared_call_stops_once_every_waiter_has_run_out():
+    flights, outcome = SingleFlight(), []
+
+    async def work():
+        try:
+            return await deadlines.wait(asyncio.sleep(1, result="result"), stage="llm")
+        except deadlines.DeadlineExceeded:
+            outcome.append(deadlines.remaining())
+            raise
+
+    async def main():
+        def call():
+            return deadlines.wait(flights.do("key", work), stage="llm")
+
+        waiters = [with_deadline(0.1, call()), with_deadline(0.2, call())]
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        return results
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, deadlines.DeadlineExceeded) for result in results)
+    # The shared call gave up too, at the later of the two deadlines
+    assert outcome == [0.0]
+
+
+def test_waiter_without_deadline_lifts_the_shared_deadline():
+    flights, seen = SingleFlight(), []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        seen.append(deadlines.current())
+        return "result"
+
+    async def main():
+        leader = with_deadline(0.01, deadlines.wait(flights.do("key", work), stage="llm"))
+        await asyncio.sleep(0)
+        result = await flights.do("key", work)
+        with pytest.raises(deadlines.DeadlineExceeded):
+            await leader
+        return result
+
+    assert asyncio.run(main()) == "result"
+    assert seen == [None]
+
+
+def test_shared_stream_is_held_to_the_deadline_only_until_it_starts():
+    flights, seen = SingleFlightStream(), []
+
+    async def produce():
+        seen.append(deadlines.current())
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield i
+        seen.append(deadlines.current())
+
+    async def main():
+        async def consume():
+            return [item async for item in flights.subscribe("key", produce)]
+
+        return await with_deadline(0.5, consume())
+
+    assert asyncio.run(main()) == [0, 1, 2]
+    assert seen[0] is not None and seen[0].shared
+    assert seen[1] is None
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    flights, calls = SingleFlight(), []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await flights.do("key", fail)
+
+    asyncio.run(main())
+    assert len(calls) == 2
@@ -0,0 +1,9 @@
+# Rough characters-per-token ratio for English text on current LLM tokenizers.
+# Good enough for budgeting prompts against context windows without pulling in
+# a model-specific tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+from typing import List
+from fastapi.concurrency import run_in_threadpool
+from youtube_transcript_api._errors import TranscriptsDisabled, VideoUnavailable
+
+import admission
+import deadlines
+import metrics
+import search_index
+import shared_cache
+from proxy_pool import pool as proxy_pool
+from cache import LRUCache, MISSING
+from packed_transcript import PackedTranscript
+from singleflight import SingleFlight
+
+# Cache settings - transcripts rarely change once published, so they can live long
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "256"))
+TRANSCRIPT_CACHE_TTL = float(os.getenv("TRANSCRIPT_CACHE_TTL", "86400"))
+TRANSCRIPT_DISK_CACHE_DIR = os.getenv(
+    "TRANSCRIPT_DISK_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "transcripts")
+)
+TRANSCRIPT_DISK_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_DISK_CACHE_MAX_ENTRIES", "10000"))
+TRANSCRIPT_DISK_CACHE_TTL = float(os.getenv("TRANSCRIPT_DISK_CACHE_TTL", str(30 * 86400)))
+
+# Failures that are a property of the video itself are cached briefly so that
+# bad IDs stop costing a proxied round trip on every request
+TRANSCRIPT_NEGATIVE_TTL = float(os.getenv("TRANSCRIPT_NEGATIVE_TTL", "600"))
+NEGATIVE_ERRORS = {
+    "TranscriptsDisabled": TranscriptsDisabled,
+    "VideoUnavailable": VideoUnavailable,
+}
+
+memory_cache = LRUCache(TRANSCRIPT_CACHE_MAX_ENTRIES, TRANSCRIPT_CACHE_TTL)
+# Shared by all worker processes (see shared_cache.CACHE_BACKEND)
+disk_cache = shared_cache.open_cache(
+    "transcripts",
+    TRANSCRIPT_DISK_CACHE_DIR,
+    TRANSCRIPT_DISK_CACHE_MAX_ENTRIES,
+    TRANSCRIPT_DISK_CACHE_TTL
+)
+
+# Request-level counters (the tiers count individual key lookups)
+stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0}
+
+# Concurrent requests for the same (video, languages) share one disk lookup / YouTube fetch
+flights = SingleFlight()
+
+
+def transcript_key(video_id: str, language_code: str) -> str:
+    """Cache key for a transcript in its resolved language"""
+    return f"transcript:{video_id}:{language_code}"
+
+
+def alias_key(video_id: str, languages: List[str]) -> str:
+    """Cache key mapping a requested language list to the resolved language"""
+    return f"alias:{video_id}:{','.join(languages)}"
+
+
+def negative_key(video_id: str) -> str:
+    return f"negative:{video_id}"
+
+
+def _disk_lookup(key: str):
+    """Look a key up on disk, promoting hits into the memory tier"""
+    entry = disk_cache.get_entry(key)
+    if entry is MISSING:
+        return MISSING
+    value, expires_at = entry
+    if key.startswith("transcript:"):
+        value = PackedTranscript.from_dict(value)
+    memory_cache.set(key, value, ttl=min(memory_cache.ttl, expires_at - time.time()))
+    return value
+
+
+def _store(key: str, value, ttl: float = None):
+    memory_cache.set(key, value, ttl=ttl)
+    if isinstance(value, PackedTranscript):
+        value = value.to_dict()
+    disk_cache.set(key, value, ttl=ttl)
+
+
+def _resolve_cached(video_id: str, languages: List[str], lookup):
+    """Return a cached transcript for the request from one tier, or MISSING"""
+    negative = lookup(negative_key(video_id))
+    if negative is not MISSING:
+        stats["negative_hits"] += 1
+        raise NEGATIVE_ERRORS[negative](video_id)
+
+    # Exact language list seen before
+    language_code = lookup(alias_key(video_id, languages))
+    if language_code is not MISSING:
+        transcript = lookup(transcript_key(video_id, language_code))
+        if transcript is not MISSING:
+            return transcript
+
+    # YouTube picks the first requested language that exists, so a cached
+    # transcript in that language is exactly what a fresh fetch would return
+    if languages:
+        return lookup(transcript_key(video_id, languages[0]))
+    return MISSING
+
+
+def _fetch_and_store(video_id: str, languages: List[str]) -> PackedTranscript:
+    """Fetch from YouTube through the proxy pool (blocking) and populate both cache tiers"""
+    try:
+        fetched = proxy_pool.run(lambda api: api.fetch(video_id, languages=languages))
+    except (TranscriptsDisabled, VideoUnavailable) as e:
+        _store(negative_key(video_id), type(e).__name__, ttl=TRANSCRIPT_NEGATIVE_TTL)
+        raise
+
+    transcript = PackedTranscript.from_fetched(fetched)
+
+    _store(transcript_key(video_id, transcript.language_code), transcript)
+    _store(alias_key(video_id, languages), transcript.language_code)
+    return transcript
+
+
+async def fetch_transcript(video_id: str, languages: List[str]) -> PackedTranscript:
+    """
+    Fetch a transcript through the in-memory LRU and shared cache tiers.
+
+    Memory hits are served directly on the event loop; shared-tier lookups
+    and the YouTube fetch run in the threadpool, coalesced across concurrent
+    requests for the same video and languages, in this worker and (with the
+    sqlite backend) in the others. Raises the same youtube_transcript_api
+    errors as YouTubeTranscriptApi.fetch, including cached negative results,
+    and DeadlineExceeded when the request's deadline runs out first (the
+    shared fetch keeps going and still fills the caches).
+    """
+    started = time.perf_counter()
+    transcript = _resolve_cached(video_id, languages, memory_cache.get)
+    if transcript is not MISSING:
+        stats["memory_hits"] += 1
+    else:
+        transcript = await deadlines.wait(
+            flights.do(f"{video_id}:{','.join(languages)}", lambda: _fetch_uncached(video_id, languages)),
+            stage="youtube_fetch"
+        )
+    deadlines.completed("youtube_fetch", time.perf_counter() - started)
+    return transcript
+
+
+async def _fetch_uncached(video_id: str, languages: List[str]) -> PackedTranscript:
+    transcript = await run_in_threadpool(_resolve_cached, video_id, languages, _disk_lookup)
+    if transcript is not MISSING:
+        stats["disk_hits"] += 1
+    else:
+        stats["misses"] += 1
+        # Another worker fetching the same video stores it in the shared tier; wait for that instead
+        transcript = await shared_cache.coalesce(
+            f"transcript:{video_id}:{','.join(languages)}",
+            lambda: run_in_threadpool(_resolve_cached, video_id, languages, _disk_lookup),
+            lambda: _fetch_from_youtube(video_id, languages),
+            kind="transcript_fetch"
+        )
+
+    # Keep the full-text index up to date without delaying the response.
+    # Disk hits are checked too, so transcripts cached before the index existed get added.
+    _index_in_background(transcript)
+    return transcript
+
+
+async def _fetch_from_youtube(video_id: str, languages: List[str]) -> PackedTranscript:
+    async with admission.youtube.slot():
+        with metrics.timer("stage_duration_seconds", stage="youtube_fetch"), \
+                metrics.in_flight("youtube_fetches_in_flight"):
+            return await run_in_threadpool(_fetch_and_store, video_id, languages)
+
+
+_indexing_tasks = set()
+
+
+def _index_in_background(transcript: PackedTranscript):
+    if not search_index.TRANSCRIPT_INDEX_ENABLED:
+        return
+    task = asyncio.ensure_future(run_in_threadpool(search_index.index_transcript, transcript))
+    _indexing_tasks.add(task)
+    task.add_done_callback(_indexing_tasks.discard)
+
+
+def cache_metrics():
+    """Cache counters as metrics samples (see metrics.register_collector)"""
+    for result in ("memory_hits", "disk_hits", "negative_hits", "misses"):
+        yield "transcript_cache_requests_total", {"result": result}, stats[result]
+    yield "coalesced_requests_total", {"kind": "transcript_fetch"}, flights.coalesced
+
+
+metrics.register_collector(cache_metrics)
+
+
+def cache_stats() -> dict:
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["negative_hits"] + stats["misses"]
+    hits = lookups - stats["misses"]
+    return {
+        **stats,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        "coalescing": flights.stats(),
+        "memory": memory_cache.stats(),
+        "disk": disk_cache.stats(),
+        "negative_ttl": TRANSCRIPT_NEGATIVE_TTL
+    }
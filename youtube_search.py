@@ -0,0 +1,322 @@
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from youtube_transcript_api._errors import TranscriptsDisabled, VideoUnavailable
+
+import admission
+import metrics
+import shared_cache
+from cache import LRUCache, MISSING
+from proxy_pool import pool as proxy_pool
+from singleflight import SingleFlight
+
+# YouTube Data API endpoint (overridable so local stand-ins can be used for benchmarks)
+YOUTUBE_API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL", "https://www.googleapis.com/youtube/v3")
+YOUTUBE_API_TIMEOUT = float(os.getenv("YOUTUBE_API_TIMEOUT", "10"))
+# Results requested per search call. A search costs the same quota whatever
+# its size, so one full page is fetched and cached, and requests for fewer
+# results are served from it.
+YOUTUBE_SEARCH_PAGE_SIZE = int(os.getenv("YOUTUBE_SEARCH_PAGE_SIZE", "50"))
+# Search results cache, keyed by the normalized query (shared by all workers)
+YOUTUBE_SEARCH_CACHE_TTL = float(os.getenv("YOUTUBE_SEARCH_CACHE_TTL", "3600"))
+YOUTUBE_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("YOUTUBE_SEARCH_CACHE_MAX_ENTRIES", "1000"))
+# Per-video entries (details, transcript availability) kept in memory
+YOUTUBE_VIDEO_CACHE_MAX_ENTRIES = int(os.getenv("YOUTUBE_VIDEO_CACHE_MAX_ENTRIES", "20000"))
+YOUTUBE_SEARCH_CACHE_DIR = os.getenv(
+    "YOUTUBE_SEARCH_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "youtube_search")
+)
+# Video details (duration, statistics) change slowly; view counts are at most this stale
+YOUTUBE_DETAILS_CACHE_TTL = float(os.getenv("YOUTUBE_DETAILS_CACHE_TTL", "21600"))
+# Transcript availability checks: kept per video for this long, and run this
+# many at once per request (each one is a proxied request to YouTube)
+YOUTUBE_AVAILABILITY_CACHE_TTL = float(os.getenv("YOUTUBE_AVAILABILITY_CACHE_TTL", "86400"))
+YOUTUBE_AVAILABILITY_CONCURRENCY = int(os.getenv("YOUTUBE_AVAILABILITY_CONCURRENCY", "8"))
+
+# Quota cost of each YouTube Data API call (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COST = {"search": 100, "videos": 1}
+# videos.list accepts at most this many IDs per call
+VIDEOS_PER_CALL = 50
+
+DURATION_RE = re.compile(r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+memory_cache = LRUCache(YOUTUBE_SEARCH_CACHE_MAX_ENTRIES, YOUTUBE_SEARCH_CACHE_TTL)
+video_cache = LRUCache(YOUTUBE_VIDEO_CACHE_MAX_ENTRIES, YOUTUBE_DETAILS_CACHE_TTL)
+# Search pages, video details and transcript availability, told apart by key prefix
+shared_tier = shared_cache.open_cache(
+    "youtube_search",
+    YOUTUBE_SEARCH_CACHE_DIR,
+    YOUTUBE_SEARCH_CACHE_MAX_ENTRIES + YOUTUBE_VIDEO_CACHE_MAX_ENTRIES,
+    YOUTUBE_SEARCH_CACHE_TTL
+)
+
+stats = {
+    "hits": 0, "misses": 0,
+    "details_hits": 0, "details_misses": 0,
+    "availability_hits": 0, "availability_misses": 0, "availability_errors": 0,
+    "api_calls": 0, "api_errors": 0
+}
+quota_units: Dict[str, int] = {endpoint: 0 for endpoint in QUOTA_COST}
+
+flights = SingleFlight()
+availability_flights = SingleFlight()
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(base_url=YOUTUBE_API_BASE_URL, timeout=YOUTUBE_API_TIMEOUT)
+    return _client
+
+
+async def close_client():
+    """Close the shared client and release pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def normalize_query(q: str) -> str:
+    """Case and whitespace don't change YouTube's results, so they don't split the cache"""
+    return " ".join(q.lower().split())
+
+
+def parse_duration(value: Optional[str]) -> Optional[int]:
+    """ISO 8601 duration from videos.list ("PT1H2M3S") in seconds"""
+    match = DURATION_RE.match(value or "")
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _shared_lookup(keys: List[str], memory: LRUCache) -> Dict[str, object]:
+    """Look keys up in the shared tier, promoting hits into the memory tier"""
+    found = {}
+    for key in keys:
+        entry = shared_tier.get_entry(key)
+        if entry is not MISSING:
+            value, expires_at = entry
+            memory.set(key, value, ttl=expires_at - time.time())
+            found[key] = value
+    return found
+
+
+async def _cached(keys: List[str], memory: LRUCache) -> Dict[str, object]:
+    """Cached values for keys (missing ones left out), with one threadpool hop for the shared tier"""
+    found = {}
+    for key in keys:
+        value = memory.get(key)
+        if value is not MISSING:
+            found[key] = value
+    remaining = [key for key in keys if key not in found]
+    if remaining:
+        found.update(await run_in_threadpool(_shared_lookup, remaining, memory))
+    return found
+
+
+def _store_all(entries: Dict[str, object], ttl: float):
+    for key, value in entries.items():
+        shared_tier.set(key, value, ttl)
+
+
+async def _store(entries: Dict[str, object], memory: LRUCache, ttl: float):
+    for key, value in entries.items():
+        memory.set(key, value, ttl=ttl)
+    await run_in_threadpool(_store_all, entries, ttl)
+
+
+async def _call_api(endpoint: str, params: dict, api_key: str) -> dict:
+    """GET a Data API endpoint, counting its quota cost (charged even when the call fails)"""
+    stats["api_calls"] += 1
+    quota_units[endpoint] += QUOTA_COST[endpoint]
+    metrics.inc("youtube_api_quota_units_total", QUOTA_COST[endpoint], endpoint=endpoint)
+    try:
+        response = await get_client().get(f"/{endpoint}", params={**params, "key": api_key})
+    except httpx.TimeoutException:
+        stats["api_errors"] += 1
+        raise HTTPException(status_code=504, detail=f"YouTube API request timed out ({endpoint})")
+    except httpx.HTTPError as e:
+        stats["api_errors"] += 1
+        raise HTTPException(status_code=502, detail=f"Could not reach the YouTube API ({endpoint}): {type(e).__name__}: {str(e)}")
+    if response.status_code != 200:
+        stats["api_errors"] += 1
+        raise HTTPException(status_code=response.status_code, detail=f"YouTube API error: {response.text}")
+    return response.json()
+
+
+async def _fetch_page(query: str, api_key: str) -> dict:
+    data = await _call_api("search", {
+        "part": "snippet",
+        "q": query,
+        "type": "video",
+        "maxResults": YOUTUBE_SEARCH_PAGE_SIZE
+    }, api_key)
+
+    # Transform results to simplified format
+    results = []
+    for item in data.get("items", []):
+        snippet = item.get("snippet", {})
+        video_id = item.get("id", {}).get("videoId")
+
+        if video_id:  # Only include valid video results
+            results.append({
+                "videoId": video_id,
+                "title": snippet.get("title", ""),
+                "channelTitle": snippet.get("channelTitle", ""),
+                "thumbnailUrl": snippet.get("thumbnails", {}).get("medium", {}).get("url", ""),
+                "publishedAt": snippet.get("publishedAt", ""),
+                "description": snippet.get("description", "")
+            })
+
+    page = {"results": results, "created_at": time.time()}
+    await _store({f"search:{query}": page}, memory_cache, YOUTUBE_SEARCH_CACHE_TTL)
+    return page
+
+
+async def search(q: str, max_results: int, api_key: str) -> dict:
+    """
+    Search results for q, from the cache when the same query was searched
+    within YOUTUBE_SEARCH_CACHE_TTL. Concurrent identical searches share
+    one API call.
+    """
+    query = normalize_query(q)
+    page = (await _cached([f"search:{query}"], memory_cache)).get(f"search:{query}", MISSING)
+    if page is not MISSING:
+        stats["hits"] += 1
+        cached = True
+    else:
+        stats["misses"] += 1
+        page = await flights.do(query, lambda: _fetch_page(query, api_key))
+        cached = False
+    return {
+        "results": [dict(result) for result in page["results"][:max_results]],
+        "cached": cached,
+        "cache_age_seconds": round(time.time() - page["created_at"], 1) if cached else 0
+    }
+
+
+def _details(item: dict) -> dict:
+    content = item.get("contentDetails", {})
+    statistics = item.get("statistics", {})
+    status = item.get("status", {})
+    return {
+        "duration": content.get("duration"),
+        "durationSeconds": parse_duration(content.get("duration")),
+        "definition": content.get("definition"),
+        # Only uploaded caption tracks - auto-generated ones aren't reported here
+        "hasCaptions": content.get("caption") == "true",
+        "viewCount": int(statistics["viewCount"]) if "viewCount" in statistics else None,
+        "likeCount": int(statistics["likeCount"]) if "likeCount" in statistics else None,
+        "commentCount": int(statistics["commentCount"]) if "commentCount" in statistics else None,
+        "privacyStatus": status.get("privacyStatus"),
+        "embeddable": status.get("embeddable")
+    }
+
+
+async def video_details(video_ids: List[str], api_key: str) -> Dict[str, dict]:
+    """
+    Duration, statistics and caption flag per video. Cached IDs are served
+    from the cache; the rest are fetched with one videos.list call per 50
+    IDs (1 quota unit each).
+    """
+    cached = await _cached([f"video:{video_id}" for video_id in video_ids], video_cache)
+    details: Dict[str, dict] = {key[len("video:"):]: value for key, value in cached.items()}
+    missing = [video_id for video_id in video_ids if video_id not in details]
+    stats["details_hits"] += len(details)
+    stats["details_misses"] += len(missing)
+
+    for i in range(0, len(missing), VIDEOS_PER_CALL):
+        batch = missing[i:i + VIDEOS_PER_CALL]
+        data = await _call_api("videos", {
+            "part": "contentDetails,statistics,status",
+            "id": ",".join(batch),
+            "maxResults": len(batch)
+        }, api_key)
+        fetched = {item["id"]: _details(item) for item in data.get("items", [])}
+        details.update(fetched)
+        await _store(
+            {f"video:{video_id}": value for video_id, value in fetched.items()},
+            video_cache,
+            YOUTUBE_DETAILS_CACHE_TTL
+        )
+    return details
+
+
+def _list_transcripts(video_id: str) -> dict:
+    """Ask YouTube which transcripts a video has (blocking - call from the threadpool)"""
+    try:
+        transcript_list = proxy_pool.run(lambda api: api.list(video_id))
+    except (TranscriptsDisabled, VideoUnavailable):
+        return {"available": False, "languages": []}
+    languages = [transcript.language_code for transcript in transcript_list]
+    return {"available": bool(languages), "languages": languages}
+
+
+async def _check_availability(video_id: str, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore, admission.youtube.slot():
+        result = await run_in_threadpool(_list_transcripts, video_id)
+    await _store({f"availability:{video_id}": result}, video_cache, YOUTUBE_AVAILABILITY_CACHE_TTL)
+    return result
+
+
+async def transcript_availability(video_ids: List[str]) -> Dict[str, Optional[dict]]:
+    """
+    Whether each video has transcripts, and in which languages. Videos not
+    checked within YOUTUBE_AVAILABILITY_CACHE_TTL are checked concurrently,
+    YOUTUBE_AVAILABILITY_CONCURRENCY at a time. A video whose check fails
+    (e.g. every proxy blocked) maps to None.
+    """
+    semaphore = asyncio.Semaphore(max(YOUTUBE_AVAILABILITY_CONCURRENCY, 1))
+    cached = await _cached([f"availability:{video_id}" for video_id in video_ids], video_cache)
+
+    async def check(video_id: str) -> Optional[dict]:
+        value = cached.get(f"availability:{video_id}", MISSING)
+        if value is not MISSING:
+            stats["availability_hits"] += 1
+            return value
+        stats["availability_misses"] += 1
+        try:
+            return await availability_flights.do(video_id, lambda: _check_availability(video_id, semaphore))
+        except Exception as e:
+            stats["availability_errors"] += 1
+            print(f"Transcript availability check failed for {video_id}: {type(e).__name__}: {str(e)}")
+            return None
+
+    results = await asyncio.gather(*(check(video_id) for video_id in video_ids))
+    return dict(zip(video_ids, results))
+
+
+def cache_metrics():
+    """Cache counters as metrics samples (see metrics.register_collector)"""
+    yield "youtube_search_cache_requests_total", {"result": "hits"}, stats["hits"]
+    yield "youtube_search_cache_requests_total", {"result": "misses"}, stats["misses"]
+    yield "coalesced_requests_total", {"kind": "youtube_search"}, flights.coalesced
+
+
+metrics.register_collector(cache_metrics)
+
+
+def search_stats() -> dict:
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        "quota_units": {**quota_units, "total": sum(quota_units.values())},
+        # What the cache hits would have cost as search.list calls
+        "quota_units_saved": stats["hits"] * QUOTA_COST["search"],
+        "coalescing": flights.stats(),
+        "memory": memory_cache.stats(),
+        "video_memory": video_cache.stats(),
+        "shared": shared_tier.stats()
+    }